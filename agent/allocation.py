@@ -0,0 +1,95 @@
+"""
+小工序的每日人力分配 (有界背包 DP)
+
+大工序排完後剩下的人力要分給小工序 (<4人)。原本依優先順序逐一分配，排在前面的工序一天做不完就拿走全部閒置人力，
+後面的工序整天等待；人數又以 基本人力 × 倍數 進位，做完剩下的量用不到那麼多人，多派的人等於閒置。
+allocate_people() 把當天可開工的小工序一起考慮：
+- 每個工序可派 0 人，或 基本人力 ~ 今天做完所需人數 (people_needed()) 之間的任意人數，超過不計產出
+- 目標是 Σ 權重 × 派遣人數 最大 (總人數不超過閒置人力)；急單權重較高，排序越前面的權重略高
+  (優先順序的加分合計不到 1 人，所以不會為了順序多留閒置人力)
+- 前面的工序只拿到做完所需的人數，省下來的人力分給後面的工序；基本人力湊不滿時 DP 會換一組工序把人用完
+不另外鼓勵「平均分散」：實測會讓截止日期早的工序拖延、逾期變多 (優先順序仍以 EDD 為主)。
+以 單調佇列 求每個工序人數區間內的最大值，DP 為 O(工序數 × 人數)，每個模擬日都可以跑。
+"""
+import math
+from collections import deque
+from typing import List, NamedTuple, Sequence
+
+RUSH_WEIGHT = 2.0       # 急單每派 1 人的價值 (一般工序為 1)
+PRIORITY_WEIGHT = 0.5   # 優先順序加分的合計上限 (小於 1 人)
+MAX_ALLOCATION_JOBS = 64  # 每天最多把幾個小工序放進 DP (依優先順序)
+
+
+class AllocationItem(NamedTuple):
+    """DP 的一個工序：base = 基本人力，need = 今天做完所需人數 (≥ base)，weight = 每派 1 人的價值。"""
+    base: int
+    need: int
+    weight: float
+
+
+def produced_qty(work_hours: float, uph: float, people: int, base_headcount: int) -> int:
+    """派 people 人 (基本人力 base_headcount) 工作 work_hours 小時的產量 (與排程器相同的算法)。"""
+    return math.floor(work_hours * (uph * (people / base_headcount)))
+
+
+def people_needed(qty_remaining: int, work_hours: float, uph: float, base_headcount: int, limit: int) -> int:
+    """今天做完 qty_remaining 需要的人數 (至少 base_headcount，最多 limit)。"""
+    per_person = work_hours * uph / base_headcount
+    if per_person <= 0:
+        return base_headcount
+    need = max(base_headcount, math.ceil(qty_remaining / per_person))
+    # 浮點誤差：確認產量真的夠
+    while need < limit and produced_qty(work_hours, uph, need, base_headcount) < qty_remaining:
+        need += 1
+    return min(need, max(limit, base_headcount))
+
+
+def item_weight(is_rush: bool, rank: int, count: int, people: int) -> float:
+    """每派 1 人的價值：急單 RUSH_WEIGHT，再依優先順序 (rank = 0 最優先) 加上合計不超過 PRIORITY_WEIGHT 的分數。"""
+    base = RUSH_WEIGHT if is_rush else 1.0
+    return base + PRIORITY_WEIGHT * (count - rank) / (count * max(1, people))
+
+
+def allocate_people(items: Sequence[AllocationItem], people: int) -> List[int]:
+    """
+    在 people 人之內分配人力給 items，回傳各工序派遣人數 (0 = 今天不開工)。
+    所有工序都能派到 need 時直接分配，不跑 DP。
+    """
+    if people <= 0 or not items:
+        return [0] * len(items)
+    if sum(item.need for item in items) <= people:
+        return [item.need for item in items]
+
+    # best[c] = 已考慮的工序在 c 人以內的最大價值；choices[i][c] = 第 i 個工序在容量 c 時派的人數
+    best = [0.0] * (people + 1)
+    choices: List[List[int]] = []
+    for item in items:
+        weight, low, high = item.weight, item.base, min(item.need, people)
+        new_best = list(best)
+        choice = [0] * (people + 1)
+        if low <= high:
+            # 派 p 人 (low ≤ p ≤ high) 的價值 = best[c - p] + weight × p
+            # 令 k = c - p：求 k ∈ [c - high, c - low] 中 best[k] - weight × k 的最大值 (單調佇列)
+            window = deque()
+            for c in range(low, people + 1):
+                k = c - low
+                score = best[k] - weight * k
+                while window and best[window[-1]] - weight * window[-1] <= score:
+                    window.pop()
+                window.append(k)
+                if window[0] < c - high:
+                    window.popleft()
+                top = window[0]
+                value = best[top] - weight * top + weight * c
+                if value > new_best[c]:
+                    new_best[c] = value
+                    choice[c] = c - top
+        best = new_best
+        choices.append(choice)
+
+    assigned = [0] * len(items)
+    capacity = max(range(people + 1), key=best.__getitem__)
+    for i in range(len(items) - 1, -1, -1):
+        assigned[i] = choices[i][capacity]
+        capacity -= assigned[i]
+    return assigned
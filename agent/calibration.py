@@ -0,0 +1,224 @@
+"""
+UPH 校正：以 percent 工作表的 計劃 / 實際 產量回饋，估計各工序的有效 UPH
+
+每次進度回報 (選項 3 / POST /actuals) 寫入 percent 工作表的資料列，同時交給 UphCalibration.observe()：
+- 同一份排程、同一個訂單工序的回報是累積量 (Day 1 ~ Day N)，只取與上次回報的差額當作新的觀測值
+- 各工序的 實際 / 計劃 比例以指數加權移動平均 (EWMA) 更新，初始值 1.0 (相信產能資料)
+- 另外累計每個觀測值 log(實際 / 標準 UPH) 的樣本數、平均、平方差和 (Welford)，風險模擬以它估計 UPH 倍率的分布
+  (percent 工作表每次回報都會清空，只能看到最近一次回報)
+每次只處理新進的資料列 (O(新資料列))，不重新掃描歷史。結果存在 uph_calibration.json。
+
+config.ini [ZZ_Srttings] USE_CALIBRATED_UPH = true 時，排程器改用 標準 UPH × 校正倍率 排程
+(樣本數少於 CALIBRATION_MIN_SAMPLES 的工序仍用標準 UPH)。
+校正倍率一律是 實際 / 標準 UPH：以校正過的 UPH 排出的計劃量已乘上當時的倍率，排程資料列的 UPH_Factor 欄位記錄這個倍率，
+observe() 先把 實際 / 計劃 乘回去再更新 (否則倍率會收斂到 √(實際比例) 而不是實際比例)。
+"""
+import hashlib
+import json
+import math
+import os
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from agent.datafile import HotReloadStore
+
+DEFAULT_CALIBRATION_PATH = 'uph_calibration.json'
+DEFAULT_ALPHA = 0.3
+DEFAULT_MIN_SAMPLES = 2
+MIN_FACTOR, MAX_FACTOR = 0.2, 1.5
+# 超過幾天沒有再回報的累積量紀錄會被清掉
+CUMULATIVE_RETENTION_DAYS = 60
+
+
+def _to_number(value: Any) -> float:
+    try:
+        return float(str(value).replace(',', '').replace('%', '').strip())
+    except ValueError:
+        return 0.0
+
+
+def _enabled(value: Any) -> bool:
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+class UphCalibration:
+    """
+    各工序的 UPH 校正倍率。
+    processes: 工序 -> {"factor": EWMA(實際/計劃), "samples": 觀測次數, "updated": 最後更新日,
+                        "log_mean": log 比例的平均, "log_m2": log 比例的平方差和}
+    cumulative: "排程|order_id|產品|工序" -> [計劃累積量, 實際累積量, 最後回報日] (計算差額用)
+    """
+
+    def __init__(self, data: Optional[Dict[str, Any]] = None, alpha: float = DEFAULT_ALPHA):
+        data = data or {}
+        self.alpha = float(data.get('alpha', alpha))
+        self.processes: Dict[str, Dict[str, Any]] = dict(data.get('processes', {}))
+        self.cumulative: Dict[str, List[Any]] = dict(data.get('cumulative', {}))
+        self.content_hash = self._hash()
+
+    def _hash(self) -> str:
+        payload = json.dumps(self.processes, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"alpha": self.alpha, "processes": self.processes, "cumulative": self.cumulative}
+
+    def factor(self, process: str, min_samples: int = DEFAULT_MIN_SAMPLES) -> float:
+        entry = self.processes.get(process)
+        if not entry or entry['samples'] < min_samples:
+            return 1.0
+        return entry['factor']
+
+    def observe(self, rows: Iterable[Mapping[str, Any]], schedule_id: str = '', today: Optional[date] = None,
+                factors: Optional[Mapping[tuple, float]] = None) -> int:
+        """
+        加入新的 percent 資料列 (欄位 order_id, Product (工序), Raw_Product_Name, Planned_Output, Actual_Output)。
+        schedule_id: 排程識別 (上次排程日期)，換了排程累積量重新起算。
+        factors: 排程時使用的倍率 (planning_factors())，沒有的工序視為以標準 UPH 排程。回傳更新了幾個觀測值。
+        """
+        factors = factors or {}
+        today_str = (today or date.today()).isoformat()
+        updated = 0
+        for row in rows:
+            process = str(row.get('Product', '')).strip()
+            planned = _to_number(row.get('Planned_Output', 0))
+            actual = _to_number(row.get('Actual_Output', 0))
+            if not process or planned <= 0:
+                continue
+            key = f"{schedule_id}|{row.get('order_id', '')}|{row.get('Raw_Product_Name', '')}|{process}"
+            last_planned, last_actual, _ = self.cumulative.get(key, (0.0, 0.0, ''))
+            delta_planned, delta_actual = planned - last_planned, actual - last_actual
+            self.cumulative[key] = [planned, actual, today_str]
+            if delta_planned <= 0:
+                # 同一天重複回報 (計劃量沒有增加)：只更新累積量
+                continue
+
+            # 計劃量以 標準 UPH × 排程時的倍率 算出，乘回倍率得到 實際 / 標準 UPH
+            planned_factor = factors.get((str(row.get('order_id', '')), str(row.get('Raw_Product_Name', '')), process), 1.0)
+            ratio = min(MAX_FACTOR, max(MIN_FACTOR, delta_actual / delta_planned * planned_factor))
+            entry = self.processes.get(process) or {"factor": 1.0, "samples": 0}
+            # 舊版校正檔沒有 log 統計：從這次觀測開始累計 (log_count 可能小於 samples)
+            count = entry.get('log_count', 0) + 1
+            log_ratio = math.log(ratio)
+            delta = log_ratio - entry.get('log_mean', 0.0)
+            log_mean = entry.get('log_mean', 0.0) + delta / count
+            self.processes[process] = {
+                "factor": round((1 - self.alpha) * entry['factor'] + self.alpha * ratio, 4),
+                "samples": entry['samples'] + 1,
+                "updated": today_str,
+                "log_count": count,
+                "log_mean": log_mean,
+                "log_m2": entry.get('log_m2', 0.0) + delta * (log_ratio - log_mean),
+            }
+            updated += 1
+
+        cutoff = ((today or date.today()) - timedelta(days=CUMULATIVE_RETENTION_DAYS)).isoformat()
+        self.cumulative = {k: v for k, v in self.cumulative.items() if v[2] >= cutoff}
+        self.content_hash = self._hash()
+        return updated
+
+    def log_ratio_stats(self) -> Dict[str, Tuple[int, float, float]]:
+        """各工序 log(實際 / 標準 UPH) 的 (樣本數, 平均, 平方差和)，給風險模擬的 UphModel.from_log_stats()。"""
+        return {process: (entry['log_count'], entry['log_mean'], entry['log_m2'])
+                for process, entry in self.processes.items() if entry.get('log_count')}
+
+    def apply(self, jobs: List[Mapping[str, Any]], min_samples: int = DEFAULT_MIN_SAMPLES) -> List[Mapping[str, Any]]:
+        """以校正後的 UPH 取代工單的 uph (沒有校正資料的工單原樣沿用，不複製)。"""
+        calibrated = []
+        for job in jobs:
+            factor = self.factor(job['display_name'], min_samples)
+            calibrated.append(job if factor == 1.0 else {**job, "uph": job['uph'] * factor})
+        return calibrated
+
+    def rows(self) -> List[Dict[str, Any]]:
+        """倍率由低到高 (最需要注意的工序在前) 的報表。"""
+        return [{"工序": process, "校正倍率": entry['factor'], "樣本數": entry['samples'], "更新日期": entry.get('updated', '')}
+                for process, entry in sorted(self.processes.items(), key=lambda item: (item[1]['factor'], item[0]))]
+
+
+def _setting(settings: Mapping[str, str], name: str, default: Any) -> Any:
+    # configparser 會把 key 轉成小寫
+    return settings.get(name, settings.get(name.lower(), default))
+
+
+def calibration_settings(settings: Mapping[str, str]) -> Dict[str, Any]:
+    """[ZZ_Srttings] 中的 UPH 校正設定。"""
+    try:
+        min_samples = int(_setting(settings, 'CALIBRATION_MIN_SAMPLES', DEFAULT_MIN_SAMPLES))
+    except ValueError:
+        min_samples = DEFAULT_MIN_SAMPLES
+    return {"enabled": _enabled(_setting(settings, 'USE_CALIBRATED_UPH', 'false')), "min_samples": min_samples}
+
+
+class CalibrationStore(HotReloadStore):
+    """uph_calibration.json 的熱載入與寫回 (服務模式與互動選單共用同一份檔案)。"""
+
+    label = 'UPH 校正檔'
+    warn_missing = False
+
+    def __init__(self, path: str = DEFAULT_CALIBRATION_PATH):
+        super().__init__(path)
+
+    def load(self, path: str) -> UphCalibration:
+        with open(path, 'r', encoding='utf-8') as f:
+            return UphCalibration(json.load(f))
+
+    def empty(self) -> UphCalibration:
+        return UphCalibration()
+
+    def describe(self, calibration: UphCalibration) -> str:
+        return f" ({len(calibration.processes)} 個工序)"
+
+    def save(self, calibration: UphCalibration):
+        """先寫暫存檔再替換，讀取端不會讀到寫一半的檔案。"""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(calibration.to_dict(), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+        with self._lock:
+            self._value = calibration
+            self._stamp = self._file_stamp()
+
+
+def schedule_id_of(schedule: Iterable[Mapping[str, Any]], fallback: str = '') -> str:
+    """排程識別：排程 Day 1 的日期 (由 Day / Date 欄位推算)，舊排程沒有 Date 欄位時用 fallback。"""
+    for row in schedule:
+        day = str(row.get('Day', '')).replace('Day ', '').strip()
+        if row.get('Date') and day.isdigit():
+            try:
+                return (date.fromisoformat(str(row['Date'])) - timedelta(days=int(day) - 1)).isoformat()
+            except ValueError:
+                break
+    return str(fallback or '')
+
+
+def planning_factors(schedule: Iterable[Mapping[str, Any]]) -> Dict[tuple, float]:
+    """排程資料列的 UPH_Factor 欄位 -> {(order_id, 產品, 工序): 排程時使用的校正倍率} (只列出不是 1.0 的)。"""
+    factors = {}
+    for row in schedule:
+        factor = _to_number(row.get('UPH_Factor', 1.0)) or 1.0
+        if factor != 1.0:
+            factors[(str(row.get('order_id', '')), str(row.get('Raw_Product_Name', '')), str(row.get('plan_to', '')))] = factor
+    return factors
+
+
+def record_actuals(rows: Iterable[Mapping[str, Any]], schedule_id: str = '',
+                   schedule: Iterable[Mapping[str, Any]] = ()) -> int:
+    """
+    進度回報後呼叫：把寫入 percent 工作表的資料列加入 UPH 校正並存檔，回傳更新的觀測值數量。
+    schedule: 計劃量所根據的排程 (讀取排程時使用的校正倍率)。
+    """
+    calibration = CALIBRATION_STORE.current()
+    calibration = UphCalibration(calibration.to_dict())  # 在副本上更新，讀取端手上的版本不變
+    updated = calibration.observe(rows, schedule_id, factors=planning_factors(schedule))
+    if updated:
+        try:
+            CALIBRATION_STORE.save(calibration)
+            print(f"📈 UPH 校正已更新 {updated} 筆觀測值 (共 {len(calibration.processes)} 個工序)。")
+        except OSError as e:
+            print(f"❌ UPH 校正檔寫入失敗: {e}")
+    return updated
+
+
+# 行程內共用的 UPH 校正資料
+CALIBRATION_STORE = CalibrationStore()
@@ -0,0 +1,209 @@
+"""
+產能行事曆：各產線的班別工時、每日人力調整、假日
+
+資料檔 agent/capacity_calendar.json (修改後不需重啟，下次排程自動重新載入)，格式：
+{
+  "version": "2026-01",
+  "headcount": 40,                 # 每日總人力 (省略時用 config.ini [ZZ_Srttings] MAX_HEADCOUNT)
+  "max_lines": 4,                  # 每日最多同時開幾條大工序產線 (省略時為 4)
+  "hours": 8,                      # 未個別設定產線的每日工時 (省略時用 WORK_HOURS_PER_DAY)
+  "lines": {                       # 各產線的班別：數字 (工時) 或班別列表
+    "Line 1": [{"start": "08:00", "end": "17:00", "break": 1}, {"start": "18:00", "end": "20:00"}],
+    "Line 2": 8
+  },
+  "weekly_off": ["sun"],           # 每週固定休息日
+  "holidays": ["2026-01-01", {"from": "2026-02-14", "to": "2026-02-22", "note": "春節"}],
+  "overrides": [                   # 期間調整 (依序套用，後面的優先)；workday: true 可設定補班日
+    {"from": "2026-02-23", "to": "2026-03-01", "headcount": 30, "note": "春節後人力不足"},
+    {"from": "2026-03-07", "to": "2026-03-07", "workday": true, "note": "補班"},
+    {"from": "2026-04-01", "to": "2026-04-30", "lines": {"Line 2": 0}, "note": "Line 2 設備保養"}
+  ]
+}
+所有日期區間在載入時整理成不重疊的區間索引 (依起始日排序)，查詢某一天只需二分搜尋 O(log n)。
+"""
+import bisect
+import hashlib
+import json
+import os
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional, Tuple
+
+from agent.datafile import HotReloadStore
+from agent.snapshot import FrozenDict
+
+DEFAULT_CALENDAR_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'capacity_calendar.json')
+
+DEFAULT_MAX_LINES = 4
+
+WEEKDAYS = {'mon': 0, 'tue': 1, 'wed': 2, 'thu': 3, 'fri': 4, 'sat': 5, 'sun': 6}
+
+
+class CapacityDay(NamedTuple):
+    """某一天的產能設定；None 表示沿用 config.ini 的排程參數。"""
+    workday: bool
+    headcount: Optional[int]
+    max_lines: Optional[int]
+    hours: Optional[float]
+    line_hours: Mapping[str, float]
+    note: str = ''
+
+    def hours_for(self, line: str, default_hours: float) -> float:
+        """產線當天的工時 (沒有個別設定時用 hours，再沒有就用 default_hours)。"""
+        hours = self.line_hours.get(line)
+        if hours is not None:
+            return hours
+        return self.hours if self.hours is not None else default_hours
+
+
+def _parse_date(value: str) -> date:
+    return datetime.strptime(str(value).strip(), '%Y-%m-%d').date()
+
+
+def _clock(value: str) -> float:
+    hour, minute = str(value).split(':')
+    return int(hour) + int(minute) / 60
+
+
+def shift_hours(spec: Any) -> float:
+    """班別工時：數字直接當工時；{"start", "end", "break"} 或其列表則加總 (跨午夜的班別也可以)。"""
+    if isinstance(spec, (int, float)):
+        return float(spec)
+    if isinstance(spec, dict):
+        spec = [spec]
+    total = 0.0
+    for shift in spec:
+        length = _clock(shift['end']) - _clock(shift['start'])
+        if length <= 0:
+            length += 24
+        total += max(0.0, length - float(shift.get('break', 0)))
+    return round(total, 2)
+
+
+def _line_hours(lines: Dict[str, Any]) -> Dict[str, float]:
+    return {line: shift_hours(spec) for line, spec in (lines or {}).items()}
+
+
+def _date_range(entry: Any) -> Tuple[int, int, str]:
+    """日期或 {"from", "to", "note"} -> (起始 ordinal, 結束 ordinal (不含), 說明)。"""
+    if isinstance(entry, dict):
+        start = _parse_date(entry['from'])
+        end = _parse_date(entry.get('to', entry['from']))
+        note = entry.get('note', '')
+    else:
+        start = end = _parse_date(entry)
+        note = ''
+    if end < start:
+        raise ValueError(f"日期區間結束早於開始: {entry}")
+    return start.toordinal(), end.toordinal() + 1, note
+
+
+class CapacityCalendar:
+    """
+    產能行事曆 (唯讀)。假日與期間調整在載入時合併成不重疊的區間：
+    _starts[i] ~ _starts[i + 1] 之間的每一天設定相同，day() 以二分搜尋找到所在區間。
+    """
+
+    def __init__(self, data: Dict[str, Any], source: str = ''):
+        self.version = str(data.get('version', ''))
+        self.source = source
+        payload = json.dumps(data, sort_keys=True, ensure_ascii=False)
+        self.content_hash = hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+        # workday = None 表示依每週休息日決定
+        self.base = {
+            "workday": None,
+            "headcount": data.get('headcount'),
+            "max_lines": data.get('max_lines'),
+            "hours": data.get('hours'),
+            "line_hours": _line_hours(data.get('lines')),
+            "note": '',
+        }
+        self.weekly_off = frozenset(WEEKDAYS[str(d).strip().lower()[:3]] for d in data.get('weekly_off', []))
+
+        rules: List[Tuple[int, int, Dict[str, Any]]] = []
+        for entry in data.get('holidays', []):
+            start, end, note = _date_range(entry)
+            rules.append((start, end, {"workday": False, "note": note or '假日'}))
+        for entry in data.get('overrides', []):
+            start, end, note = _date_range(entry)
+            patch = {key: entry[key] for key in ('workday', 'headcount', 'max_lines', 'hours') if key in entry}
+            if 'lines' in entry:
+                patch['lines'] = _line_hours(entry['lines'])
+            if note:
+                patch['note'] = note
+            rules.append((start, end, patch))
+
+        # 區間索引：所有邊界排序後，每一段套用涵蓋它的規則 (依檔案順序，後面的優先)
+        self._starts: List[int] = sorted({start for start, _, _ in rules} | {end for _, end, _ in rules})
+        self._segments: List[Tuple[CapacityDay, CapacityDay]] = []
+        for start in self._starts:
+            resolved = dict(self.base)
+            for rule_start, rule_end, patch in rules:
+                if rule_start <= start < rule_end:
+                    for key, value in patch.items():
+                        if key == 'lines':
+                            resolved['line_hours'] = {**resolved['line_hours'], **value}
+                        else:
+                            resolved[key] = value
+            self._segments.append(self._variants(resolved))
+        self._base_segment = self._variants(self.base)
+        self.is_flat = not rules and not self.weekly_off and not any(
+            self.base[key] is not None for key in ('headcount', 'max_lines', 'hours')) and not self.base['line_hours']
+
+    @staticmethod
+    def _variants(resolved: Dict[str, Any]) -> Tuple[CapacityDay, CapacityDay]:
+        """(非每週休息日時的設定, 每週休息日時的設定)；有明確指定 workday 的區間兩者相同。"""
+        def make(workday: bool) -> CapacityDay:
+            return CapacityDay(
+                workday=workday,
+                headcount=resolved['headcount'],
+                max_lines=resolved['max_lines'],
+                hours=resolved['hours'],
+                line_hours=FrozenDict(resolved['line_hours']),
+                note=resolved['note'] or ('' if workday else '休息日'),
+            )
+        if resolved['workday'] is None:
+            return make(True), make(False)
+        day = make(bool(resolved['workday']))
+        return day, day
+
+    def day(self, when: date) -> CapacityDay:
+        """查詢某一天的產能設定 (O(log n))。"""
+        index = bisect.bisect_right(self._starts, when.toordinal()) - 1
+        on, off = self._segments[index] if index >= 0 else self._base_segment
+        return off if when.weekday() in self.weekly_off else on
+
+    def days(self, start: date, count: int) -> List[CapacityDay]:
+        return [self.day(start + timedelta(days=i)) for i in range(count)]
+
+
+def load_calendar(path: str) -> CapacityCalendar:
+    with open(path, 'r', encoding='utf-8') as f:
+        return CapacityCalendar(json.load(f), source=path)
+
+
+# 沒有行事曆檔時：每天都是工作天，人力 / 工時都沿用 config.ini (與原本的排程相同)
+FLAT_CALENDAR = CapacityCalendar({})
+
+
+class CapacityCalendarStore(HotReloadStore):
+    """產能行事曆檔的熱載入；檔案不存在時使用 FLAT_CALENDAR (不顯示警告)。"""
+
+    label = '產能行事曆'
+    warn_missing = False
+
+    def __init__(self, path: str = DEFAULT_CALENDAR_PATH):
+        super().__init__(path)
+
+    def load(self, path: str) -> CapacityCalendar:
+        return load_calendar(path)
+
+    def empty(self) -> CapacityCalendar:
+        return FLAT_CALENDAR
+
+    def describe(self, calendar: CapacityCalendar) -> str:
+        return f" (版本 {calendar.version or '-'})"
+
+
+# 行程內共用的產能行事曆
+CALENDAR_STORE = CapacityCalendarStore()
@@ -0,0 +1,105 @@
+import sqlite3
+import uuid
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+
+try:
+    from langgraph.checkpoint.sqlite import SqliteSaver
+except ImportError:
+    SqliteSaver = None
+from langgraph.checkpoint.memory import InMemorySaver
+from agent.tracing import span
+
+# 本機 checkpoint 資料庫 (每個節點完成後都會寫入一次 state)
+DEFAULT_CHECKPOINT_PATH = 'checkpoints.sqlite'
+
+
+def open_checkpointer(path: str = DEFAULT_CHECKPOINT_PATH):
+    """開啟本機 SQLite checkpointer；沒有安裝 langgraph-checkpoint-sqlite 時退回記憶體版 (只在本次執行有效)。"""
+    if SqliteSaver is None:
+        print("⚠️ 警告: 找不到 langgraph-checkpoint-sqlite，checkpoint 只保存在記憶體中。")
+        return InMemorySaver()
+    # 服務模式由排程 worker 執行緒使用，允許跨執行緒存取
+    conn = sqlite3.connect(path, check_same_thread=False)
+    return SqliteSaver(conn)
+
+
+def new_thread_id(reason: str = 'run') -> str:
+    """每次重排使用新的 thread id，例如 'orders-20250101-093000-1a2b3c'。"""
+    return f"{reason}-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+
+def thread_config(thread_id: str) -> Dict[str, Any]:
+    return {"configurable": {"thread_id": thread_id}}
+
+
+def run_graph(app, state: Dict[str, Any], thread_id: str) -> Dict[str, Any]:
+    """以指定的 thread id 執行流程圖，每個節點完成後都會留下 checkpoint。"""
+    with span('graph.run', thread_id=thread_id):
+        return app.invoke(state, thread_config(thread_id))
+
+
+def pending_nodes(app, thread_id: str) -> Tuple[str, ...]:
+    """尚未執行的節點 (空 tuple 表示流程已完成)。"""
+    return tuple(app.get_state(thread_config(thread_id)).next)
+
+
+def resume_run(app, thread_id: str) -> Dict[str, Any]:
+    """
+    從最後一個成功的節點繼續執行 (前面的節點，包含 LLM 匹配，不會重跑)。
+    流程已完成時直接回傳最後的 state (例如排程成功但寫回 Google Sheets 失敗)。
+    """
+    config = thread_config(thread_id)
+    snapshot = app.get_state(config)
+    if not snapshot.values:
+        raise ValueError(f"找不到執行紀錄: {thread_id}")
+    if snapshot.next:
+        print(f"🔁 從節點 {', '.join(snapshot.next)} 繼續執行 ({thread_id})...")
+        with span('graph.run', thread_id=thread_id, resumed=True):
+            return app.invoke(None, config)
+    return snapshot.values
+
+
+def inspect_run(app, thread_id: str) -> Dict[str, Any]:
+    """
+    檢視某次執行的中間狀態。
+    Returns:
+        {"thread_id", "next": 待執行節點, "steps": [(step, 完成的節點, 下一個節點)], "values": 最後的 state}
+    """
+    config = thread_config(thread_id)
+    snapshot = app.get_state(config)
+    steps = []
+    previous_next: Tuple[str, ...] = ()
+    # get_state_history 由新到舊，反轉後依序：每個 checkpoint 代表上一個 checkpoint 的 next 節點已完成
+    for item in reversed(list(app.get_state_history(config))):
+        step = item.metadata.get('step', -1) if item.metadata else -1
+        steps.append((step, ', '.join(previous_next), ', '.join(item.next)))
+        previous_next = tuple(item.next)
+    return {"thread_id": thread_id, "next": tuple(snapshot.next), "steps": steps, "values": snapshot.values}
+
+
+def list_runs(checkpointer, limit: int = 10) -> List[str]:
+    """最近的執行紀錄 thread id (新到舊)。"""
+    thread_ids: List[str] = []
+    for item in checkpointer.list(None):
+        thread_id = item.config['configurable']['thread_id']
+        if thread_id not in thread_ids:
+            thread_ids.append(thread_id)
+    # thread id 以時間戳記命名，依名稱中的時間排序
+    thread_ids.sort(key=lambda t: t.split('-', 1)[-1], reverse=True)
+    return thread_ids[:limit]
+
+
+def describe_value(value: Any) -> str:
+    """檢視 state 時的簡短描述 (列表/字典只顯示筆數)。"""
+    if isinstance(value, (list, tuple)):
+        return f"{len(value)} 筆"
+    if isinstance(value, dict):
+        return f"{len(value)} 個鍵"
+    text = str(value)
+    return text if len(text) <= 60 else text[:57] + '...'
+
+
+def latest_run(checkpointer) -> Optional[str]:
+    runs = list_runs(checkpointer, limit=1)
+    return runs[0] if runs else None
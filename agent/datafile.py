@@ -0,0 +1,65 @@
+import os
+import threading
+from typing import Any, Optional
+
+
+class HotReloadStore:
+    """
+    資料檔的熱載入 (產能資料、產能行事曆共用)
+    - current() 每次只檢查檔案的 mtime / 大小，有變動才重新讀檔
+    - 新檔案完整解析成功後才替換 (單一參照指派)，讀取端永遠拿到完整的一份；解析失敗時繼續使用舊資料
+    子類別實作 load() / empty() / describe()。
+    """
+
+    label = '資料檔'
+    warn_missing = True
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._value: Optional[Any] = None
+        self._stamp = None
+
+    def load(self, path: str) -> Any:
+        raise NotImplementedError
+
+    def empty(self) -> Any:
+        """檔案不存在或第一次讀取就失敗時使用的資料。"""
+        raise NotImplementedError
+
+    def describe(self, value: Any) -> str:
+        return ''
+
+    def _file_stamp(self):
+        stat = os.stat(self.path)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def current(self) -> Any:
+        try:
+            stamp = self._file_stamp()
+        except OSError as e:
+            if self._value is None:
+                if self.warn_missing:
+                    print(f"⚠️ 警告: 找不到{self.label} {self.path} ({e})，將使用預設資料。")
+                self._value = self.empty()
+            return self._value
+
+        if stamp == self._stamp and self._value is not None:
+            return self._value
+
+        with self._lock:
+            if stamp == self._stamp and self._value is not None:
+                return self._value
+            try:
+                value = self.load(self.path)
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                print(f"❌ {self.label}讀取失敗，繼續使用上一版: {e}")
+                if self._value is None:
+                    self._value = self.empty()
+                self._stamp = stamp
+                return self._value
+            if self._value is not None:
+                print(f"🔄 {self.label}已更新，重新載入{self.describe(value)}。")
+            self._value = value
+            self._stamp = stamp
+            return value
@@ -0,0 +1,179 @@
+"""
+訂單截止日期：解析與逾期統計
+
+工作表上的日期格式很雜 (2026-01-05、2026/1/5、115/01/05 (民國)、20260105、1/5/2026、05-Jan-2026、
+Google Sheets 的日期序號 ...)，用字串排序會排錯。訂單進來時 (order_from_packing_row / OrderBook.add)
+一律轉成 YYYY-MM-DD；工單另外存 due_ordinal (date.toordinal())，排程器以整數比較。
+無法解析的日期保留原文，排序時視為沒有截止日期。
+"""
+import re
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+# 沒有截止日期的工單排在最後
+NO_DUE_DATE = date.max.toordinal()
+
+_YEAR_FIRST_RE = re.compile(r'^(\d{2,4})[-/.](\d{1,2})[-/.](\d{1,2})$')
+_YEAR_LAST_RE = re.compile(r'^(\d{1,2})[-/.](\d{1,2})[-/.](\d{4})$')
+_COMPACT_RE = re.compile(r'^(\d{4})(\d{2})(\d{2})$')
+_SERIAL_RE = re.compile(r'^\d{5}(\.\d+)?$')
+_TEXT_FORMATS = ('%d-%b-%Y', '%d %b %Y', '%b %d, %Y', '%b %d %Y', '%d-%B-%Y', '%d %B %Y', '%B %d, %Y', '%B %d %Y')
+
+# Google Sheets / Excel 日期序號的起點
+_SERIAL_EPOCH = date(1899, 12, 30)
+_SERIAL_RANGE = (20000, 80000)  # 約 1954 ~ 2119 年，範圍外的數字不當成日期
+
+
+def _from_serial(serial: float) -> Optional[date]:
+    if _SERIAL_RANGE[0] <= serial <= _SERIAL_RANGE[1]:
+        return _SERIAL_EPOCH + timedelta(days=int(serial))
+    return None
+
+
+@lru_cache(maxsize=4096)
+def _parse_text(text: str) -> Optional[date]:
+    # 去掉時間部分 (2026-01-05 08:00 / 2026-01-05T08:00:00)
+    text = re.split(r'[T\s]+(?=\d{1,2}:)', text, maxsplit=1)[0].strip()
+    try:
+        match = _YEAR_FIRST_RE.match(text)
+        if match:
+            year_text = match.group(1)
+            year, month, day = (int(g) for g in match.groups())
+            if len(year_text) == 3:
+                year += 1911  # 民國年
+            elif len(year_text) == 2:
+                year += 2000
+            return date(year, month, day)
+        match = _YEAR_LAST_RE.match(text)
+        if match:
+            first, second, year = (int(g) for g in match.groups())
+            # 第一個數字大於 12 只可能是 日/月/年，否則依 Google Sheets 預設的 月/日/年
+            day, month = (first, second) if first > 12 else (second, first)
+            return date(year, month, day)
+        match = _COMPACT_RE.match(text)
+        if match:
+            return date(*(int(g) for g in match.groups()))
+        if _SERIAL_RE.match(text):
+            return _from_serial(float(text))
+    except ValueError:
+        return None
+    for fmt in _TEXT_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def parse_due_date(value: Any) -> Optional[date]:
+    """把工作表 / API 的截止日期轉成 date；空白或無法解析時回傳 None。"""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if isinstance(value, (int, float)):
+        return _from_serial(value)
+    text = str(value).strip()
+    return _parse_text(text) if text else None
+
+
+def normalize_due_date(value: Any) -> str:
+    """統一成 YYYY-MM-DD；空白回傳 ''，無法解析時保留原文 (不遺失資料)。"""
+    parsed = parse_due_date(value)
+    if parsed:
+        return parsed.isoformat()
+    return '' if value is None else str(value).strip()
+
+
+def due_ordinal(value: Any) -> int:
+    """排序用的截止日期 (date.toordinal())，沒有截止日期時為 NO_DUE_DATE。"""
+    parsed = parse_due_date(value)
+    return parsed.toordinal() if parsed else NO_DUE_DATE
+
+
+class LatenessTracker:
+    """
+    各訂單的延遲統計，在排程模擬過程中逐日更新 (不必模擬完再掃一遍排程結果)：
+    - add_job(): 模擬開始前登記每個未完工的工序
+    - job_finished(): 工序完工時呼叫；訂單的最後一個工序完工時算出 完工日 - 截止日
+    - close(): 模擬結束，仍未完工的訂單依模擬結束日計算已延遲天數
+    lateness_days 可為負數 (提前完成)，tardiness_days = max(0, lateness_days)。
+    """
+
+    def __init__(self):
+        self.orders: Dict[str, Dict[str, Any]] = {}
+        self._jobs_left: Dict[str, int] = {}
+        self.late_orders = 0
+        self.total_tardiness = 0
+        self.max_tardiness = 0
+
+    def add_job(self, job: Dict[str, Any]):
+        key = job['order_key']
+        if key not in self.orders:
+            due = job.get('due_ordinal', NO_DUE_DATE)
+            self.orders[key] = {
+                "order_key": key,
+                "order_id": job.get('order_id', ''),
+                "product": job.get('raw_product_name', ''),
+                "due_date": date.fromordinal(due).isoformat() if due != NO_DUE_DATE else '',
+                "finish_day": '',
+                "finish_date": '',
+                "lateness_days": None,
+                "tardiness_days": 0,
+                "status": '未完成',
+            }
+            self._jobs_left[key] = 0
+        self._jobs_left[key] += 1
+
+    def _settle(self, record: Dict[str, Any], when: date):
+        due = record['due_date']
+        if not due:
+            return
+        lateness = when.toordinal() - date.fromisoformat(due).toordinal()
+        record['lateness_days'] = lateness
+        record['tardiness_days'] = max(0, lateness)
+        if lateness > 0:
+            self.late_orders += 1
+            self.total_tardiness += lateness
+            self.max_tardiness = max(self.max_tardiness, lateness)
+
+    def job_finished(self, order_key: str, day: int, when: date):
+        left = self._jobs_left.get(order_key)
+        if not left:
+            return
+        self._jobs_left[order_key] = left - 1
+        if left == 1:
+            record = self.orders[order_key]
+            record['finish_day'] = f"Day {day}"
+            record['finish_date'] = when.isoformat()
+            self._settle(record, when)
+            if record['due_date']:
+                record['status'] = '逾期' if record['tardiness_days'] > 0 else '準時'
+            else:
+                record['status'] = '完工'
+
+    def close(self, horizon: date):
+        """模擬結束 (horizon = 最後模擬的日期)：未完工且已過截止日的訂單也算逾期。"""
+        for key, left in self._jobs_left.items():
+            if left > 0:
+                self._settle(self.orders[key], horizon)
+
+    def records(self) -> List[Dict[str, Any]]:
+        """逾期天數由多到少排序的訂單清單。"""
+        return sorted(self.orders.values(), key=lambda r: (-r['tardiness_days'], r['due_date'] or '9999-12-31', r['order_key']))
+
+    def summary(self, limit: int = 5) -> str:
+        if not self.late_orders:
+            with_due = sum(1 for r in self.orders.values() if r['due_date'])
+            return f"⏰ 有截止日期的 {with_due} 筆訂單皆可如期完成。" if with_due else ''
+        worst = [r for r in self.records() if r['tardiness_days'] > 0][:limit]
+        details = "、".join(
+            f"{r['order_id'] or r['product']} {r['product'] if r['order_id'] else ''}".strip()
+            + f" 延遲 {r['tardiness_days']} 天" + (" (未完工)" if r['status'] == '未完成' else '')
+            for r in worst)
+        more = " ..." if self.late_orders > len(worst) else ''
+        return (f"⏰ 逾期訂單 {self.late_orders} 筆 (總延遲 {self.total_tardiness} 天，最長 {self.max_tardiness} 天)："
+                f"{details}{more}")
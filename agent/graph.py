@@ -1,31 +1,68 @@
-from langgraph.graph import StateGraph, END
+from langgraph.graph import StateGraph, START, END
 from agent.state import AgentState
+from agent.memo import NODE_CACHE, memoize_node
+from agent.snapshot import measure_node, STATE_SIZES
+from agent.timings import timed_node
+from agent.tracing import traced_node
 from agent.nodes import (
     fetch_inventory, 
     analyze_packing_sheet, 
+    match_products,
     generate_pre_schedule_report, # 【新增】前置報告節點
     calculate_schedule,
-    send_notification
+    compare_with_last_schedule,
+    send_notification,
+    pre_schedule_fingerprint,
+    scheduler_fingerprint
 )
 
-def build_app():
+def build_app(node_cache=NODE_CACHE, checkpointer=None, profiler=None, measure_sizes=False):
+    """
+    建立排程流程圖。
+    node_cache: 前置報告與排程節點的輸出快取 (輸入指紋相同時直接重用)；傳入 None 則不使用快取。
+    checkpointer: 每個節點完成後保存 state (agent.checkpoint)，失敗時可從最後完成的節點恢復；
+                  使用時 invoke 必須帶 thread id (agent.checkpoint.run_graph)。
+    profiler: --profile 模式的 agent.profiling.PipelineProfiler，記錄每個節點的 wall / CPU time 與 cProfile。
+    measure_sizes: 記錄每個節點寫入 state 的資料量 (agent.snapshot.STATE_SIZES，每次更新都要序列化一次)；
+                   只在 --debug / --profile 時開啟。
+    """
+    pre_schedule_node = generate_pre_schedule_report
+    scheduler_node = calculate_schedule
+    if node_cache is not None:
+        pre_schedule_node = memoize_node("pre_schedule_report", generate_pre_schedule_report, pre_schedule_fingerprint, node_cache)
+        scheduler_node = memoize_node("scheduler", calculate_schedule, scheduler_fingerprint, node_cache)
+
     # 1. 初始化圖
     workflow = StateGraph(AgentState)
     
-    # 2. 加入節點
-    workflow.add_node("read_inventory", fetch_inventory)
-    workflow.add_node("read_packing_list", analyze_packing_sheet)
-    workflow.add_node("pre_schedule_report", generate_pre_schedule_report) # 【新增】報告節點
-    workflow.add_node("scheduler", calculate_schedule)
-    workflow.add_node("notify", send_notification)
+    # 2. 加入節點 (每個節點都記錄耗時與追蹤 span，見 agent.timings / agent.tracing；measure_sizes 時另記錄寫入 state 的資料量)
+    nodes = {
+        "read_inventory": fetch_inventory,
+        "read_packing_list": analyze_packing_sheet,
+        "match_products": match_products,
+        "pre_schedule_report": pre_schedule_node, # 【新增】報告節點
+        "scheduler": scheduler_node,
+        "schedule_diff": compare_with_last_schedule,
+        "notify": send_notification,
+    }
+    measure_sizes = measure_sizes or profiler is not None
+    for name, fn in nodes.items():
+        if profiler is not None:
+            fn = profiler.wrap_node(name, fn)
+        fn = timed_node(name, fn)
+        if measure_sizes:
+            fn = measure_node(name, fn)
+        workflow.add_node(name, traced_node(name, fn, STATE_SIZES if measure_sizes else None))
     
     # 3. 定義路徑
-    # 流程: 讀產能 -> 讀圖片(如果有的話) -> 【新報告】 -> 排程 -> 發信 -> 結束
-    workflow.set_entry_point("read_inventory")
-    workflow.add_edge("read_inventory", "read_packing_list")
-    workflow.add_edge("read_packing_list", "pre_schedule_report") # 【修正】新增流程
+    # 流程: [讀產能 | 讀圖片(如果有的話) | 產品匹配(LLM)] 三個分支並行 -> 匯合 -> 【新報告】 -> 排程 -> 比對上次排程 -> 發信 -> 結束
+    for branch in ("read_inventory", "read_packing_list", "match_products"):
+        workflow.add_edge(START, branch)
+    # 三個分支都完成才進入前置報告 (join)
+    workflow.add_edge(["read_inventory", "read_packing_list", "match_products"], "pre_schedule_report")
     workflow.add_edge("pre_schedule_report", "scheduler") # 【修正】新增流程
-    workflow.add_edge("scheduler", "notify")
+    workflow.add_edge("scheduler", "schedule_diff")
+    workflow.add_edge("schedule_diff", "notify")
     workflow.add_edge("notify", END)
     
-    return workflow.compile()
\ No newline at end of file
+    return workflow.compile(checkpointer=checkpointer)
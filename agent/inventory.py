@@ -0,0 +1,118 @@
+import csv
+import hashlib
+import json
+import os
+import re
+from typing import Dict, Any, Tuple, Iterator
+from collections.abc import Mapping
+
+from agent.datafile import HotReloadStore
+from agent.snapshot import FrozenDict
+
+# 產能資料檔 (JSON 或 CSV)，修改後不需重啟，下次讀取時自動重新載入
+DEFAULT_INVENTORY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'inventory.json')
+
+# 優先生產的產線 (job_priority 的 line_score = 0)
+PRIORITY_LINES = ('Line 1', 'Line 3')
+
+# 人力 >= 4 的是大工序 (佔一條產線)，其餘是可以併線的小工序
+LARGE_JOB_HEADCOUNT = 4
+
+# 型號代碼：工序名稱開頭的英數字 (例如 "HT325一線踩塑膠把手一線" -> HT325，"L100/L101/L102一線" -> L100, L101, L102)
+_MODEL_CODE_RE = re.compile(r'[A-Za-z]+\d+[A-Za-z]*')
+
+
+def model_codes(name: str) -> Tuple[str, ...]:
+    head = re.split(r'[^\x00-\x7f]', name, maxsplit=1)[0]
+    return tuple(dict.fromkeys(code.upper() for code in _MODEL_CODE_RE.findall(head)))
+
+
+def headcount_class(headcount: int) -> str:
+    return 'large' if headcount >= LARGE_JOB_HEADCOUNT else 'small'
+
+
+def line_score(line: str) -> int:
+    return 0 if line in PRIORITY_LINES else 1
+
+
+class Inventory(Mapping):
+    """
+    產能資料庫 (唯讀)：工序名稱 -> {"uph", "headcount", "line"}
+    載入時一次算好型號索引與內容雜湊，使用端不必再各自重新分組。
+    - by_model:     型號代碼 -> 工序名稱 (交期試算推估工序、benchmark 產生測試資料用)
+    - content_hash: 資料內容的 SHA-256 (快取、排程快照用)
+    排序 / 分組欄位 (line_score、headcount_class) 在建立工單時逐筆算好 (agent.nodes._create_jobs_list)。
+    """
+
+    def __init__(self, processes: Dict[str, Dict[str, Any]], version: str = '', source: str = ''):
+        self.version = str(version)
+        self.source = source
+        self.processes = FrozenDict(
+            (name, FrozenDict(uph=int(spec['uph']), headcount=int(spec['headcount']), line=str(spec.get('line') or 'Line 1')))
+            for name, spec in processes.items()
+        )
+        self.names: Tuple[str, ...] = tuple(self.processes)
+        payload = json.dumps(self.processes, sort_keys=True, ensure_ascii=False)
+        self.content_hash = hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+        by_model: Dict[str, list] = {}
+        for name in self.processes:
+            for code in model_codes(name):
+                by_model.setdefault(code, []).append(name)
+        self.by_model = FrozenDict((k, tuple(v)) for k, v in by_model.items())
+
+    # --- Mapping 介面 (與原本的 INVENTORY_DATA dict 相容) ---
+    def __getitem__(self, name: str) -> Dict[str, Any]:
+        return self.processes[name]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.processes)
+
+    def __len__(self) -> int:
+        return len(self.processes)
+
+
+def _load_json(path: str) -> Inventory:
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    processes = data.get('processes', {})
+    if isinstance(processes, list):
+        processes = {item['name']: item for item in processes}
+    return Inventory(processes, version=data.get('version', ''), source=path)
+
+
+def _load_csv(path: str) -> Inventory:
+    """CSV 欄位: name, uph, headcount, line (可用 Excel 編輯)；以 # 開頭的行為註解。"""
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        lines = [line for line in f if not line.lstrip().startswith('#')]
+    processes = {row['name'].strip(): row for row in csv.DictReader(lines) if (row.get('name') or '').strip()}
+    return Inventory(processes, version=os.path.getmtime(path), source=path)
+
+
+def load_inventory(path: str) -> Inventory:
+    """依副檔名讀取 JSON / CSV 產能資料檔。"""
+    if path.lower().endswith('.csv'):
+        return _load_csv(path)
+    return _load_json(path)
+
+
+class InventoryStore(HotReloadStore):
+    """產能資料檔的熱載入 (見 agent.datafile.HotReloadStore)。"""
+
+    label = '產能資料檔'
+
+    def __init__(self, path: str = DEFAULT_INVENTORY_PATH):
+        super().__init__(path)
+
+    def load(self, path: str) -> Inventory:
+        return load_inventory(path)
+
+    def empty(self) -> Inventory:
+        return Inventory({})
+
+    def describe(self, inventory: Inventory) -> str:
+        return f" {len(inventory)} 個工序 (版本 {inventory.version})"
+
+
+# 行程內共用的產能資料
+INVENTORY_STORE = InventoryStore()
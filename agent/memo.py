@@ -0,0 +1,110 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Any, Optional, Tuple
+
+DEFAULT_MAX_ENTRIES = 32
+
+_inventory_hash: Tuple[Any, str] = (None, '')
+
+
+def fingerprint(*parts: Any) -> str:
+    """把任意 JSON 可序列化的資料算成穩定的 SHA-256 指紋 (dict 依 key 排序)。"""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def inventory_fingerprint(inventory: Dict[str, Any]) -> str:
+    """產能資料庫的指紋；同一個物件只計算一次 (資料檔沒變動時各次執行共用同一份快照)。"""
+    global _inventory_hash
+    obj, digest = _inventory_hash
+    if obj is not inventory:
+        digest = fingerprint(inventory)
+        _inventory_hash = (inventory, digest)
+    return digest
+
+
+class NodeCache:
+    """
+    LangGraph 節點的輸出快取 (LRU，最多 max_entries 筆)
+    - key = (節點名稱, 輸入指紋)，value = 節點回傳的部分更新 (含本節點新增的 logs)
+    - 節點輸出都是唯讀快照 (agent.snapshot)，快取直接共用同一份物件，不需要 deepcopy
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits: Dict[str, int] = {}
+        self.misses: Dict[str, int] = {}
+
+    def get(self, node: str, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get((node, key))
+            if entry is None:
+                self.misses[node] = self.misses.get(node, 0) + 1
+                return None
+            self._entries.move_to_end((node, key))
+            self.hits[node] = self.hits.get(node, 0) + 1
+        return entry
+
+    def put(self, node: str, key: str, entry: Dict[str, Any]):
+        with self._lock:
+            self._entries[(node, key)] = entry
+            self._entries.move_to_end((node, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits.clear()
+            self.misses.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """各節點的命中統計: {node: {hits, misses, hit_rate}}。"""
+        with self._lock:
+            nodes = sorted(set(self.hits) | set(self.misses))
+            result = {}
+            for node in nodes:
+                hits, misses = self.hits.get(node, 0), self.misses.get(node, 0)
+                result[node] = {"hits": hits, "misses": misses, "hit_rate": round(hits / (hits + misses), 3)}
+            return result
+
+    def report(self) -> str:
+        stats = self.stats()
+        if not stats:
+            return "節點快取：尚無紀錄。"
+        parts = [f"{node} {s['hits']}/{s['hits'] + s['misses']} ({s['hit_rate']:.0%})" for node, s in stats.items()]
+        return f"節點快取命中率：{'，'.join(parts)} [快取 {len(self)}/{self.max_entries} 筆]"
+
+
+# 行程內共用的節點快取 (main.py 互動模式、服務模式共用)
+NODE_CACHE = NodeCache()
+
+
+def memoize_node(name: str, fn: Callable[[Dict[str, Any]], Dict[str, Any]], key_fn: Callable[[Dict[str, Any]], str],
+                 cache: NodeCache = NODE_CACHE):
+    """
+    包裝 LangGraph 節點：key_fn(state) 指紋相同時直接回傳快取的部分更新，不重新執行節點。
+    """
+    def wrapper(state):
+        key = key_fn(state)
+        cached = cache.get(name, key)
+        if cached is not None:
+            print(f"♻️ 節點 {name} 輸入未變動，使用快取結果。")
+            update = dict(cached)
+            update['logs'] = list(cached.get('logs', [])) + [f"♻️ 節點 {name} 命中快取，略過重新計算。"]
+            return update
+
+        update = fn(state)
+        cache.put(name, key, update)
+        return update
+
+    wrapper.__name__ = getattr(fn, '__name__', name)
+    wrapper.__doc__ = fn.__doc__
+    return wrapper
@@ -2,24 +2,30 @@ import configparser
 import pandas as pd
 import math
 import json
-import base64
+import io
+import threading
 from collections import defaultdict
+from datetime import date, datetime, timedelta
 from tabulate import tabulate # 【修正】新增 tabulate 導入，解決 NameError
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.messages import HumanMessage
 from agent.state import AgentState
 from agent.send_email import send_alert
+from agent.order_book import OrderBook, key_of, row_key_of
+from agent import packing_image
+from agent.report import print_day_summary
+from agent.schedule_diff import diff_schedules, summarize_diff, format_diff_digest
+from agent.memo import fingerprint, inventory_fingerprint
+from agent.snapshot import freeze, freeze_records, working_copy
+from agent.inventory import INVENTORY_STORE, Inventory, line_score, headcount_class
+from agent.capacity import CALENDAR_STORE, DEFAULT_MAX_LINES, FLAT_CALENDAR, CapacityCalendar
+from agent.due_date import LatenessTracker, due_ordinal
+from agent.calibration import CALIBRATION_STORE, calibration_settings
+from agent.allocation import MAX_ALLOCATION_JOBS, AllocationItem, allocate_people, item_weight, people_needed, produced_qty
+from agent.tracing import span
 from typing import List, Dict, Any
 
-# 匯入外部的生產資料檔
-try:
-    from agent.inventory_data import INVENTORY_DATA
-except ImportError:
-    try:
-        from inventory_data import INVENTORY_DATA
-    except ImportError:
-        print("⚠️ 警告: 找不到 inventory_data.py，將使用空資料。")
-        INVENTORY_DATA = {}
+# 【修改】產能資料改由資料檔 agent/inventory.json 提供 (agent.inventory)，檔案修改後下次排程自動重新載入
 
 # 讀取設定
 config = configparser.ConfigParser()
@@ -32,41 +38,24 @@ llm = ChatGoogleGenerativeAI(
     temperature=0
 )
 
+# LLM 產品匹配快取 (訂單產品名稱 -> 匹配工序)，同一個行程內跨排程保留 (服務模式下常駐)
+# 產能資料庫的工序清單改變時整個清空
+_match_cache: Dict[str, List[str]] = {}
+_match_cache_signature = None
+_match_lock = threading.Lock()
+
 # --- 輔助函式 ---
 def encode_image(image_path):
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
+    """【修改】先縮小、轉灰階、壓縮再 base64 編碼 (見 agent.packing_image.preprocess_image)。"""
+    return packing_image.encode_image(image_path)
 
 def normalize(s): 
     """將字串標準化：移除破折號/空格並轉大寫。"""
     return str(s).replace("-", "").replace(" ", "").upper()
 
-def _create_jobs_list(all_orders: List[Dict[str, Any]], inventory: Dict[str, Dict[str, int]]):
-    """
-    根據訂單和產能資料庫，建立所有工序清單 (all_jobs)。
-    
-    【優化版】使用 LLM 批次處理所有訂單，只呼叫 1 次 API
-    """
-    all_jobs = []
-    unknown_models = set()
-    product_to_jobs = defaultdict(list)
-    
-    # 準備 inventory 的產品列表（用於 LLM 匹配）
-    inventory_products = list(inventory.keys())
-    
-    # 【步驟 1】收集所有有效訂單的產品名稱
-    valid_orders = []
-    for order in all_orders:
-        p_name = order.get('product', 'Unknown')
-        qty_val = order.get('qty_remaining', order.get('qty', 0))
-        if qty_val > 0:
-            valid_orders.append(order)
-    
-    if not valid_orders:
-        return all_jobs, product_to_jobs, list(unknown_models)
-    
-    # 【步驟 2】建立批次 Prompt，一次送出所有產品
-    product_names = [order.get('product', 'Unknown') for order in valid_orders]
+def _match_products_with_llm(product_names: List[str], inventory_products: List[str]) -> Dict[str, List[str]]:
+    """使用 LLM 批次匹配產品名稱與工序 (只呼叫 1 次 API)，回傳 {產品名稱: [匹配工序]}。"""
+    # 建立批次 Prompt，一次送出所有產品
     product_list_text = "\n".join(f"{i+1}. {name}" for i, name in enumerate(product_names))
     inventory_list_text = "\n".join(f"- {inv_key}" for inv_key in inventory_products)
     
@@ -93,11 +82,13 @@ def _create_jobs_list(all_orders: List[Dict[str, Any]], inventory: Dict[str, Dic
 如果某產品沒有匹配的工序，該產品的值設為空陣列 []。
 請只回傳 JSON，不要有任何其他文字、解釋或 markdown 標記。"""
 
-    # 【步驟 3】呼叫 LLM（只呼叫 1 次！）
+    # 呼叫 LLM（只呼叫 1 次！）
     print("🤖 正在使用 LLM 批次匹配所有產品名稱...")
     
     try:
-        response = llm.invoke(batch_prompt)
+        with span('llm.invoke', purpose='product_match', products=len(product_names), prompt_chars=len(batch_prompt)) as sp:
+            response = llm.invoke(batch_prompt)
+            sp.set(response_chars=len(response.content))
         response_text = response.content.strip()
         
         # 清理可能的 markdown 標記
@@ -121,6 +112,61 @@ def _create_jobs_list(all_orders: List[Dict[str, Any]], inventory: Dict[str, Dic
         print(f"❌ LLM 呼叫失敗: {e}")
         raise ValueError(f"LLM 呼叫失敗: {e}，請重新執行排程。")
     
+    return {name: matching_result.get(name, []) for name in product_names}
+
+def _ensure_matches(product_names: List[str], inventory_products: List[str], known: Dict[str, List[str]] = None) -> Dict[str, List[str]]:
+    """
+    取得產品名稱的匹配工序：先查行程內快取 (以及 known，例如並行分支先算好的結果)，
+    快取沒有的產品才批次送給 LLM。
+    """
+    global _match_cache_signature
+    signature = hash(tuple(inventory_products))
+    with _match_lock:
+        if signature != _match_cache_signature:
+            _match_cache.clear()
+            _match_cache_signature = signature
+        if known:
+            _match_cache.update(known)
+        missing_names = [name for name in product_names if name not in _match_cache]
+
+    if missing_names:
+        matches = _match_products_with_llm(missing_names, inventory_products)
+        with _match_lock:
+            _match_cache.update(matches)
+    elif product_names:
+        print(f"♻️ 產品匹配全部命中快取 ({len(product_names)} 個產品)，略過 LLM 呼叫。")
+    return {name: _match_cache.get(name, []) for name in product_names}
+
+def _create_jobs_list(all_orders: List[Dict[str, Any]], inventory: Dict[str, Dict[str, int]], known_matches: Dict[str, List[str]] = None):
+    """
+    根據訂單和產能資料庫，建立所有工序清單 (all_jobs)。
+    
+    【優化版】使用 LLM 批次處理所有訂單，只呼叫 1 次 API
+    【修改】每筆訂單 (order_key) 各自展開工序，不再以產品合併，保留各自的 due_date
+    """
+    all_jobs = []
+    unknown_models = set()
+    product_to_jobs = defaultdict(list)   # 產品 -> 工序 (去重)
+    order_to_jobs = defaultdict(list)     # order_key -> 工序
+    
+    # 準備 inventory 的產品列表（用於 LLM 匹配）
+    inventory_products = list(inventory.keys())
+    
+    # 【步驟 1】收集所有有效訂單的產品名稱
+    valid_orders = []
+    for order in all_orders:
+        p_name = order.get('product', 'Unknown')
+        qty_val = order.get('qty_remaining', order.get('qty', 0))
+        if qty_val > 0:
+            valid_orders.append(order)
+    
+    if not valid_orders:
+        return all_jobs, product_to_jobs, order_to_jobs, list(unknown_models)
+    
+    # 【步驟 2、3】同產品多筆訂單只匹配一次，已匹配過的產品直接用快取，其餘只呼叫 1 次 LLM
+    all_product_names = list(dict.fromkeys(order.get('product', 'Unknown') for order in valid_orders))
+    matching_result = _ensure_matches(all_product_names, inventory_products, known_matches)
+    
     # 【步驟 4】根據匹配結果建立 all_jobs 列表
     for order in valid_orders:
         p_name = order.get('product', 'Unknown')
@@ -135,6 +181,8 @@ def _create_jobs_list(all_orders: List[Dict[str, Any]], inventory: Dict[str, Dic
             continue
         
         # 建立工序任務
+        o_key = key_of(order)
+        product_jobs = product_to_jobs[normalize(p_name)]
         matching_jobs = False
         for inv_key in matched_keys:
             if inv_key in inventory:
@@ -143,6 +191,7 @@ def _create_jobs_list(all_orders: List[Dict[str, Any]], inventory: Dict[str, Dic
                 
                 all_jobs.append({
                     "order_id": order.get('order_id', ''),
+                    "order_key": o_key,
                     "raw_product_name": p_name, 
                     "display_name": inv_key,    
                     "line": spec.get('line', 'Line 1'),
@@ -150,44 +199,143 @@ def _create_jobs_list(all_orders: List[Dict[str, Any]], inventory: Dict[str, Dic
                     "qty_total": qty_total,       
                     "qty_remaining": qty_val, 
                     "headcount": spec['headcount'],
+                    # 建立工單時一次算好排序 / 分組用的欄位，排程模擬每天不必重算
+                    "line_score": line_score(spec.get('line', 'Line 1')),
+                    "headcount_class": headcount_class(spec['headcount']),
                     "is_rush": order.get('is_rush', False),
-                    "due_date": order.get('due_date')
+                    "due_date": order.get('due_date'),
+                    # 截止日期解析成整數 (date.toordinal())，排序不受工作表日期格式影響
+                    "due_ordinal": due_ordinal(order.get('due_date'))
                 })
-                product_to_jobs[normalize(p_name)].append(inv_key)
+                order_to_jobs[o_key].append(inv_key)
+                if inv_key not in product_jobs:
+                    product_jobs.append(inv_key)
         
         if not matching_jobs:
             unknown_models.add(p_name)
             
-    # 排序：急單優先 (is_rush=True) -> 截止日期優先 (due_date)
+    # 排序：急單優先 (is_rush=True) -> 截止日期優先 (due_ordinal，沒有截止日期的排最後)
     all_jobs.sort(key=lambda x: (
         not x['is_rush'], 
-        x['due_date'] if x['due_date'] else "9999-12-31" 
+        x['due_ordinal']
     ))
         
-    return all_jobs, product_to_jobs, list(unknown_models)
+    return all_jobs, product_to_jobs, order_to_jobs, list(unknown_models)
 
 
-# --- 節點函式 (LangGraph Nodes) ---
+def build_jobs(orders: List[Dict[str, Any]], rush_orders: List[Dict[str, Any]], inventory: Inventory):
+    """
+    流程圖以外 (風險模擬、API) 建立工單用：急單在前，與 create_jobs 節點相同的展開方式。
+    回傳 (all_jobs, unknown_models)。
+    """
+    all_jobs, _, _, unknown_models = _create_jobs_list(list(rush_orders) + list(orders), inventory.processes)
+    return all_jobs, unknown_models
 
-def fetch_inventory(state: AgentState) -> AgentState:
-    """載入產能資料庫 (INVENTORY_DATA)。"""
-    state['inventory_db'] = INVENTORY_DATA
-    state['logs'].append(f"載入產能資料庫。共 {len(INVENTORY_DATA)} 個工序。")
-    return state
 
-def analyze_packing_sheet(state: AgentState) -> AgentState:
-    """分析 Packing Sheet 圖片，並將結果加入訂單佇列。 (此處為流程佔位)"""
-    
+def known_matches() -> Dict[str, List[str]]:
+    """目前已知的產品匹配結果 (行程內快取的副本)，交期試算可直接沿用、不必再呼叫 LLM。"""
+    with _match_lock:
+        return dict(_match_cache)
+
+
+def scheduler_settings() -> Dict[str, str]:
+    """排程參數 (config.ini 的 [ZZ_Srttings])。"""
+    return dict(config['ZZ_Srttings']) if 'ZZ_Srttings' in config else {}
+
+
+# --- 節點快取指紋 (agent.memo) ---
+
+def pre_schedule_fingerprint(state: AgentState) -> str:
+    """前置報告只取決於 訂單、急單、產能資料庫。"""
+    return fingerprint(state.get('orders', []), state.get('rush_orders', []),
+                       state.get('inventory_hash') or inventory_fingerprint(state.get('inventory_db') or {}))
+
+
+def scheduler_fingerprint(state: AgentState) -> str:
+    """
+    排程結果取決於 訂單、急單、產能資料庫 (決定 all_jobs)、排程參數、產能行事曆與排程起始日 (今天)，
+    啟用 UPH 校正時還有校正資料。
+    """
+    settings = scheduler_settings()
+    calibration = CALIBRATION_STORE.current().content_hash if calibration_settings(settings)['enabled'] else ''
+    return fingerprint(pre_schedule_fingerprint(state), settings,
+                       CALENDAR_STORE.current().content_hash, date.today().isoformat(), calibration)
+
+
+# --- 節點函式 (LangGraph Nodes) ---
+# 【修改】每個節點只回傳自己寫入的欄位 (部分更新)，不修改傳進來的 state；
+# logs 只回傳本節點新增的訊息 (由 AgentState 的 operator.add 累加)。
+# 訂單、產能、工單等共用資料都是唯讀快照 (agent.snapshot)，可以在多次執行、快取與 checkpoint 之間共用。
+
+def fetch_inventory(state: AgentState) -> Dict[str, Any]:
+    """
+    載入產能資料庫 (agent/inventory.json)。
+    資料檔沒變動時直接共用同一份唯讀快照；檔案更新後自動重新載入，不需重啟服務。
+    """
+    inventory = INVENTORY_STORE.current()
+    return {
+        "inventory_db": inventory.processes,
+        "inventory_hash": inventory.content_hash,
+        "logs": [f"載入產能資料庫 (版本 {inventory.version or '-'})。共 {len(inventory)} 個工序。"]
+    }
+
+def analyze_packing_sheet(state: AgentState) -> Dict[str, Any]:
+    """
+    分析 Packing Sheet 圖片，並將結果加入訂單佇列 (訂單的入口，輸出唯讀快照)。
+    圖片先前處理再送模型，多張圖片合併成一次呼叫；同一張圖片的辨識結果有快取 (agent.packing_image)。
+    """
+    orders = state.get('orders') or ()
+    rush_orders = state.get('rush_orders') or ()
+    image_paths = list(state.get('image_paths') or [])
     if state.get('image_path'):
-        # 這裡應該是 LLM 圖片解析邏輯
-        print(f"🖼️ 正在嘗試解析圖片: {state['image_path']}...")
-    else:
-         state['logs'].append("未提供圖片路徑，跳過 Packing Sheet 分析。")
-    
-    return state
+        image_paths.insert(0, state['image_path'])
 
+    if not image_paths:
+        return {
+            "orders": freeze_records(orders),
+            "rush_orders": freeze_records(rush_orders),
+            "logs": ["未提供圖片路徑，跳過 Packing Sheet 分析。"]
+        }
 
-def generate_pre_schedule_report(state: AgentState) -> AgentState:
+    try:
+        new_orders, ingested = packing_image.load_orders_from_images(llm, image_paths)
+    except Exception as e:
+        print(f"❌ Packing Sheet 圖片辨識失敗: {e}")
+        return {
+            "orders": freeze_records(orders),
+            "rush_orders": freeze_records(rush_orders),
+            "logs": [f"❌ Packing Sheet 圖片辨識失敗: {e}"]
+        }
+
+    # 與選項 1 相同的合併規則 (同一筆訂單合併數量，不同訂單各自保留)
+    book = OrderBook(list(orders), list(rush_orders))
+    book.merge_new_orders(new_orders, datetime.now().strftime('%Y-%m-%d'))
+    merged_orders, merged_rush = book.snapshot()
+    return {
+        "orders": merged_orders,
+        "rush_orders": merged_rush,
+        # 排程與訂單寫回成功後才標記為已匯入 (寫回失敗時重新匯入同一張圖不會漏單)
+        "ingested_images": ingested,
+        "logs": [f"Packing Sheet 圖片分析：{len(image_paths)} 張圖片，匯入 {len(new_orders)} 筆新訂單。"]
+    }
+
+def match_products(state: AgentState) -> Dict[str, Any]:
+    """
+    【新增】並行分支：訂單一進來就先做產品名稱匹配 (LLM)，和讀取產能資料庫、分析圖片同時進行。
+    產能資料庫的工序清單直接取自 INVENTORY_STORE (與 read_inventory 發佈的是同一份)。
+    """
+    orders = list(state.get('orders') or ()) + list(state.get('rush_orders') or ())
+    names = list(dict.fromkeys(o.get('product', 'Unknown') for o in orders if o.get('qty_remaining', o.get('qty', 0)) > 0))
+    if not names:
+        return {}
+    matches = _ensure_matches(names, list(INVENTORY_STORE.current().names))
+    return {
+        "product_matches": freeze(matches),
+        "logs": [f"產品匹配完成：{len(names)} 個產品。"]
+    }
+
+
+def generate_pre_schedule_report(state: AgentState) -> Dict[str, Any]:
     """生成排程前的預備報告，並建立所有工序清單 (all_jobs)。"""
     
     orders = state['orders']
@@ -195,13 +343,10 @@ def generate_pre_schedule_report(state: AgentState) -> AgentState:
     inventory = state['inventory_db']
     
     # 1. 合併常規訂單和急單
-    all_orders = orders + rush_orders
+    all_orders = list(orders) + list(rush_orders)
     
-    # 2. 建立工序清單 (接收三個返回值)
-    all_jobs, product_to_jobs, unknown_models = _create_jobs_list(all_orders, inventory)
-
-    state['all_jobs'] = all_jobs
-    state['product_to_jobs'] = product_to_jobs
+    # 2. 建立工序清單 (接收四個返回值)；match_products 分支已算好的匹配結果直接沿用
+    all_jobs, product_to_jobs, order_to_jobs, unknown_models = _create_jobs_list(all_orders, inventory, state.get('product_matches'))
     
     # 3. 顯示待排程清單 (使用者要求)
     print("\n--- ⚡ 準備排程：當前工作清單 ---")
@@ -210,10 +355,11 @@ def generate_pre_schedule_report(state: AgentState) -> AgentState:
     if not all_orders:
         print("🎉 列表為空，沒有需要排程的任務。")
     else:
-        # 排序：急單優先 (is_rush=True 優先)，然後按產品名稱
-        for order in sorted(all_orders, key=lambda x: (x.get('is_rush') is not True, x.get('product'))):
+        # 排序：急單優先 (is_rush=True 優先)，然後按產品名稱、截止日期
+        for order in sorted(all_orders, key=lambda x: (x.get('is_rush') is not True, x.get('product'), due_ordinal(x.get('due_date')))):
             if order.get('qty_remaining', order.get('qty', 0)) > 0:
                 report_data.append({
+                    "訂單編號": order.get('order_id', ''),
                     "產品型號": order.get('product', 'N/A'),
                     "總訂單量": order.get('qty_total', order.get('qty', 'N/A')),
                     "剩餘數量": order.get('qty_remaining', 'N/A'),
@@ -238,37 +384,45 @@ def generate_pre_schedule_report(state: AgentState) -> AgentState:
     if unknown_models:
         report_summary += f"\n⚠️ 警告: 找不到以下產品的工序數據: {', '.join(unknown_models)}"
 
-    state['logs'].append(report_summary)
-    
-    return state
+    # 工單為唯讀快照，排程器會自行建立工作副本
+    return {
+        "all_jobs": freeze_records(all_jobs),
+        "product_to_jobs": freeze(product_to_jobs),
+        "order_to_jobs": freeze(order_to_jobs),
+        "logs": [report_summary]
+    }
 
 
-def calculate_schedule(state: AgentState) -> AgentState:
+def calculate_schedule(state: AgentState) -> Dict[str, Any]:
     """執行排程計算，分配工序到每日，並計算所需人力。"""
     
     all_jobs = state.get('all_jobs', [])
-    product_to_jobs = state.get('product_to_jobs', {})
+    order_to_jobs = state.get('order_to_jobs', {})
     
     if not all_jobs:
-        state['is_feasible'] = False
-        state['schedule_summary'] = "排程失敗：缺少工單清單。"
-        return state
+        return {"is_feasible": False, "schedule_summary": "排程失敗：缺少工單清單。"}
+
+    settings = scheduler_settings()
+    calendar = CALENDAR_STORE.current()
+    lateness = LatenessTracker()
 
-    settings = config['ZZ_Srttings'] if 'ZZ_Srttings' in config else {} 
+    # 【新增】USE_CALIBRATED_UPH 開啟時以進度回報校正過的 UPH 排程 (agent.calibration)
+    calibration = calibration_settings(settings)
+    calibration_data = CALIBRATION_STORE.current() if calibration['enabled'] else None
+    if calibration_data is not None:
+        all_jobs = calibration_data.apply(all_jobs, calibration['min_samples'])
     
-    schedule_data, pending_jobs_final = _run_global_simulation(all_jobs, settings)
+    with span('scheduler.simulation', jobs=len(all_jobs)) as sp:
+        schedule_data, pending_jobs_final = _run_global_simulation(all_jobs, settings, calendar, date.today(), lateness)
+        sp.set(days=len(schedule_data), unfinished_jobs=len(pending_jobs_final), late_orders=lateness.late_orders)
 
     final_output_list = [] 
     
-    # 檢查最終產品的完工狀態
-    def check_product_completion(raw_product_name, final_pending_jobs):
-        related_jobs = product_to_jobs.get(normalize(raw_product_name), [])
-        unfinished_job_names = set(j['display_name'] for j in final_pending_jobs if j['qty_remaining'] > 0)
-        
-        for job_name in related_jobs:
-            if job_name in unfinished_job_names:
-                return False
-        return True
+    # 檢查最終訂單的完工狀態 (未完成工序集合只建一次，以 order_key 區分不同訂單)
+    unfinished_jobs = set((j['order_key'], j['display_name']) for j in pending_jobs_final if j['qty_remaining'] > 0)
+
+    def check_order_completion(o_key):
+        return not any((o_key, job_name) in unfinished_jobs for job_name in order_to_jobs.get(o_key, []))
     
     is_feasible = not pending_jobs_final
     
@@ -281,7 +435,7 @@ def calculate_schedule(state: AgentState) -> AgentState:
             
             highlight_prefix = ""
             if task['Status'] == '完工':
-                if check_product_completion(raw_product_name, pending_jobs_final):
+                if check_order_completion(row_key_of(task)):
                     highlight_prefix = "✅ " 
                 else:
                     highlight_prefix = "☑️ "
@@ -296,6 +450,7 @@ def calculate_schedule(state: AgentState) -> AgentState:
             
             final_output_list.append({
                 "Day": day_str,
+                "Date": day_info.get('date', ''),
                 "order_id": task.get('order_id', ''),
                 "Line": task['Line'],
                 "Product": product_display, 
@@ -310,57 +465,129 @@ def calculate_schedule(state: AgentState) -> AgentState:
                 "plan_to": task['plan_to'],
                 "priority": task['priority']
             })
+            if calibration_data is not None:
+                # 排程時使用的校正倍率：進度回報的 計劃量 以它換算回標準 UPH (agent.calibration.planning_factors)
+                final_output_list[-1]["UPH_Factor"] = calibration_data.factor(task['plan_to'], calibration['min_samples'])
             
     schedule_summary = f"排程完成。總共耗時 {len(schedule_data)} 天。"
     if not is_feasible:
         schedule_summary = f"⚠️ 排程未完成。排程器停止模擬。請查看未完成清單。"
+    # 【新增】逾期訂單摘要 (模擬過程中逐日累計)
+    lateness_summary = lateness.summary()
+    if lateness_summary:
+        schedule_summary = f"{schedule_summary}\n{lateness_summary}"
         
-    state['schedule_result'] = final_output_list
-    state['schedule_summary'] = schedule_summary
-    state['is_feasible'] = is_feasible
-    state['logs'].append(schedule_summary)
-    
-    return state
+    return {
+        "schedule_result": freeze_records(final_output_list),
+        "order_lateness": freeze_records(lateness.records()),
+        "schedule_summary": schedule_summary,
+        "is_feasible": is_feasible,
+        "logs": [schedule_summary]
+    }
 
 
-def send_notification(state: AgentState) -> AgentState:
-    """發送排程結果的 Email 通知。"""
-    
-    # 這裡的邏輯保持不變，專注於發送郵件
-    return state
+def compare_with_last_schedule(state: AgentState) -> Dict[str, Any]:
+    """與上次排程比較，只記錄變動的部分 (供 logs 與通知使用)。"""
+    schedule_diff = diff_schedules(state.get('last_schedule_results') or [], state.get('schedule_result') or [],
+                                   day_offset=_days_since(state.get('last_schedule_date')))
+    return {"schedule_diff": freeze(schedule_diff), "logs": [summarize_diff(schedule_diff)]}
+
+
+def _days_since(date_str) -> int:
+    """上次排程日期距今天數 (無法解析時視為 0)。"""
+    try:
+        return max(0, (datetime.now().date() - datetime.strptime(str(date_str), "%Y-%m-%d").date()).days)
+    except ValueError:
+        return 0
+
+
+def send_notification(state: AgentState) -> Dict[str, Any]:
+    """
+    發送排程結果的 Email 通知。
+    只組好郵件內容並放進背景寄信佇列 (agent.send_email)，不等待 SMTP，不增加排程流程的耗時。
+    """
+    schedule = state.get('schedule_result') or []
+    summary = state.get('schedule_summary', '')
+    rush_tasks = sum(1 for task in schedule if task.get('Note') == '⚡')
+
+    subject = "排程完成" if state.get('is_feasible') else "⚠️ 排程未完成"
+    buffer = io.StringIO()
+    buffer.write(f"{summary}\n\n")
+    buffer.write(f"工序筆數: {len(schedule)} (急單工序 {rush_tasks} 筆)\n")
+    buffer.write(f"未完成訂單: {len(state.get('orders') or [])} 筆，急單: {len(state.get('rush_orders') or [])} 筆\n\n")
+    if state.get('schedule_diff'):
+        buffer.write(format_diff_digest(state['schedule_diff']))
+        buffer.write("\n\n")
+    if schedule:
+        print_day_summary(schedule, buffer)
+
+    body = buffer.getvalue()
+    queued = send_alert(subject, body)
+    return {
+        "email_subject": subject,
+        "email_body": body,
+        "email_queued": queued,
+        "logs": ["📧 Email 通知已排入寄送佇列。" if queued else "⚠️ Email 通知未寄出 (郵件設定無法使用)。"]
+    }
     
-def _run_global_simulation(all_jobs, config_settings):
+# 排程模擬最多往後模擬幾天
+MAX_SIMULATION_DAYS = 1000
+
+
+def _run_global_simulation(all_jobs, config_settings, calendar: CapacityCalendar = FLAT_CALENDAR, start_date: date = None,
+                           lateness: LatenessTracker = None):
     # 排程模擬核心 (邏輯保持不變，確保使用 8 小時最大產能)
+    # 【新增】每天的人力、產線數、各產線工時與休假由產能行事曆決定 (agent.capacity)，
+    # 行事曆沒有設定的部分沿用 config.ini；Day 1 = start_date (預設今天)
+    # 【新增】排序加入截止日期 (EDD)；傳入 lateness 時逐日記錄各訂單完工日與延遲天數
     try:
         MAX_PEOPLE_TOTAL = int(config_settings.get('MAX_HEADCOUNT', 40)) 
         WORK_HOURS = int(config_settings.get('WORK_HOURS_PER_DAY', 8)) 
-        MAX_LINES = 4 
+        MAX_LINES = DEFAULT_MAX_LINES 
     except Exception:
         MAX_PEOPLE_TOTAL = 40
         WORK_HOURS = 8
-        MAX_LINES = 4
-
-    pending_jobs = list(all_jobs)
+        MAX_LINES = DEFAULT_MAX_LINES
+    start_date = start_date or date.today()
+
+    # 排程器專用的工作副本：模擬過程會扣減 qty_remaining，不能改到 state 中共用的工單快照
+    pending_jobs = working_copy(all_jobs)
+    for job in pending_jobs:
+        # 舊版 checkpoint 的工單沒有預先算好的欄位
+        if 'line_score' not in job:
+            job['line_score'] = line_score(job.get('line', 'Line 1'))
+            job['headcount_class'] = headcount_class(job['headcount'])
+        if 'due_ordinal' not in job:
+            job['due_ordinal'] = due_ordinal(job.get('due_date'))
+        if lateness is not None:
+            lateness.add_job(job)
+
+    # 優先級排序：急單 -> 截止日期早的 (EDD) -> 優先產線 -> 人力多的 (欄位在建立工單時已算好)
+    # 排序鍵在模擬過程中不會變，而且每天留到隔天的工單保持原本的先後順序，所以只需在開始前排序一次
+    def job_priority(j):
+        is_rush = 0 if j['is_rush'] else 1
+        return (is_rush, j['due_ordinal'], j['line_score'], -j['headcount'])
+
+    pending_jobs.sort(key=job_priority)
     current_day = 1
-    MAX_SIMULATION_DAYS = 1000 
     daily_schedule = defaultdict(lambda: {'tasks': [], 'people_left': MAX_PEOPLE_TOTAL, 'people_used': 0})
     
     while pending_jobs and current_day < MAX_SIMULATION_DAYS:
-        people_available = MAX_PEOPLE_TOTAL
+        day_date = start_date + timedelta(days=current_day - 1)
+        capacity = calendar.day(day_date)
+        if not capacity.workday:
+            # 假日 / 休息日：不排工，天數照算
+            current_day += 1
+            continue
+        people_total = capacity.headcount if capacity.headcount is not None else MAX_PEOPLE_TOTAL
+        max_lines = capacity.max_lines if capacity.max_lines is not None else MAX_LINES
+        hours_for = capacity.hours_for
+        people_available = people_total
         day_tasks = []
         
-        # 【關鍵改動】分離大工序和小工序
-        large_jobs = [j for j in pending_jobs if j['qty_remaining'] > 0 and j['headcount'] >= 4]
-        small_jobs = [j for j in pending_jobs if j['qty_remaining'] > 0 and j['headcount'] < 4]
-        
-        # 優先級排序函式
-        def job_priority(j):
-            is_rush = 0 if j['is_rush'] else 1
-            line_score = 0 if j['line'] in ['Line 1', 'Line 3'] else 1 
-            return (is_rush, line_score, -j['headcount'])
-        
-        large_jobs.sort(key=job_priority)
-        small_jobs.sort(key=job_priority)
+        # 【關鍵改動】分離大工序和小工序 (保持 job_priority 的順序)
+        large_jobs = [j for j in pending_jobs if j['qty_remaining'] > 0 and j['headcount_class'] == 'large']
+        small_jobs = [j for j in pending_jobs if j['qty_remaining'] > 0 and j['headcount_class'] == 'small']
         
         next_day_pending = []
         jobs_processed_in_day = 0
@@ -369,7 +596,7 @@ def _run_global_simulation(all_jobs, config_settings):
         jobs_scheduled_today = 0
         for job in large_jobs:
             # 檢查產線限制
-            if jobs_scheduled_today >= MAX_LINES:
+            if jobs_scheduled_today >= max_lines:
                 next_day_pending.append(job)
                 continue
             
@@ -378,8 +605,14 @@ def _run_global_simulation(all_jobs, config_settings):
                 next_day_pending.append(job)
                 continue
             
+            # 產線當天的工時 (0 表示停線，例如設備保養)
+            work_hours = hours_for(job['line'], WORK_HOURS)
+            if work_hours <= 0:
+                next_day_pending.append(job)
+                continue
+
             # 計算產量
-            produced_qty_by_hour = math.floor(WORK_HOURS * job['uph'])
+            produced_qty_by_hour = math.floor(work_hours * job['uph'])
             max_producible_qty = job['qty_remaining']
             real_qty = min(produced_qty_by_hour, max_producible_qty)
             
@@ -401,6 +634,8 @@ def _run_global_simulation(all_jobs, config_settings):
             output_status = "完工" if job['qty_remaining'] <= 0 else "進行中"
             if job['qty_remaining'] > 0:
                 next_day_pending.append(job)
+            elif lateness is not None:
+                lateness.job_finished(job['order_key'], current_day, day_date)
 
             day_tasks.append({
                 "order_id": job.get('order_id', ''),
@@ -418,43 +653,43 @@ def _run_global_simulation(all_jobs, config_settings):
             })
         
         # === 第二階段：用剩餘人力排小工序（<4人），可以增派人力加速 ===
+        # 【修改】不再讓排在前面的工序先搶光閒置人力：依優先順序取當天可開工的小工序，
+        # 交給 allocate_people() (有界背包 DP) 一起分配，每個工序最多派到今天做完所需的人數
+        candidates = []
+        candidate_base = 0
         for job in small_jobs:
-            base_headcount = job['headcount']  # 原本需要的人力
-            
-            # 檢查至少要有基本人力
-            if people_available < base_headcount:
+            if len(candidates) >= MAX_ALLOCATION_JOBS or candidate_base >= 2 * people_available:
+                break
+            # 檢查至少要有基本人力，且產線當天有開
+            work_hours = hours_for(job['line'], WORK_HOURS)
+            if people_available < job['headcount'] or work_hours <= 0 or job['uph'] <= 0:
+                continue
+            candidates.append((job, work_hours))
+            candidate_base += job['headcount']
+
+        items = [AllocationItem(
+            base=job['headcount'],
+            need=people_needed(job['qty_remaining'], work_hours, job['uph'], job['headcount'], people_available),
+            weight=item_weight(job['is_rush'], rank, len(candidates), people_available),
+        ) for rank, (job, work_hours) in enumerate(candidates)]
+        allocation = {id(job): (people, work_hours)
+                      for (job, work_hours), people in zip(candidates, allocate_people(items, people_available))}
+
+        for job in small_jobs:
+            people_to_assign, work_hours = allocation.get(id(job), (0, 0))
+            if not people_to_assign:
                 next_day_pending.append(job)
                 continue
-            
-            # 【關鍵】計算可以派多少人（最多用完所有閒置人力）
-            # 可以派的人數 = min(閒置人力, 需要的數量對應的人力)
-            base_uph = job['uph']
+
+            base_headcount = job['headcount']
             qty_remaining = job['qty_remaining']
-            
-            # 計算最多需要多少倍人力才能在一天內完成
-            max_output_per_day = WORK_HOURS * base_uph
-            if qty_remaining <= max_output_per_day:
-                # 一天內就能完成，用基本人力就好
-                people_to_assign = base_headcount
-            else:
-                # 一天完不成，盡可能多派人加速
-                # 計算需要多少倍人力
-                multiplier_needed = math.ceil(qty_remaining / max_output_per_day)
-                # 但不能超過閒置人力
-                max_people_can_assign = people_available
-                people_to_assign = min(base_headcount * multiplier_needed, max_people_can_assign)
-            
-            # 確保至少派基本人力
-            people_to_assign = max(people_to_assign, base_headcount)
-            
+
             # 計算實際產能（人數倍數）
-            people_multiplier = people_to_assign / base_headcount
-            actual_uph = base_uph * people_multiplier
-            
+            actual_uph = job['uph'] * (people_to_assign / base_headcount)
+
             # 計算產量
-            produced_qty_by_hour = math.floor(WORK_HOURS * actual_uph)
-            max_producible_qty = qty_remaining
-            real_qty = min(produced_qty_by_hour, max_producible_qty)
+            produced_qty_by_hour = produced_qty(work_hours, job['uph'], people_to_assign, base_headcount)
+            real_qty = min(produced_qty_by_hour, qty_remaining)
             
             if real_qty <= 0:
                 next_day_pending.append(job)
@@ -473,6 +708,8 @@ def _run_global_simulation(all_jobs, config_settings):
             output_status = "完工" if job['qty_remaining'] <= 0 else "進行中"
             if job['qty_remaining'] > 0:
                 next_day_pending.append(job)
+            elif lateness is not None:
+                lateness.job_finished(job['order_key'], current_day, day_date)
 
             day_tasks.append({
                 "order_id": job.get('order_id', ''),
@@ -495,7 +732,8 @@ def _run_global_simulation(all_jobs, config_settings):
             daily_schedule[f"Day {current_day}"] = {
                 "tasks": day_tasks,
                 "people_left": people_available, 
-                "people_used": MAX_PEOPLE_TOTAL - people_available
+                "people_used": people_total - people_available,
+                "date": day_date.isoformat()
             }
             current_day += 1
         elif pending_jobs:
@@ -503,4 +741,6 @@ def _run_global_simulation(all_jobs, config_settings):
         elif not pending_jobs:
             break
 
+    if lateness is not None:
+        lateness.close(start_date + timedelta(days=current_day - 1))
     return daily_schedule, pending_jobs
\ No newline at end of file
@@ -0,0 +1,414 @@
+import json
+from typing import List, Dict, Any, Optional, Iterator, Tuple
+from itertools import count
+
+from agent.snapshot import FrozenDict
+from agent.due_date import due_ordinal, normalize_due_date
+
+
+def order_key(order_id: Optional[str], product: Optional[str]) -> str:
+    """
+    訂單的唯一識別 (一筆訂單 = order_id + 產品)。
+    同一張 Packing Sheet 的 order_id 可能包含多個產品，所以要連產品一起當 key；
+    舊資料沒有 order_id 時退回用產品名稱。
+    """
+    if order_id:
+        return f"{order_id}|{product}"
+    return str(product)
+
+
+def key_of(order: Dict[str, Any]) -> str:
+    """訂單 dict 的 order_key。"""
+    return order_key(order.get('order_id'), order.get('product'))
+
+
+def row_key_of(row: Dict[str, Any]) -> str:
+    """排程結果 (schedule_result / 工作表列) 的 order_key。"""
+    return order_key(row.get('order_id'), row.get('Raw_Product_Name'))
+
+
+def order_from_packing_row(record: Dict[str, str], row_label: Any = '') -> Optional[Dict[str, Any]]:
+    """
+    把 Packing Sheet 的一列 (欄位: order_id, priority, customer_name, product_name, quantity, pending, Order_Date, status)
+    轉成訂單 dict (load_new_orders_from_sheet 的格式)；不需排程 (已排程/數量為 0/格式錯誤) 時回傳 None。
+    工作表與圖片辨識 (agent.packing_image) 共用同一套解析規則。
+    """
+    def field(name):
+        value = record.get(name)
+        return '' if value is None else str(value).strip()
+
+    if field('status') == '已排程':
+        return None
+
+    order_id = field('order_id')
+    priority = field('priority').lower()
+    product_name = field('product_name')
+    order_date = field('Order_Date')
+
+    # 解析數量
+    quantity_str = field('quantity').upper().replace('PCS', '').replace(',', '').strip()
+    pending_str = field('pending').upper().replace('PCS', '').replace(',', '').strip()
+
+    try:
+        qty_total = int(quantity_str) if quantity_str else 0
+        qty_pending = int(pending_str) if pending_str else qty_total
+    except ValueError:
+        print(f"⚠️ 第 {row_label} 行數量格式錯誤，跳過。")
+        return None
+
+    if qty_pending <= 0:
+        return None
+
+    raw_data_dict = {
+        "order_id": order_id,
+        "product_name": product_name,
+        "quantity": f"{qty_total} PCS",
+        "pending": f"{qty_pending} PCS",
+        "Order_Date": order_date
+    }
+
+    return {
+        "order_id": order_id,
+        "product": product_name,
+        "qty": qty_pending,
+        "qty_remaining": qty_pending,
+        "is_rush": priority == 'rush',
+        "due_date": normalize_due_date(order_date),
+        "raw_data": json.dumps(raw_data_dict, ensure_ascii=False)
+    }
+
+
+class OrderBook:
+    """
+    訂單簿 (Order Book)
+    包裝常規訂單 (orders) 與急單 (rush_orders)，每筆訂單以 order_key 建立主索引，
+    並以 product 建立次索引 (product -> orders)，讓 main.py 的合併、轉急單、進度回報都能 O(1) 查找，
+    而不用每次線性掃描整個列表。
+
+    - 內部以遞增序號當作每筆訂單的 slot，dict 保持插入順序，所以刪除也是 O(1)
+    - orders / rush_orders 屬性回傳 list，可直接放進 LangGraph 的 AgentState
+    - as_lists() 回傳 (orders, rush_orders)，可直接交給 GoogleSheetsDB.save_orders
+    - snapshot() 回傳唯讀快照給 LangGraph；沒變動的訂單沿用上次的快照物件 (多次執行之間共用)
+    """
+
+    NORMAL = 'normal'
+    RUSH = 'rush'
+
+    def __init__(self, orders: Optional[List[Dict[str, Any]]] = None,
+                 rush_orders: Optional[List[Dict[str, Any]]] = None):
+        self._seq = count()
+        self._entries: Dict[str, Dict[int, Dict[str, Any]]] = {}
+        self._by_product: Dict[str, Dict[str, Dict[int, None]]] = {}
+        self._by_key: Dict[str, Dict[str, int]] = {}
+        # (queue, order_key) -> 上次 snapshot() 產生的 FrozenDict
+        self._frozen: Dict[Tuple[str, str], FrozenDict] = {}
+        self.reset(orders or [], rush_orders or [])
+
+    # --- 建立 / 重建 ---
+    def reset(self, orders: List[Dict[str, Any]], rush_orders: List[Dict[str, Any]]):
+        """以新的列表重建整本訂單簿 (例如 app.invoke 回傳結果之後)。"""
+        for queue in (self.NORMAL, self.RUSH):
+            self._entries[queue] = {}
+            self._by_product[queue] = {}
+            self._by_key[queue] = {}
+        for order in orders:
+            self.add(order)
+        for order in rush_orders:
+            self.add(order, rush=True)
+
+    def _queue(self, rush: bool) -> str:
+        return self.RUSH if rush else self.NORMAL
+
+    # --- 新增 / 移除 ---
+    def add(self, order: Dict[str, Any], rush: bool = False) -> Dict[str, Any]:
+        """加入一筆訂單到常規或急單佇列，並更新索引。"""
+        queue = self._queue(rush)
+        key = next(self._seq)
+        if isinstance(order, FrozenDict):
+            # 從 LangGraph 結果回來的唯讀快照，訂單簿內部需要可修改的版本
+            order = dict(order)
+        if 'due_date' in order:
+            # 工作表 / API 的日期格式不一，進訂單簿時統一成 YYYY-MM-DD
+            order['due_date'] = normalize_due_date(order['due_date'])
+        self._entries[queue][key] = order
+        self._by_product[queue].setdefault(order.get('product'), {})[key] = None
+        self._by_key[queue][key_of(order)] = key
+        return order
+
+    def _remove_key(self, queue: str, key: int) -> Dict[str, Any]:
+        order = self._entries[queue].pop(key)
+        product = order.get('product')
+        keys = self._by_product[queue].get(product)
+        if keys is not None:
+            keys.pop(key, None)
+            if not keys:
+                del self._by_product[queue][product]
+        if self._by_key[queue].get(key_of(order)) == key:
+            del self._by_key[queue][key_of(order)]
+        return order
+
+    def remove_product(self, product: str, rush: bool = False) -> List[Dict[str, Any]]:
+        """移除某產品在指定佇列中的所有訂單，並回傳被移除的訂單。"""
+        queue = self._queue(rush)
+        keys = list(self._by_product[queue].get(product, {}))
+        return [self._remove_key(queue, key) for key in keys]
+
+    def remove_order(self, okey: str, rush: bool = False) -> Optional[Dict[str, Any]]:
+        """依 order_key 移除一筆訂單。"""
+        queue = self._queue(rush)
+        key = self._by_key[queue].get(okey)
+        if key is None:
+            return None
+        return self._remove_key(queue, key)
+
+    def discard_if(self, predicate, rush: bool = False) -> int:
+        """移除所有符合條件的訂單 (例如已完成的訂單)，回傳移除數量。"""
+        queue = self._queue(rush)
+        keys = [key for key, order in self._entries[queue].items() if predicate(order)]
+        for key in keys:
+            self._remove_key(queue, key)
+        return len(keys)
+
+    # --- 查找 ---
+    def find_by_product(self, product: str, rush: bool = False) -> Optional[Dict[str, Any]]:
+        """回傳指定佇列中該產品的第一筆訂單 (等同舊的 next(...) 寫法)。"""
+        queue = self._queue(rush)
+        keys = self._by_product[queue].get(product)
+        if not keys:
+            return None
+        return self._entries[queue][next(iter(keys))]
+
+    def find_all_by_product(self, product: str, rush: bool = False) -> List[Dict[str, Any]]:
+        queue = self._queue(rush)
+        entries = self._entries[queue]
+        return [entries[key] for key in self._by_product[queue].get(product, {})]
+
+    def find_any(self, product: str) -> Optional[Dict[str, Any]]:
+        """先找常規訂單，找不到再找急單。"""
+        return self.find_by_product(product) or self.find_by_product(product, rush=True)
+
+    def get(self, okey: str, rush: bool = False) -> Optional[Dict[str, Any]]:
+        """依 order_key 查找單筆訂單。"""
+        queue = self._queue(rush)
+        key = self._by_key[queue].get(okey)
+        return self._entries[queue][key] if key is not None else None
+
+    def find(self, order_id: Optional[str], product: Optional[str], rush: bool = False) -> Optional[Dict[str, Any]]:
+        return self.get(order_key(order_id, product), rush=rush)
+
+    def product_totals(self, product: str, rush: bool = False) -> Tuple[int, int]:
+        """某產品在指定佇列的 (總訂單量, 剩餘數量)，只走訪該產品的訂單。"""
+        total = remaining = 0
+        for order in self.find_all_by_product(product, rush=rush):
+            qty = order.get('qty', 0) or 0
+            total += qty
+            remaining += order.get('qty_remaining', qty) or 0
+        return total, remaining
+
+    def has_product(self, product: str, rush: bool = False) -> bool:
+        return bool(self._by_product[self._queue(rush)].get(product))
+
+    # --- 急單 / 常規 之間移動 ---
+    def move_to_rush(self, product: str) -> List[Dict[str, Any]]:
+        """把某產品的常規訂單全部移出常規佇列 (回傳被移出的訂單，由呼叫端決定急單內容)。"""
+        return self.remove_product(product)
+
+    def upsert_rush(self, rush_order: Dict[str, Any]) -> Dict[str, Any]:
+        """同一筆訂單 (order_key) 已有急單則加上這次的數量 (分次轉急單不會蓋掉前一次)，否則新增。"""
+        existing = self.get(key_of(rush_order), rush=True)
+        if existing is None:
+            return self.add(rush_order, rush=True)
+        qty = rush_order.get('qty', 0)
+        existing['qty'] = existing.get('qty', 0) + qty
+        existing['qty_remaining'] = existing.get('qty_remaining', 0) + rush_order.get('qty_remaining', qty)
+        for field, value in rush_order.items():
+            existing.setdefault(field, value)
+        return existing
+
+    # --- 訂單操作 (main.py 互動選單與 scheduler_service 共用) ---
+    def merge_new_orders(self, new_orders: List[Dict[str, Any]], today: str) -> List[Dict[str, Any]]:
+        """
+        合併從 read_packing_sheet 讀到的新訂單 (選項 1)。
+        只有同一筆訂單 (order_id + 產品) 才合併數量，不同訂單各自保留 due_date。
+        回傳被合併 (已存在) 的訂單。
+        """
+        merged = []
+        for new_order in new_orders:
+            # 已經轉成急單的訂單加到急單上 (不另外建立一筆常規訂單)
+            existing_order = self.get(key_of(new_order)) or self.get(key_of(new_order), rush=True)
+            if existing_order:
+                existing_order['qty_remaining'] += new_order['qty']
+                existing_order['qty'] = existing_order['qty_remaining']
+                if 'qty_total' in existing_order:
+                    existing_order['qty_total'] += new_order['qty']
+                merged.append(existing_order)
+            else:
+                self.add({
+                    "order_id": new_order.get('order_id', ''),
+                    "product": new_order['product'],
+                    "qty": new_order['qty'],
+                    "qty_remaining": new_order['qty'],
+                    "is_rush": False,
+                    "due_date": new_order['due_date'],
+                    "raw_packing_sheet": new_order.get('raw_data', ''),
+                    "date_created": today
+                })
+        return merged
+
+    def add_new_rush(self, product: str, qty: int, order_id: str, today: str) -> Dict[str, Any]:
+        """新增全新急單 (選項 2A)。"""
+        return self.add({
+            "order_id": order_id,
+            "product": product,
+            "qty": qty,
+            "is_rush": True,
+            "qty_remaining": qty,
+            "qty_total": qty,
+            "date_created": today
+        }, rush=True)
+
+    def convert_to_rush(self, product: str, qty: int) -> List[Dict[str, Any]]:
+        """
+        舊單轉急單 (選項 2B)。
+        每筆原訂單各自轉成急單 (保留 order_id / due_date)，加速數量依截止日期由早到晚分配，
+        沒分配到的訂單留在常規佇列。回傳轉成急單的項目 (找不到訂單時為空 list)。
+        """
+        found_orders = self.move_to_rush(product)
+        if not found_orders:
+            return []
+
+        found_orders.sort(key=lambda o: due_ordinal(o.get('due_date')))
+        qty_left = qty
+        converted = []
+        for order in found_orders:
+            remaining = order.get('qty_remaining', order.get('qty', 0))
+            order_qty = order.get('qty', remaining)
+            take = min(qty_left, remaining)
+            if take <= 0 or take < remaining:
+                # 沒轉成急單的部分 (整筆或剩下的數量) 留在常規佇列；
+                # 轉走的數量也從 qty 扣掉，已生產量 (qty - qty_remaining) 不變，進度只算常規的部分
+                order['qty'] = order_qty - max(take, 0)
+                order['qty_remaining'] = remaining - max(take, 0)
+                self.add(order)
+            if take <= 0:
+                continue
+            qty_left -= take
+            converted.append({
+                "order_id": order.get('order_id', ''),
+                "product": product,
+                "qty": take,
+                "is_rush": True,
+                "qty_remaining": take,
+                "qty_total": order_qty,
+                "due_date": order.get('due_date', '')
+            })
+        if not converted:
+            # 所有訂單都沒有剩餘量 (已在上面原樣放回)
+            return []
+        if qty_left > 0:
+            # 輸入量大於剩餘量時，多出的部分算在最後一筆急單
+            converted[-1]['qty'] += qty_left
+            converted[-1]['qty_remaining'] += qty_left
+
+        for rush_item in converted:
+            self.upsert_rush(rush_item)
+        return converted
+
+    def apply_progress(self, progress_data: List[Dict[str, Any]], real_output_by_order: Dict[str, int]) -> List[Dict[str, Any]]:
+        """
+        依實際產量回報更新剩餘數量 (選項 3)。
+        progress_data 為 agent.progress.compute_progress 的 progress 列 (需要 order_key / total_qty / planned_output)。
+        落後的訂單會從常規佇列移到急單佇列 (急單佇列整個換成這次的落後訂單)，已完成的訂單會被移除。
+        部分轉成急單的訂單：急單先排，回報的產量先扣急單的部分，剩下的才算常規訂單的產量。
+        回傳落後清單: [{"order_key", "order_id", "product", "lagging_qty"}]
+        """
+        lagging = []
+        new_rush_orders = []
+        lagging_keys = set()
+
+        for order_data in progress_data:
+            o_key = order_data['order_key']
+            current_order = self.get(o_key)
+            if not current_order:
+                continue
+
+            total_qty = order_data['total_qty']
+            total_actual_output = real_output_by_order.get(o_key, 0)
+            rush_part = self.get(o_key, rush=True)
+            rush_qty = rush_part.get('qty', 0) if rush_part else 0
+            new_qty_remaining = max(0, total_qty - max(0, total_actual_output - rush_qty))
+            rush_remaining = 0
+            if rush_part:
+                rush_remaining = rush_part['qty_remaining'] = max(0, rush_qty - total_actual_output)
+            planned_output = order_data['planned_output']
+
+            if total_actual_output < planned_output:
+                lagging.append({
+                    "order_key": o_key,
+                    "order_id": current_order.get('order_id', ''),
+                    "product": current_order['product'],
+                    "lagging_qty": planned_output - total_actual_output
+                })
+                # 急單佇列會整個換掉：同一訂單原本急單還沒做完的量併進新的急單
+                if new_qty_remaining + rush_remaining > 0:
+                    new_rush_orders.append({
+                        "order_id": current_order.get('order_id', ''),
+                        "product": current_order['product'],
+                        "qty": new_qty_remaining + rush_remaining,
+                        "qty_remaining": new_qty_remaining + rush_remaining,
+                        "is_rush": True,
+                        "qty_total": current_order.get('qty', total_qty),
+                        "due_date": current_order.get('due_date', '')
+                    })
+                lagging_keys.add(o_key)
+
+            current_order['qty_remaining'] = new_qty_remaining
+
+        # 移除已完成與落後的訂單（落後的已經轉進急單）
+        self.discard_if(lambda o: o['qty_remaining'] <= 0 or key_of(o) in lagging_keys)
+        self.discard_if(lambda o: o['qty_remaining'] <= 0, rush=True)
+        if lagging:
+            self.reset(self.orders, new_rush_orders)
+        return lagging
+
+    # --- 序列化 / 列表相容 ---
+    @property
+    def orders(self) -> List[Dict[str, Any]]:
+        return list(self._entries[self.NORMAL].values())
+
+    @property
+    def rush_orders(self) -> List[Dict[str, Any]]:
+        return list(self._entries[self.RUSH].values())
+
+    def as_lists(self) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """回傳 (orders, rush_orders)，格式與 GoogleSheetsDB.save_orders 相同。"""
+        return self.orders, self.rush_orders
+
+    def _snapshot_queue(self, queue: str, frozen: Dict[Tuple[str, str], FrozenDict]) -> Tuple[Dict[str, Any], ...]:
+        records = []
+        for order in self._entries[queue].values():
+            cache_key = (queue, key_of(order))
+            snap = self._frozen.get(cache_key)
+            # 內容沒變就沿用上次的快照物件 (dict 比較只看欄位值，不複製)
+            if snap is None or snap != order:
+                snap = FrozenDict(order)
+            frozen[cache_key] = snap
+            records.append(snap)
+        return tuple(records)
+
+    def snapshot(self) -> Tuple[Tuple[Dict[str, Any], ...], Tuple[Dict[str, Any], ...]]:
+        """回傳 (orders, rush_orders) 的唯讀快照，給 LangGraph 的 AgentState 使用。"""
+        frozen: Dict[Tuple[str, str], FrozenDict] = {}
+        result = (self._snapshot_queue(self.NORMAL, frozen), self._snapshot_queue(self.RUSH, frozen))
+        self._frozen = frozen
+        return result
+
+    def count(self, rush: bool = False) -> int:
+        return len(self._entries[self._queue(rush)])
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        yield from self._entries[self.NORMAL].values()
+        yield from self._entries[self.RUSH].values()
+
+    def __len__(self) -> int:
+        return self.count() + self.count(rush=True)
@@ -0,0 +1,202 @@
+import base64
+import hashlib
+import io
+import json
+import os
+import threading
+from typing import List, Dict, Any, Tuple, Optional
+
+from PIL import Image, ImageOps
+from langchain_core.messages import HumanMessage
+
+from agent.order_book import order_from_packing_row
+from agent.tracing import span
+
+# 上傳前的影像前處理：長邊縮到 MAX_SIDE、轉灰階、JPEG 壓縮
+MAX_SIDE = 1600
+JPEG_QUALITY = 70
+
+# 一次模型呼叫最多放幾張 Packing Sheet
+BATCH_SIZE = 4
+
+# 辨識結果快取 (圖片內容 SHA-256 -> 辨識出的資料列)，跨行程保留
+DEFAULT_CACHE_PATH = 'packing_image_cache.json'
+
+ROW_FIELDS = ['order_id', 'priority', 'customer_name', 'product_name', 'quantity', 'pending', 'Order_Date']
+
+
+def image_hash(image_path: str) -> str:
+    """圖片檔案內容的 SHA-256 (同一張照片換檔名也能命中快取)。"""
+    digest = hashlib.sha256()
+    with open(image_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def preprocess_image(image_path: str, max_side: int = MAX_SIDE, quality: int = JPEG_QUALITY) -> bytes:
+    """縮小、轉灰階、壓縮成 JPEG (表格文字辨識不需要顏色與原始解析度)。"""
+    with Image.open(image_path) as img:
+        img = ImageOps.exif_transpose(img)
+        img = img.convert('L')
+        img.thumbnail((max_side, max_side))
+        buffer = io.BytesIO()
+        img.save(buffer, format='JPEG', quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+def encode_image(image_path: str) -> str:
+    """前處理後的 base64 字串。"""
+    return base64.b64encode(preprocess_image(image_path)).decode('utf-8')
+
+
+def _strip_code_fence(text: str) -> str:
+    text = text.strip()
+    if text.startswith("```json"):
+        text = text[7:]
+    if text.startswith("```"):
+        text = text[3:]
+    if text.endswith("```"):
+        text = text[:-3]
+    return text.strip()
+
+
+class PackingImageCache:
+    """
+    圖片辨識結果快取 (JSON 檔)
+    {hash: {"rows": [...], "ingested": bool}}；ingested 表示這張圖的訂單已經匯入過，避免重複加量。
+    """
+
+    def __init__(self, path: Optional[str] = DEFAULT_CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self._entries = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"⚠️ 圖片辨識快取讀取失敗，重新建立: {e}")
+
+    def get(self, digest: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._entries.get(digest)
+
+    def put(self, digest: str, rows: List[Dict[str, Any]]):
+        with self._lock:
+            self._entries[digest] = {"rows": rows, "ingested": False}
+            self._save()
+
+    def mark_ingested(self, digests: List[str]):
+        with self._lock:
+            for digest in digests:
+                if digest in self._entries:
+                    self._entries[digest]["ingested"] = True
+            self._save()
+
+    def _save(self):
+        """寫回 JSON 檔 (呼叫端需持有 self._lock)。"""
+        if not self.path:
+            return
+        try:
+            # 先寫暫存檔再取代，避免寫到一半中斷留下壞檔
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._entries, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"⚠️ 圖片辨識快取寫入失敗: {e}")
+
+
+IMAGE_CACHE = PackingImageCache()
+
+
+def _batch_prompt(count: int) -> str:
+    return f"""你是工廠 Packing Sheet 辨識專家。以下依序附上 {count} 張 Packing Sheet 圖片 (編號 1 ~ {count})。
+
+請把每張圖片表格中的每一列訂單轉成 JSON，欄位如下 (看不到的欄位填空字串)：
+{", ".join(ROW_FIELDS)}
+- priority: 有標示急單/RUSH 的填 "rush"，否則填 "normal"
+- quantity / pending: 保留原始數字 (例如 "1,200 PCS")
+
+【重要】請務必回傳有效的 JSON 格式，結構如下：
+{{
+  "sheets": [
+    {{"image": 1, "rows": [{{"order_id": "...", "product_name": "...", "quantity": "...", ...}}]}},
+    {{"image": 2, "rows": []}}
+  ]
+}}
+
+請只回傳 JSON，不要有任何其他文字、解釋或 markdown 標記。"""
+
+
+def _extract_batch(model, paths: List[str]) -> List[List[Dict[str, Any]]]:
+    """把多張圖片放進同一次模型呼叫，回傳每張圖片的資料列 (順序與 paths 相同)。"""
+    content: List[Dict[str, Any]] = [{"type": "text", "text": _batch_prompt(len(paths))}]
+    for path in paths:
+        content.append({"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{encode_image(path)}"}})
+
+    with span('llm.invoke', purpose='packing_image', images=len(paths),
+              bytes_in=sum(len(part.get('image_url', {}).get('url', '')) for part in content)) as sp:
+        response = model.invoke([HumanMessage(content=content)])
+        sp.set(response_chars=len(response.content))
+    parsed = json.loads(_strip_code_fence(response.content))
+
+    rows_by_image: List[List[Dict[str, Any]]] = [[] for _ in paths]
+    for sheet in parsed.get('sheets', []):
+        index = int(sheet.get('image', 0)) - 1
+        if 0 <= index < len(paths):
+            rows_by_image[index] = [
+                {field: str(row.get(field, '') or '') for field in ROW_FIELDS}
+                for row in sheet.get('rows', []) if isinstance(row, dict)
+            ]
+    return rows_by_image
+
+
+def extract_rows(model, image_paths: List[str], cache: PackingImageCache = IMAGE_CACHE,
+                 batch_size: int = BATCH_SIZE) -> List[Tuple[str, str, List[Dict[str, Any]]]]:
+    """
+    辨識多張 Packing Sheet：快取命中的圖片不再送模型，其餘每 batch_size 張合併成一次呼叫。
+    Returns:
+        [(圖片路徑, 內容 hash, 資料列)]，順序與 image_paths 相同
+    """
+    digests = [image_hash(path) for path in image_paths]
+    missing = []
+    seen = set()
+    for path, digest in zip(image_paths, digests):
+        if cache.get(digest) is None and digest not in seen:
+            missing.append((path, digest))
+            seen.add(digest)
+
+    if len(missing) < len(image_paths):
+        print(f"♻️ {len(image_paths) - len(missing)} 張 Packing Sheet 命中辨識快取。")
+
+    for start in range(0, len(missing), batch_size):
+        batch = missing[start:start + batch_size]
+        print(f"🖼️ 正在辨識 {len(batch)} 張 Packing Sheet (1 次模型呼叫)...")
+        rows_by_image = _extract_batch(model, [path for path, _ in batch])
+        for (_, digest), rows in zip(batch, rows_by_image):
+            cache.put(digest, rows)
+
+    return [(path, digest, cache.get(digest)["rows"]) for path, digest in zip(image_paths, digests)]
+
+
+def load_orders_from_images(model, image_paths: List[str], cache: PackingImageCache = IMAGE_CACHE) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """
+    從 Packing Sheet 圖片取得新訂單 (格式與 GoogleSheetsDB.load_new_orders_from_sheet 相同)。
+    已經匯入過的圖片 (同內容) 會略過，避免重複加量。
+    Returns:
+        (新訂單列表, 本次匯入的圖片 hash)
+    """
+    orders: List[Dict[str, Any]] = []
+    ingested: List[str] = []
+    for path, digest, rows in extract_rows(model, image_paths, cache):
+        if cache.get(digest).get("ingested") or digest in ingested:
+            print(f"ℹ️ {os.path.basename(path)} 的訂單已經匯入過，略過。")
+            continue
+        for i, row in enumerate(rows, start=1):
+            order = order_from_packing_row(row, f"{os.path.basename(path)} #{i}")
+            if order is not None:
+                orders.append(order)
+        ingested.append(digest)
+    return orders, ingested
@@ -0,0 +1,194 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from tabulate import tabulate
+
+DEFAULT_PROFILE_DIR = 'profiles'
+DEFAULT_SAMPLE_INTERVAL = 0.005  # 取樣間隔 (秒)
+# Python 3.12 起 cProfile 改用 sys.monitoring：整個直譯器同時只能有一個 profiler，主執行緒的 profiler 已經涵蓋所有執行緒
+PER_THREAD_PROFILES = sys.version_info < (3, 12)
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _short_path(filename: str) -> str:
+    """專案內的檔案用相對路徑，第三方套件從套件名稱開始 (例如 langgraph/pregel/main.py)。"""
+    if filename.startswith(_ROOT):
+        return os.path.relpath(filename, _ROOT)
+    marker = 'site-packages' + os.sep
+    if marker in filename:
+        return filename.split(marker, 1)[1]
+    return os.path.join(os.path.basename(os.path.dirname(filename)), os.path.basename(filename))
+
+
+def _frame_label(code) -> str:
+    """collapsed stack 的 frame 名稱：函式 (檔案:行號)。"""
+    return f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})".replace(';', ',')
+
+
+class StackSampler:
+    """
+    取樣式 profiler：背景執行緒每 interval 秒抓一次所有執行緒的 call stack (sys._current_frames)，
+    累計成 collapsed stack 格式 (flamegraph.pl / speedscope 可直接讀取)。
+    LangGraph 並行分支在 worker 執行緒執行，取樣可以一起看到；
+    完全沒有專案程式碼的 stack (閒置的執行緒池、寄信執行緒在等佇列) 不記錄。
+    """
+
+    def __init__(self, interval: float = DEFAULT_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _sample(self):
+        own = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            labels = []
+            in_project = False
+            while frame is not None:
+                in_project = in_project or frame.f_code.co_filename.startswith(_ROOT)
+                labels.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            if not in_project:
+                continue
+            labels.append(names.get(ident, f"thread-{ident}"))
+            self.stacks[';'.join(reversed(labels))] += 1
+        self.samples += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def write_collapsed(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class PipelineProfiler:
+    """
+    --profile 模式：一次重排的完整 profile
+    - cProfile (deterministic)：主執行緒一個 profiler，在 worker 執行緒跑的節點各自一個，最後合併成一份 pstats
+      (Python 3.12+ 只有主 profiler，它本身就會記錄 worker 執行緒)
+    - StackSampler：所有執行緒的 collapsed stacks
+    - 每個節點 / 階段的 wall time 與 CPU time (兩者差距大代表在等網路 / LLM)
+    """
+
+    def __init__(self, interval: float = DEFAULT_SAMPLE_INTERVAL):
+        self._main_profile = cProfile.Profile()
+        self._main_thread: Optional[int] = None
+        self._node_profiles: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+        self.sampler = StackSampler(interval)
+        # (類別, 名稱, wall 秒, CPU 秒)
+        self.timings: List[Tuple[str, str, float, float]] = []
+
+    @contextmanager
+    def profile(self):
+        self._main_thread = threading.get_ident()
+        self.sampler.start()
+        self._main_profile.enable()
+        try:
+            yield self
+        finally:
+            self._main_profile.disable()
+            self.sampler.stop()
+            self._main_thread = None
+
+    @contextmanager
+    def phase(self, name: str):
+        """主流程的一個階段 (CPU 為整個行程，包含 worker 執行緒)。"""
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            self._add('phase', name, time.perf_counter() - wall, time.process_time() - cpu)
+
+    def _add(self, kind: str, name: str, wall: float, cpu: float):
+        with self._lock:
+            self.timings.append((kind, name, wall, cpu))
+
+    def wrap_node(self, name: str, fn):
+        """包裝 LangGraph 節點：記錄 wall / CPU (執行緒 CPU)；在 worker 執行緒時另外用 cProfile 記錄 (Python 3.12 之前)。"""
+        def wrapper(state):
+            profile = None
+            if PER_THREAD_PROFILES and self._main_thread is not None and threading.get_ident() != self._main_thread:
+                profile = cProfile.Profile()
+            wall, cpu = time.perf_counter(), time.thread_time()
+            if profile:
+                try:
+                    profile.enable()
+                except ValueError:
+                    # 已經有其他 profiler 在執行 (Another profiling tool is already active)：交給主 profiler
+                    profile = None
+            try:
+                return fn(state)
+            finally:
+                if profile:
+                    profile.disable()
+                    with self._lock:
+                        self._node_profiles.append(profile)
+                self._add('node', name, time.perf_counter() - wall, time.thread_time() - cpu)
+
+        wrapper.__name__ = getattr(fn, '__name__', name)
+        wrapper.__doc__ = fn.__doc__
+        return wrapper
+
+    def stats(self) -> pstats.Stats:
+        stats = pstats.Stats(self._main_profile, stream=io.StringIO())
+        for profile in self._node_profiles:
+            stats.add(profile)
+        return stats
+
+    def write(self, out_dir: str = DEFAULT_PROFILE_DIR, prefix: str = 'reschedule') -> Dict[str, str]:
+        """輸出 <prefix>-<時間>.pstats / .collapsed / .txt (前 40 名累計耗時)。"""
+        os.makedirs(out_dir, exist_ok=True)
+        base = os.path.join(out_dir, f"{prefix}-{datetime.now().strftime('%Y%m%d-%H%M%S')}")
+        paths = {"pstats": f"{base}.pstats", "collapsed": f"{base}.collapsed", "summary": f"{base}.txt"}
+
+        stats = self.stats()
+        stats.dump_stats(paths["pstats"])
+        self.sampler.write_collapsed(paths["collapsed"])
+
+        buffer = io.StringIO()
+        buffer.write(self.report() + "\n\n")
+        pstats.Stats(paths["pstats"], stream=buffer).sort_stats('cumulative').print_stats(40)
+        with open(paths["summary"], 'w', encoding='utf-8') as f:
+            f.write(buffer.getvalue())
+        return paths
+
+    def report(self) -> str:
+        with self._lock:
+            timings = list(self.timings)
+        if not timings:
+            return "Profile：尚無紀錄。"
+        rows = [
+            {"類別": kind, "名稱": name, "wall_s": round(wall, 3), "cpu_s": round(cpu, 3),
+             "等待_s": round(max(0.0, wall - cpu), 3), "CPU 比例": f"{cpu / wall:.0%}" if wall > 0 else '-'}
+            for kind, name, wall, cpu in timings
+        ]
+        return (f"⏱️ Wall / CPU 時間 (取樣 {self.sampler.samples} 次)\n"
+                + tabulate(rows, headers="keys", tablefmt="grid"))
@@ -0,0 +1,138 @@
+import numpy as np
+import pandas as pd
+from typing import List, Dict, Any
+
+# 排程列 Product 欄位前面的完工標記 (見 nodes.calculate_schedule)
+STATUS_PREFIX_PATTERN = r'(?:✅ |☑️ |💡 )'
+
+PROGRESS_COLUMNS = [
+    'order_key', 'order_id', 'product', 'due_date', 'total_qty',
+    'planned_output', 'actual_output', 'planned_percent', 'actual_percent', 'gap_qty', 'lagging_qty'
+]
+TASK_COLUMNS = ['order_key', 'display_name', 'order_id', 'raw_product', 'planned_output', 'line']
+
+
+def parse_day_numbers(days: pd.Series) -> pd.Series:
+    """把 'Day 12' 這類字串一次轉成整數 (無法解析的為 NaN)。"""
+    return pd.to_numeric(days.astype(str).str.extract(r'(\d+)\s*$', expand=False), errors='coerce')
+
+
+def order_keys(order_ids: pd.Series, products: pd.Series) -> pd.Series:
+    """向量化版本的 order_book.order_key：有 order_id 用 'order_id|產品'，否則用產品名稱。"""
+    order_ids = order_ids.fillna('').astype(str)
+    products = products.fillna('').astype(str)
+    return products.where(order_ids == '', order_ids + '|' + products)
+
+
+def planned_tasks_frame(last_schedule: List[Dict[str, Any]], days_to_check: int) -> pd.DataFrame:
+    """
+    從上次排程結果取出 Day 1 ~ days_to_check 的計畫，依 (訂單, 工序) 彙總計畫產量。
+    回傳欄位: TASK_COLUMNS
+    """
+    if not last_schedule:
+        return pd.DataFrame(columns=TASK_COLUMNS)
+
+    df = pd.DataFrame.from_records(last_schedule)
+    for col in ('Day', 'order_id', 'Product', 'Raw_Product_Name', 'Line'):
+        if col not in df.columns:
+            df[col] = ''
+    if 'Output' not in df.columns:
+        df['Output'] = 0
+
+    # 1. 只解析一次 Day，過濾到指定天數
+    day_num = parse_day_numbers(df['Day'])
+    df = df[day_num.notna() & (day_num <= days_to_check)]
+
+    # 2. 沒有產品資訊的列不計入
+    df = df[(df['Raw_Product_Name'].fillna('') != '') & (df['Product'].fillna('') != '')]
+    if df.empty:
+        return pd.DataFrame(columns=TASK_COLUMNS)
+
+    df = df.assign(
+        order_key=order_keys(df['order_id'], df['Raw_Product_Name']),
+        display_name=df['Product'].astype(str).str.replace(STATUS_PREFIX_PATTERN, '', regex=True),
+        Output=pd.to_numeric(df['Output'], errors='coerce').fillna(0).astype(np.int64),
+        order_id=df['order_id'].fillna('').astype(str),
+    )
+
+    # 3. 依 (訂單, 工序) 分組
+    tasks = (
+        df.groupby(['order_key', 'display_name'], sort=False)
+          .agg(order_id=('order_id', 'first'),
+               raw_product=('Raw_Product_Name', 'first'),
+               planned_output=('Output', 'sum'),
+               line=('Line', 'first'))
+          .reset_index()
+    )
+    tasks['line'] = tasks['line'].replace('', 'N/A')
+    return tasks[TASK_COLUMNS]
+
+
+def orders_frame(orders: List[Dict[str, Any]]) -> pd.DataFrame:
+    """把訂單列表轉成以 order_key 為索引的 DataFrame。"""
+    df = pd.DataFrame.from_records(orders) if orders else pd.DataFrame()
+    for col in ('order_id', 'product', 'due_date'):
+        if col not in df.columns:
+            df[col] = ''
+    if 'qty' not in df.columns:
+        df['qty'] = np.nan
+    df['qty'] = pd.to_numeric(df['qty'], errors='coerce')
+    if 'qty_remaining' not in df.columns:
+        df['qty_remaining'] = df['qty']
+    df['qty_remaining'] = pd.to_numeric(df['qty_remaining'], errors='coerce').fillna(df['qty'])
+    df['order_key'] = order_keys(df['order_id'], df['product'])
+    # 同一 order_key 以第一筆為準 (與 OrderBook.get 一致)
+    return df.drop_duplicates('order_key', keep='first').set_index('order_key')
+
+
+def compute_progress(last_schedule: List[Dict[str, Any]], orders: List[Dict[str, Any]], days_to_check: int) -> Dict[str, pd.DataFrame]:
+    """
+    應做 / 實作 對帳引擎 (不含任何輸出，可供非互動呼叫端重用)。
+
+    Returns:
+        {"progress": 每筆訂單一列 (PROGRESS_COLUMNS，依 order_key 排序),
+         "tasks": 每個 (訂單, 工序) 一列 (TASK_COLUMNS)}
+    """
+    tasks = planned_tasks_frame(last_schedule, days_to_check)
+    if tasks.empty:
+        return {"progress": pd.DataFrame(columns=PROGRESS_COLUMNS), "tasks": tasks}
+
+    planned = tasks.groupby('order_key')['planned_output'].sum().rename('planned_output')
+    order_df = orders_frame(orders)
+
+    # 與訂單 join，只保留總量 > 0 的訂單
+    df = order_df.join(planned, how='inner')
+    df = df[df['qty'].notna() & (df['qty'] > 0)]
+
+    total = df['qty'].to_numpy(dtype=np.float64)
+    planned_output = df['planned_output'].to_numpy(dtype=np.int64)
+    actual_output = (df['qty'] - df['qty_remaining']).to_numpy(dtype=np.float64).astype(np.int64)
+    gap = planned_output - actual_output
+
+    progress = pd.DataFrame({
+        'order_key': df.index,
+        'order_id': df['order_id'].fillna('').astype(str).to_numpy(),
+        'product': df['product'].to_numpy(),
+        'due_date': df['due_date'].fillna('').to_numpy(),
+        'total_qty': total.astype(np.int64),
+        'planned_output': planned_output,
+        'actual_output': actual_output,
+        'planned_percent': np.round(planned_output / total * 100, 1),
+        'actual_percent': np.round(actual_output / total * 100, 1),
+        'gap_qty': gap,
+        'lagging_qty': np.maximum(gap, 0),
+    })
+    progress = progress.sort_values('order_key', kind='stable').reset_index(drop=True)
+    return {"progress": progress[PROGRESS_COLUMNS], "tasks": tasks}
+
+
+def status_labels(gap_qty: pd.Series) -> pd.Series:
+    """依落後量產生狀態文字 (達標 / 落後 / 超前)。"""
+    gap = gap_qty.to_numpy()
+    labels = np.select(
+        [gap > 0, gap < 0],
+        [np.char.add(np.char.add("❌ 落後 ", gap.astype(str)), " pcs"),
+         np.char.add(np.char.add("🔥 超前 ", np.abs(gap).astype(str)), " pcs")],
+        default="✅ 達標"
+    )
+    return pd.Series(labels, index=gap_qty.index)
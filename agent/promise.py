@@ -0,0 +1,187 @@
+"""
+交期試算 (Order Promise / ETA)
+
+業務詢問「今天接 L503 20k，什麼時候能出貨？」時，不必把訂單加進去重跑整個排程 (含 LLM)：
+- CapacityProfile：從目前排程結果預先算好每天剩下的人力與大工序產線數 (排程沒用到的天數依產能行事曆為全產能)
+- quote_order()：把假設訂單的工序插進剩餘產能逐日模擬 (規則與 _run_global_simulation 相同)，回傳預計完工日
+只讀取排程與產能資料，不修改訂單 / 排程，也不呼叫 Sheets 或 LLM；既有訂單不讓出產能 (插單不插隊)。
+"""
+import re
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Mapping, Optional
+
+from agent.allocation import people_needed, produced_qty
+from agent.capacity import DEFAULT_MAX_LINES, CapacityCalendar
+from agent.due_date import parse_due_date
+from agent.inventory import Inventory, headcount_class, line_score, model_codes
+
+# 試算最多往後看幾天
+MAX_QUOTE_DAYS = 365
+
+_DAY_RE = re.compile(r'(\d+)\s*$')
+
+
+class CapacityProfile:
+    """
+    排程的每日剩餘產能 (唯讀)。
+    people_left[i] / lines_left[i] 為排程 Day i+1 剩下的人力 / 大工序產線數；None 表示排程那天沒有工作 (全產能)。
+    """
+
+    def __init__(self, schedule: Iterable[Dict[str, Any]], inventory: Inventory, calendar: CapacityCalendar,
+                 settings: Mapping[str, str], schedule_date: Optional[date] = None):
+        self.calendar = calendar
+        # 排程結果有 Date 欄位時以它對齊 Day N 的日期，否則用 schedule_date (上次排程日期)
+        self.schedule_date = schedule_date or date.today()
+        try:
+            self.max_people = int(settings.get('MAX_HEADCOUNT', 40))
+            self.work_hours = int(settings.get('WORK_HOURS_PER_DAY', 8))
+        except (TypeError, ValueError):
+            self.max_people, self.work_hours = 40, 8
+
+        used_people: Dict[int, int] = {}
+        used_lines: Dict[int, int] = {}
+        idle: Dict[int, int] = {}
+        anchored = None
+        for row in schedule:
+            match = _DAY_RE.search(str(row.get('Day', '')))
+            if not match:
+                continue
+            day = int(match.group(1))
+            if row.get('Date') and anchored is None:
+                anchored = parse_due_date(row['Date'])
+                if anchored:
+                    self.schedule_date = anchored - timedelta(days=day - 1)
+            headcount = int(row.get('Headcount') or 0)
+            used_people[day] = used_people.get(day, 0) + headcount
+            spec = inventory.get(row.get('plan_to', ''))
+            if (spec and headcount_class(spec['headcount']) == 'large') or (not spec and headcount_class(headcount) == 'large'):
+                used_lines[day] = used_lines.get(day, 0) + 1
+            if row.get('Idle_People') not in (None, ''):
+                idle[day] = int(row['Idle_People'])
+
+        horizon = max(used_people, default=0)
+        self.people_left: List[Optional[int]] = [None] * horizon
+        self.lines_left: List[Optional[int]] = [None] * horizon
+        for day in used_people:
+            capacity = calendar.day(self.schedule_date + timedelta(days=day - 1))
+            total = capacity.headcount if capacity.headcount is not None else self.max_people
+            max_lines = capacity.max_lines if capacity.max_lines is not None else DEFAULT_MAX_LINES
+            self.people_left[day - 1] = idle.get(day, max(0, total - used_people[day]))
+            self.lines_left[day - 1] = max(0, max_lines - used_lines.get(day, 0))
+
+    @property
+    def horizon(self) -> int:
+        return len(self.people_left)
+
+    def residual(self, when: date):
+        """某一天的 (產能設定, 剩餘人力, 剩餘大工序產線數)。"""
+        capacity = self.calendar.day(when)
+        index = (when - self.schedule_date).days
+        people = self.people_left[index] if 0 <= index < self.horizon else None
+        lines = self.lines_left[index] if 0 <= index < self.horizon else None
+        if people is None:
+            people = capacity.headcount if capacity.headcount is not None else self.max_people
+            lines = capacity.max_lines if capacity.max_lines is not None else DEFAULT_MAX_LINES
+        return capacity, people, lines
+
+
+def resolve_processes(product: str, inventory: Inventory, known: Optional[Mapping[str, List[str]]] = None) -> List[str]:
+    """產品名稱 -> 工序：工序名稱本身、LLM 匹配快取，最後以型號代碼 (inventory.by_model) 推估。"""
+    if product in inventory:
+        return [product]
+    if known and known.get(product):
+        return [key for key in known[product] if key in inventory]
+    processes: List[str] = []
+    for code in model_codes(product):
+        for key in inventory.by_model.get(code, ()):
+            if key not in processes:
+                processes.append(key)
+    return processes
+
+
+def quote_order(product: str, qty: int, profile: CapacityProfile, inventory: Inventory,
+                processes: Optional[List[str]] = None, start: Optional[date] = None,
+                due_date: Any = None, known: Optional[Mapping[str, List[str]]] = None) -> Dict[str, Any]:
+    """
+    試算 product 數量 qty 從 start (預設今天) 開始投產的預計完工日。
+    回傳 {"completion_day", "completion_date", "processes": [...], "on_time", ...}；無法完成時 completion_date 為 ''。
+    """
+    started = time.perf_counter()
+    if qty <= 0:
+        raise ValueError("數量必須大於零。")
+    processes = processes or resolve_processes(product, inventory, known)
+    unknown = [p for p in processes if p not in inventory]
+    if not processes or unknown:
+        raise ValueError(f"找不到產品【{product}】對應的工序{': ' + ', '.join(unknown) if unknown else ''}。")
+
+    start = start or date.today()
+    jobs = [{
+        "process": key,
+        "line": inventory[key].get('line', 'Line 1'),
+        "uph": inventory[key]['uph'],
+        "headcount": inventory[key]['headcount'],
+        "large": headcount_class(inventory[key]['headcount']) == 'large',
+        "qty_remaining": qty,
+        "finish": None,
+    } for key in processes]
+    # 與排程器相同：大工序先排，再依優先產線 / 人力多的排序
+    jobs.sort(key=lambda j: (not j['large'], line_score(j['line']), -j['headcount']))
+
+    day = 0
+    pending = list(jobs)
+    while pending and day < MAX_QUOTE_DAYS:
+        when = start + timedelta(days=day)
+        day += 1
+        capacity, people, lines = profile.residual(when)
+        if not capacity.workday:
+            continue
+        next_pending = []
+        for job in pending:
+            hours = capacity.hours_for(job['line'], profile.work_hours)
+            if hours <= 0 or people < job['headcount'] or (job['large'] and lines <= 0):
+                next_pending.append(job)
+                continue
+            assign = job['headcount']
+            if not job['large']:
+                # 小工序可以增派閒置人力加速，最多派到今天做完所需的人數 (與排程器相同)
+                assign = people_needed(job['qty_remaining'], hours, job['uph'], job['headcount'], people)
+            produced = produced_qty(hours, job['uph'], assign, job['headcount'])
+            if produced <= 0:
+                next_pending.append(job)
+                continue
+            people -= assign
+            if job['large']:
+                lines -= 1
+            job['qty_remaining'] -= produced
+            if job['qty_remaining'] > 0:
+                next_pending.append(job)
+            else:
+                job['finish'] = when
+        pending = next_pending
+
+    finished = not pending
+    completion = max(j['finish'] for j in jobs) if finished else None
+    due = parse_due_date(due_date)
+    return {
+        "product": product,
+        "qty": qty,
+        "start_date": start.isoformat(),
+        "completion_day": f"Day {(completion - start).days + 1}" if completion else '',
+        "completion_date": completion.isoformat() if completion else '',
+        "calendar_days": (completion - start).days + 1 if completion else None,
+        "due_date": due.isoformat() if due else '',
+        "on_time": (completion <= due) if (completion and due) else None,
+        "processes": [{"process": j['process'], "line": j['line'],
+                       "finish_date": j['finish'].isoformat() if j['finish'] else ''} for j in jobs],
+        "message": '' if finished else f"{MAX_QUOTE_DAYS} 天內無法完成 (剩餘產能不足)。",
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
+
+
+def schedule_date_of(last_schedule_date: Any) -> date:
+    """排程 Day 1 的日期 (上次排程日期，無法解析時為今天)。"""
+    try:
+        return datetime.strptime(str(last_schedule_date), "%Y-%m-%d").date()
+    except ValueError:
+        return date.today()
@@ -0,0 +1,187 @@
+import csv
+import unicodedata
+from collections import OrderedDict
+from openpyxl import Workbook
+from typing import List, Dict, Any, Iterable, Iterator, TextIO, Optional
+
+# 排程報告欄位順序 (與 Google Sheets 寫入順序一致)
+SCHEDULE_COLUMNS = ["Day", "Product", "Headcount", "Actual_Hours", "plan_to", "Output", "Complete_Percent", "Idle_People", "Status", "Note", "priority"]
+
+# 每日摘要欄位
+DAY_SUMMARY_COLUMNS = ["Day", "工序數", "總產量", "使用人力", "閒置人力", "急單工序", "完工工序"]
+
+REPORT_FOOTER = "備註: Headcount = 該工序所需人力; Actual_Hours = 該工序耗用工時; Complete_Percent = 該訂單總進度; plan_to = 計劃執行工序/機台。"
+
+CHUNK_SIZE = 500
+
+
+def display_width(text: str) -> int:
+    """終端機顯示寬度 (中文、emoji 佔 2 格，組合字元佔 0 格)。"""
+    width = 0
+    for ch in text:
+        if unicodedata.combining(ch) or ch == '\ufe0f':
+            continue
+        width += 2 if unicodedata.east_asian_width(ch) in ('W', 'F') else 1
+    return width
+
+
+def _pad(text: str, width: int, align_right: bool) -> str:
+    padding = ' ' * max(0, width - display_width(text))
+    return padding + text if align_right else text + padding
+
+
+def _cell(value: Any) -> str:
+    return '' if value is None else str(value)
+
+
+def iter_rows(schedule: Iterable[Dict[str, Any]], columns: List[str]) -> Iterator[List[str]]:
+    """把排程結果逐列轉成字串 list (不建立 DataFrame)。"""
+    for task in schedule:
+        yield [_cell(task.get(c, '')) for c in columns]
+
+
+class FixedWidthWriter:
+    """
+    以固定欄寬、分批 (chunk) 的方式把表格串流寫到檔案 (psql 風格)。
+    欄寬只掃描一次資料長度，不會把整張表組成一個大字串。
+    """
+
+    def __init__(self, fh: TextIO, columns: List[str], widths: List[int], numeric: Optional[List[bool]] = None, chunk_size: int = CHUNK_SIZE):
+        self.fh = fh
+        self.columns = columns
+        self.widths = widths
+        self.numeric = numeric or [False] * len(columns)
+        self.chunk_size = chunk_size
+        self._border = '+' + '+'.join('-' * (w + 2) for w in widths) + '+\n'
+
+    @classmethod
+    def for_rows(cls, fh: TextIO, columns: List[str], rows: Iterable[List[str]], **kwargs) -> 'FixedWidthWriter':
+        """依資料計算欄寬 (欄位名稱與每一格的最大顯示寬度)；rows 只走訪一次，不保留。"""
+        widths = [display_width(c) for c in columns]
+        numeric = [True] * len(columns)
+        for row in rows:
+            for i, text in enumerate(row):
+                w = display_width(text)
+                if w > widths[i]:
+                    widths[i] = w
+                if numeric[i] and text and not _is_number(text):
+                    numeric[i] = False
+        return cls(fh, columns, widths, numeric, **kwargs)
+
+    def _line(self, cells: List[str], header: bool = False) -> str:
+        parts = [
+            _pad(text, self.widths[i], align_right=(self.numeric[i] and not header))
+            for i, text in enumerate(cells)
+        ]
+        return '| ' + ' | '.join(parts) + ' |\n'
+
+    def write_header(self):
+        self.fh.write(self._border)
+        self.fh.write(self._line(self.columns, header=True))
+        self.fh.write(self._border)
+
+    def write_rows(self, rows: Iterable[List[str]]) -> int:
+        """分批寫入資料列，回傳寫入筆數。"""
+        count = 0
+        chunk = []
+        for row in rows:
+            chunk.append(self._line(row))
+            if len(chunk) >= self.chunk_size:
+                self.fh.write(''.join(chunk))
+                count += len(chunk)
+                chunk = []
+        if chunk:
+            self.fh.write(''.join(chunk))
+            count += len(chunk)
+        return count
+
+    def write_footer(self):
+        self.fh.write(self._border)
+
+    def write_table(self, rows: Iterable[List[str]]) -> int:
+        self.write_header()
+        count = self.write_rows(rows)
+        self.write_footer()
+        return count
+
+
+def _is_number(text: str) -> bool:
+    try:
+        float(text)
+        return True
+    except ValueError:
+        return False
+
+
+def summarize_by_day(schedule: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """把排程明細彙總成每日一列 (主控台預設顯示)。"""
+    days = OrderedDict()
+    for task in schedule:
+        day = task.get('Day', '')
+        info = days.get(day)
+        if info is None:
+            info = days[day] = {
+                "Day": day, "工序數": 0, "總產量": 0, "使用人力": 0,
+                "閒置人力": task.get('Idle_People', 0), "急單工序": 0, "完工工序": 0
+            }
+        info["工序數"] += 1
+        info["總產量"] += task.get('Output', 0) or 0
+        info["使用人力"] += task.get('Headcount', 0) or 0
+        if task.get('Note') == '⚡':
+            info["急單工序"] += 1
+        if task.get('Status') == '完工':
+            info["完工工序"] += 1
+    return list(days.values())
+
+
+def write_table(fh: TextIO, records: List[Dict[str, Any]], columns: List[str], chunk_size: int = CHUNK_SIZE) -> int:
+    """把 dict 列表以固定欄寬表格串流寫到 fh (第一輪只量欄寬，第二輪逐批輸出)。"""
+    writer = FixedWidthWriter.for_rows(fh, columns, iter_rows(records, columns), chunk_size=chunk_size)
+    return writer.write_table(iter_rows(records, columns))
+
+
+def print_day_summary(schedule: List[Dict[str, Any]], fh: TextIO):
+    """主控台預設視圖：每日摘要。"""
+    write_table(fh, summarize_by_day(schedule), DAY_SUMMARY_COLUMNS)
+
+
+def page_schedule_detail(schedule: List[Dict[str, Any]], fh: TextIO, page_size: int = 50, prompt=input):
+    """主控台分頁顯示完整明細；每頁後按 Enter 繼續、輸入 q 離開。"""
+    columns = SCHEDULE_COLUMNS
+    writer = FixedWidthWriter.for_rows(fh, columns, iter_rows(schedule, columns), chunk_size=page_size)
+    total_pages = max(1, -(-len(schedule) // page_size))
+    for page in range(total_pages):
+        writer.write_header()
+        writer.write_rows(iter_rows(schedule[page * page_size:(page + 1) * page_size], columns))
+        writer.write_footer()
+        if page + 1 < total_pages:
+            answer = prompt(f"--- 第 {page + 1}/{total_pages} 頁，按 Enter 繼續，輸入 q 離開 --- ")
+            if answer.strip().lower() == 'q':
+                break
+
+
+def write_txt_report(path: str, schedule: List[Dict[str, Any]], title: str):
+    """串流寫出 .txt 文字報告 (psql 風格表格)。"""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(f"{title}\n\n")
+        write_table(f, schedule, SCHEDULE_COLUMNS)
+        f.write("\n--------------------------------------------------\n")
+        f.write(REPORT_FOOTER + "\n")
+
+
+def write_csv_report(path: str, schedule: Iterable[Dict[str, Any]]):
+    """串流寫出 .csv (utf-8-sig，Excel 可直接開啟)。"""
+    with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(SCHEDULE_COLUMNS)
+        writer.writerows([task.get(c, '') for c in SCHEDULE_COLUMNS] for task in schedule)
+
+
+def write_xlsx_report(path: str, schedule: Iterable[Dict[str, Any]]):
+    """以 openpyxl write-only 模式串流寫出 .xlsx (記憶體用量不隨列數成長)。"""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Schedule")
+    ws.append(SCHEDULE_COLUMNS)
+    for task in schedule:
+        ws.append([task.get(c, '') for c in SCHEDULE_COLUMNS])
+    wb.save(path)
@@ -0,0 +1,181 @@
+"""
+排程風險模擬 (Monte Carlo)
+
+_run_global_simulation 每次都用產能資料的標準 UPH 與滿編人力，結果是確定的；實際產量 (percent 工作表) 差異很大。
+風險模式重複執行上千次加入擾動的排程模擬：
+- UPH：每個工序一個對數常態分布的倍率 (依 UPH 校正檔累計的 實際 / 標準 UPH 歷史估計，沒有資料時用 uph_sigma)
+- 出勤：每天每個人以 absence_rate 的機率缺勤 (二項分布)，透過產能行事曆的每日人力套用到模擬
+每次模擬以 LatenessTracker 記錄各訂單完工日，彙總成 準時機率 與 P50 / P90 完工天數。
+亂數以 NumPy 產生，每次模擬的種子由 (seed, 第幾次) 決定，結果與分幾個行程執行無關；
+runs 多時以 ProcessPoolExecutor 分批平行執行。
+"""
+import math
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+import numpy as np
+
+from agent.capacity import CapacityCalendar, CapacityDay
+from agent.due_date import LatenessTracker
+
+DEFAULT_RUNS = 1000
+DEFAULT_SEED = 42
+DEFAULT_UPH_SIGMA = 0.15       # 沒有實績資料的工序：UPH 倍率的對數標準差
+DEFAULT_ABSENCE_RATE = 0.03    # 每人每天的缺勤機率
+MIN_UPH_FACTOR, MAX_UPH_FACTOR = 0.2, 1.5
+# 每個行程至少分到幾次模擬才值得開行程池
+MIN_RUNS_PER_WORKER = 50
+
+_DAY_RE = re.compile(r'(\d+)\s*$')
+
+
+class UphModel:
+    """各工序 UPH 倍率的對數常態分布參數 (mu, sigma)。"""
+
+    def __init__(self, samples: Optional[Mapping[str, List[float]]] = None, default_sigma: float = DEFAULT_UPH_SIGMA):
+        self.default_sigma = default_sigma
+        self.params: Dict[str, Tuple[float, float]] = {}
+        for process, ratios in (samples or {}).items():
+            logs = np.log(np.asarray(ratios, dtype=np.float64))
+            # 樣本少時標準差不可靠，至少用 default_sigma
+            sigma = max(float(logs.std(ddof=1)) if len(logs) > 1 else 0.0, default_sigma)
+            self.params[process] = (float(logs.mean()), sigma)
+
+    @classmethod
+    def from_log_stats(cls, stats: Mapping[str, Tuple[int, float, float]],
+                       default_sigma: float = DEFAULT_UPH_SIGMA) -> 'UphModel':
+        """由累計的 log 比例統計 (樣本數, 平均, 平方差和) 建立 (UphCalibration.log_ratio_stats())。"""
+        model = cls(default_sigma=default_sigma)
+        for process, (count, mean, m2) in stats.items():
+            if count <= 0:
+                continue
+            sigma = math.sqrt(m2 / (count - 1)) if count > 1 else 0.0
+            model.params[process] = (float(mean), max(sigma, default_sigma))
+        return model
+
+    def arrays(self, processes: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        mu = np.array([self.params.get(p, (0.0, self.default_sigma))[0] for p in processes])
+        sigma = np.array([self.params.get(p, (0.0, self.default_sigma))[1] for p in processes])
+        return mu, sigma
+
+
+class _AbsenceCalendar:
+    """包裝產能行事曆：每天的人力扣掉該次模擬抽到的缺勤人數 (模擬器只呼叫 day())。"""
+
+    def __init__(self, calendar: CapacityCalendar, start_date: date, max_people: int, absences: np.ndarray):
+        self.calendar = calendar
+        self.start = start_date.toordinal()
+        self.max_people = max_people
+        self.absences = absences
+
+    def day(self, when: date) -> CapacityDay:
+        capacity = self.calendar.day(when)
+        index = when.toordinal() - self.start
+        if not capacity.workday or not 0 <= index < len(self.absences):
+            return capacity
+        total = capacity.headcount if capacity.headcount is not None else self.max_people
+        return capacity._replace(headcount=max(0, total - int(self.absences[index])))
+
+
+def _run_batch(args) -> List[Tuple[int, Dict[str, Tuple[int, bool]]]]:
+    """
+    執行一批模擬 (行程池的工作單位)。
+    回傳每次模擬的 (總天數, {order_key: (完工天數 (未完工為 0), 是否準時)})。
+    """
+    jobs, settings, calendar, start_date, uph_model, absence_rate, seed, run_ids = args
+    from agent.nodes import _run_global_simulation, MAX_SIMULATION_DAYS
+
+    processes = sorted({job['display_name'] for job in jobs})
+    column = {name: i for i, name in enumerate(processes)}
+    job_columns = np.array([column[job['display_name']] for job in jobs], dtype=np.int64)
+    base_uph = np.array([job['uph'] for job in jobs], dtype=np.float64)
+    mu, sigma = uph_model.arrays(processes)
+    max_people = int(settings.get('MAX_HEADCOUNT', 40))
+
+    results = []
+    for run_id in run_ids:
+        rng = np.random.default_rng([seed, run_id])
+        factors = np.clip(rng.lognormal(mu, sigma), MIN_UPH_FACTOR, MAX_UPH_FACTOR)
+        uph = base_uph * factors[job_columns]
+        perturbed = [{**job, "uph": float(value)} for job, value in zip(jobs, uph)]
+        absences = rng.binomial(max_people, absence_rate, size=MAX_SIMULATION_DAYS)
+
+        tracker = LatenessTracker()
+        _, pending = _run_global_simulation(perturbed, settings, _AbsenceCalendar(calendar, start_date, max_people, absences),
+                                            start_date, tracker)
+        outcome = {}
+        for key, record in tracker.orders.items():
+            match = _DAY_RE.search(record['finish_day'])
+            finished = int(match.group(1)) if match else 0
+            outcome[key] = (finished, bool(finished) and record['tardiness_days'] == 0)
+        makespan = MAX_SIMULATION_DAYS if pending else max((day for day, _ in outcome.values()), default=0)
+        results.append((makespan, outcome))
+    return results
+
+
+def simulate_risk(jobs: List[Dict[str, Any]], settings: Mapping[str, str], calendar: CapacityCalendar,
+                  start_date: Optional[date] = None, runs: int = DEFAULT_RUNS, seed: int = DEFAULT_SEED,
+                  uph_model: Optional[UphModel] = None, absence_rate: float = DEFAULT_ABSENCE_RATE,
+                  workers: Optional[int] = None) -> Dict[str, Any]:
+    """
+    對 jobs (agent.nodes.build_jobs 的工單) 執行 runs 次擾動排程模擬。
+    Returns:
+        {"orders": [{order_key, order_id, product, due_date, on_time_probability, p50_day, p90_day, unfinished_ratio}],
+         "makespan": {p50, p90}, "runs", "seconds"}
+    """
+    started = time.perf_counter()
+    start_date = start_date or date.today()
+    uph_model = uph_model or UphModel()
+    jobs = [dict(job) for job in jobs if job.get('qty_remaining', 0) > 0]
+    settings = dict(settings)
+
+    workers = workers or os.cpu_count() or 1
+    workers = max(1, min(workers, runs // MIN_RUNS_PER_WORKER))
+    chunk = math.ceil(runs / workers)
+    batches = [(jobs, settings, calendar, start_date, uph_model, absence_rate, seed, range(i, min(runs, i + chunk)))
+               for i in range(0, runs, chunk)]
+    if workers == 1:
+        results = [item for batch in batches for item in _run_batch(batch)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = [item for result in pool.map(_run_batch, batches) for item in result]
+    makespans = np.array([makespan for makespan, _ in results])
+    outcomes = [outcome for _, outcome in results]
+
+    # 訂單基本資料 (單號、產品、截止日)
+    info = LatenessTracker()
+    for job in jobs:
+        info.add_job(job)
+
+    rows = []
+    for key, record in info.orders.items():
+        days = np.array([outcome.get(key, (0, False))[0] for outcome in outcomes], dtype=np.float64)
+        on_time = np.array([outcome.get(key, (0, False))[1] for outcome in outcomes])
+        finished = days > 0
+        # 未完工的模擬視為無限大 (百分位數落在未完工時顯示 None)
+        days[~finished] = np.inf
+        p50, p90 = np.percentile(days, [50, 90], method='higher')
+        rows.append({
+            "order_key": key,
+            "order_id": record['order_id'],
+            "product": record['product'],
+            "due_date": record['due_date'],
+            "on_time_probability": round(float(on_time.mean()), 3) if record['due_date'] else None,
+            "p50_day": int(math.ceil(p50)) if math.isfinite(p50) else None,
+            "p90_day": int(math.ceil(p90)) if math.isfinite(p90) else None,
+            "unfinished_ratio": round(float((~finished).mean()), 3),
+        })
+    rows.sort(key=lambda r: (r['on_time_probability'] if r['on_time_probability'] is not None else 2.0,
+                             -(r['p90_day'] or math.inf), r['order_key']))
+    return {
+        "orders": rows,
+        "makespan": {"p50": int(np.percentile(makespans, 50, method='higher')) if runs else 0,
+                     "p90": int(np.percentile(makespans, 90, method='higher')) if runs else 0},
+        "runs": runs,
+        "workers": workers,
+        "seconds": round(time.perf_counter() - started, 2),
+    }
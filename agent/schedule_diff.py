@@ -0,0 +1,143 @@
+import re
+from typing import List, Dict, Any, Tuple
+
+from agent.order_book import row_key_of
+from agent.progress import STATUS_PREFIX_PATTERN
+
+_STATUS_PREFIX_RE = re.compile('^' + STATUS_PREFIX_PATTERN)
+_DAY_RE = re.compile(r'(\d+)\s*$')
+
+CHANGE_TYPES = ('added', 'removed', 'shifted', 'qty_changed')
+CHANGE_LABELS = {
+    'added': '🆕 新增',
+    'removed': '🗑️ 移除',
+    'shifted': '↔️ 改期',
+    'qty_changed': '🔢 數量變更',
+}
+
+
+def _day_number(day) -> int:
+    match = _DAY_RE.search(str(day))
+    return int(match.group(1)) if match else -1
+
+
+def _process_of(row: Dict[str, Any]) -> str:
+    """工序名稱 (移除 ✅/☑️/💡 完工標記)。"""
+    return row.get('plan_to') or _STATUS_PREFIX_RE.sub('', str(row.get('Product', '')))
+
+
+def index_schedule(schedule: List[Dict[str, Any]], day_offset: int = 0) -> Dict[Tuple[str, str], Dict[int, int]]:
+    """
+    把排程結果索引成 {(order_key, 工序): {day: 產量}}。
+    day_offset: 舊排程距今的天數；舊排程的 Day N 對應到今天的 Day N - day_offset，已過去的天數不納入比較。
+    """
+    index: Dict[Tuple[str, str], Dict[int, int]] = {}
+    for row in schedule:
+        day = _day_number(row.get('Day', '')) - day_offset
+        if day <= 0 and day_offset:
+            continue
+        key = (row_key_of(row), _process_of(row))
+        days = index.get(key)
+        if days is None:
+            days = index[key] = {}
+        days[day] = days.get(day, 0) + int(row.get('Output', 0) or 0)
+    return index
+
+
+def _entry(change: str, key: Tuple[str, str], old: Dict[int, int], new: Dict[int, int]) -> Dict[str, Any]:
+    o_key, process = key
+    order_id, _, product = o_key.partition('|')
+    if not product:
+        order_id, product = '', o_key
+    return {
+        "change": change,
+        "order_id": order_id,
+        "product": product,
+        "process": process,
+        "old_days": sorted(old),
+        "new_days": sorted(new),
+        "old_qty": sum(old.values()),
+        "new_qty": sum(new.values()),
+    }
+
+
+def diff_schedules(old_schedule: List[Dict[str, Any]], new_schedule: List[Dict[str, Any]], day_offset: int = 0) -> Dict[str, Any]:
+    """
+    比較新舊排程，以 (訂單, 工序, Day) 為鍵，一次雜湊索引後線性比對 (O(n))。
+
+    每個 (訂單, 工序) 歸類為:
+        added       新排程才有
+        removed     舊排程才有
+        shifted     排程天數改變 (可能同時改數量)
+        qty_changed 天數相同，但某幾天的產量不同
+
+    Returns:
+        {"added": [...], "removed": [...], "shifted": [...], "qty_changed": [...], "unchanged": 筆數}
+        每筆: {change, order_id, product, process, old_days, new_days, old_qty, new_qty}
+    """
+    old_index = index_schedule(old_schedule or [], day_offset)
+    new_index = index_schedule(new_schedule or [])
+
+    diff: Dict[str, Any] = {change: [] for change in CHANGE_TYPES}
+    unchanged = 0
+
+    for key, new_days in new_index.items():
+        old_days = old_index.get(key)
+        if old_days is None:
+            diff['added'].append(_entry('added', key, {}, new_days))
+        elif old_days.keys() != new_days.keys():
+            diff['shifted'].append(_entry('shifted', key, old_days, new_days))
+        elif old_days != new_days:
+            diff['qty_changed'].append(_entry('qty_changed', key, old_days, new_days))
+        else:
+            unchanged += 1
+
+    for key, old_days in old_index.items():
+        if key not in new_index:
+            diff['removed'].append(_entry('removed', key, old_days, {}))
+
+    diff['unchanged'] = unchanged
+    return diff
+
+
+def count_changes(diff: Dict[str, Any]) -> int:
+    return sum(len(diff.get(change, [])) for change in CHANGE_TYPES)
+
+
+def _day_span(days: List[int]) -> str:
+    if not days:
+        return '-'
+    if len(days) == 1:
+        return f"Day {days[0]}"
+    return f"Day {days[0]}~{days[-1]}"
+
+
+def summarize_diff(diff: Dict[str, Any]) -> str:
+    """一行摘要 (寫入 logs)。"""
+    if not count_changes(diff):
+        return f"排程差異：與上次排程相同 ({diff.get('unchanged', 0)} 項工序未變動)。"
+    parts = [f"{CHANGE_LABELS[c]} {len(diff[c])}" for c in CHANGE_TYPES if diff[c]]
+    return f"排程差異：{'、'.join(parts)}，未變動 {diff.get('unchanged', 0)}。"
+
+
+def format_diff_digest(diff: Dict[str, Any], limit: int = 20) -> str:
+    """通知用的精簡差異內容：每一類最多列出 limit 筆。"""
+    lines = [summarize_diff(diff)]
+    for change in CHANGE_TYPES:
+        entries = diff.get(change, [])
+        if not entries:
+            continue
+        lines.append("")
+        lines.append(f"{CHANGE_LABELS[change]} ({len(entries)})")
+        for e in entries[:limit]:
+            name = f"{e['order_id']} {e['process']}".strip()
+            if change == 'added':
+                detail = f"{_day_span(e['new_days'])}，{e['new_qty']:,} pcs"
+            elif change == 'removed':
+                detail = f"原 {_day_span(e['old_days'])}，{e['old_qty']:,} pcs"
+            else:
+                detail = f"{_day_span(e['old_days'])} → {_day_span(e['new_days'])}，{e['old_qty']:,} → {e['new_qty']:,} pcs"
+            lines.append(f"  - {name}: {detail}")
+        if len(entries) > limit:
+            lines.append(f"  ... 另有 {len(entries) - limit} 筆")
+    return "\n".join(lines)
@@ -0,0 +1,188 @@
+"""
+排程結果的區段壓縮 (run-length)
+
+一個做 40 天的工序在排程結果中是 40 筆幾乎相同的資料列 (只有 Day / Date / Idle_People 不同，最後一天的產量與狀態不同)。
+儲存 (SystemData、排程工作表) 與傳輸 (服務 API) 時改用區段格式，只在需要逐日資料列的地方展開：
+{
+  "format": "spans-v1",
+  "start_date": "2026-10-19",          # Day 1 的日期 (排程沒有 Date 欄位時為 '')
+  "idle": [[1, 5, 0], [6, 6, 3]],      # 每日閒置人力，相同的連續天數合併成 [起始 Day, 結束 Day, 閒置人力]
+  "fields": ["order_id", "Line", ...], # 每天相同的欄位名稱 (工序、人力 ...)
+  "daily": ["Product", "Output", "Actual_Hours", "Status"],  # 每天的產量 / 工時 / 狀態
+  "spans": [[3, 42, [fields 的值], [daily 的值], [最後一天 daily 的值]]]
+}                                      # Day 3 ~ Day 42 每天都有這個工序；最後一天與其他天相同時省略第 5 項
+欄位名稱只存一次 (欄位值為 None 表示該列沒有這個欄位)。
+只有 Day 連續、除最後一天外內容都相同的資料列會合併 (中間遇到假日就分成兩段)。
+expand_schedule() 展開後的資料列與原排程內容、筆數相同；同一天內依區段開始日排序，順序可能與原排程不同。
+"""
+import json
+import re
+from datetime import date, timedelta
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Tuple
+
+SPAN_FORMAT = 'spans-v1'
+
+# 每天可能不同的欄位 (其餘欄位相同才能合併)
+DAILY_FIELDS = ('Product', 'Output', 'Actual_Hours', 'Status')
+# 由區段位置 / idle 表重建的欄位
+DAY_FIELDS = ('Day', 'Date', 'Idle_People')
+
+_DAY_RE = re.compile(r'(\d+)\s*$')
+
+
+def _day_number(day: Any) -> Optional[int]:
+    match = _DAY_RE.search(str(day))
+    return int(match.group(1)) if match else None
+
+
+def is_compressed(value: Any) -> bool:
+    return isinstance(value, Mapping) and value.get('format') == SPAN_FORMAT
+
+
+def compress_schedule(schedule: List[Mapping[str, Any]]) -> Dict[str, Any]:
+    """排程結果 (逐日資料列) -> 區段格式。Day 無法解析的資料列各自成為一個單日區段 (起始 Day 存原本的文字)。"""
+    start_date = ''
+    idle: List[List[int]] = []
+    columns: Dict[str, int] = {}
+    spans: List[List[Any]] = []
+    # 同一個工序 (其餘欄位相同) 目前還能延長的區段
+    open_spans: Dict[Tuple, List[Any]] = {}
+
+    for row in schedule:
+        for k in row:
+            if k not in DAY_FIELDS and k not in DAILY_FIELDS and k not in columns:
+                columns[k] = len(columns)
+        fields = [row.get(k) for k in columns]
+        daily = [row.get(k) for k in DAILY_FIELDS]
+        day = _day_number(row.get('Day', ''))
+        if day is None:
+            spans.append([row.get('Day', ''), None, fields, daily])
+            continue
+
+        if not start_date and row.get('Date'):
+            try:
+                start_date = (date.fromisoformat(str(row['Date'])) - timedelta(days=day - 1)).isoformat()
+            except ValueError:
+                pass
+        if row.get('Idle_People') not in (None, ''):
+            people = row['Idle_People']
+            if idle and idle[-1][1] == day - 1 and idle[-1][2] == people:
+                idle[-1][1] = day
+            elif not idle or idle[-1][1] < day:
+                idle.append([day, day, people])
+
+        key = tuple(fields)
+        span = open_spans.get(key)
+        if span is not None and span[1] == day - 1:
+            span[1] = day
+            if daily != span[3]:
+                # 與前幾天不同：當作這個區段的最後一天，之後的資料列另開新區段
+                span.append(daily)
+                del open_spans[key]
+            continue
+        span = [day, day, fields, daily]
+        spans.append(span)
+        open_spans[key] = span
+
+    # 後面才出現的欄位：前面的區段補上 None
+    for span in spans:
+        span[2].extend([None] * (len(columns) - len(span[2])))
+    return {"format": SPAN_FORMAT, "start_date": start_date, "idle": idle,
+            "fields": list(columns), "daily": list(DAILY_FIELDS), "spans": spans}
+
+
+def _values(names: List[str], values: List[Any]) -> Dict[str, Any]:
+    return {k: v for k, v in zip(names, values) if v is not None}
+
+
+def expand_schedule(payload: Mapping[str, Any], until_day: Optional[int] = None) -> List[Dict[str, Any]]:
+    """區段格式 -> 逐日資料列 (until_day: 只展開到 Day N，進度追蹤等只需要前幾天的地方用)。"""
+    start = date.fromisoformat(payload['start_date']) if payload.get('start_date') else None
+    has_idle = bool(payload.get('idle'))
+    idle = {day: people for first, last, people in payload.get('idle', []) for day in range(first, last + 1)}
+    names, daily_names = payload.get('fields', []), payload.get('daily', list(DAILY_FIELDS))
+
+    rows: List[Tuple[int, int, Dict[str, Any]]] = []
+    for index, span in enumerate(payload.get('spans', [])):
+        first, last, fields, daily = span[:4]
+        fields, daily = _values(names, fields), _values(daily_names, daily)
+        if last is None:
+            rows.append((-1, index, {"Day": first, **fields, **daily}))
+            continue
+        final = _values(daily_names, span[4]) if len(span) > 4 else daily
+        end = last if until_day is None else min(last, until_day)
+        for day in range(first, end + 1):
+            row = {"Day": f"Day {day}"}
+            if start is not None:
+                row["Date"] = (start + timedelta(days=day - 1)).isoformat()
+            row.update(fields)
+            row.update(final if day == last else daily)
+            if has_idle:
+                row["Idle_People"] = idle.get(day, '')
+            rows.append((day, index, row))
+    rows.sort(key=lambda item: (item[0], item[1]))
+    return [row for _, _, row in rows]
+
+
+# 排程工作表 spans 版面：每個區段一列 (每天相同的欄位 + 起訖 Day + 每日 / 最後一天的產量)
+SPAN_SHEET_COLUMNS = ['Start_Day', 'End_Day', 'Days', 'order_id', 'Product', 'Raw_Product_Name', 'Headcount',
+                      'plan_to', 'Daily_Output', 'Daily_Hours', 'Last_Output', 'Last_Hours', 'Complete_Percent',
+                      'Status', 'Note', 'priority']
+_SPAN_SHEET_ONLY = ('Start_Day', 'End_Day', 'Days', 'Product', 'Daily_Output', 'Daily_Hours', 'Last_Output',
+                    'Last_Hours', 'Status')
+
+
+def iter_span_rows(payload: Mapping[str, Any]) -> Iterator[Dict[str, Any]]:
+    """區段格式 -> spans 版面的每一列 (Product / Status 為最後一天的顯示名稱與狀態)。"""
+    names, daily_names = payload.get('fields', []), payload.get('daily', list(DAILY_FIELDS))
+    for span in payload.get('spans', []):
+        first, last, fields, daily = span[:4]
+        daily = _values(daily_names, daily)
+        final = _values(daily_names, span[4]) if len(span) > 4 else daily
+        yield {
+            **_values(names, fields),
+            "Start_Day": f"Day {first}" if last is not None else first,
+            "End_Day": f"Day {last}" if last is not None else first,
+            "Days": last - first + 1 if last is not None else 1,
+            "Product": final.get('Product', ''),
+            "Daily_Output": daily.get('Output', ''),
+            "Daily_Hours": daily.get('Actual_Hours', ''),
+            "Last_Output": final.get('Output', ''),
+            "Last_Hours": final.get('Actual_Hours', ''),
+            "Status": final.get('Status', ''),
+        }
+
+
+def spans_from_rows(records: List[Mapping[str, Any]], start_date: str = '') -> Dict[str, Any]:
+    """
+    spans 版面讀回來的資料列 -> 區段格式 (iter_span_rows 的反向)。
+    多天的區段中，最後一天以外的 Product 為工序名稱 (plan_to)、Status 為 進行中 (排程器只在完工那天加上標記)。
+    """
+    names = [k for k in (records[0] if records else {}) if k not in _SPAN_SHEET_ONLY]
+    spans: List[List[Any]] = []
+    for record in records:
+        fields = [record.get(k) for k in names]
+        first, last = _day_number(record.get('Start_Day', '')), _day_number(record.get('End_Day', ''))
+        final = [record.get('Product', ''), record.get('Last_Output', ''), record.get('Last_Hours', ''), record.get('Status', '')]
+        if first is None or last is None:
+            spans.append([record.get('Start_Day', ''), None, fields, final])
+        elif first == last:
+            spans.append([first, last, fields, final])
+        else:
+            daily = [record.get('plan_to') or record.get('Product', ''), record.get('Daily_Output', ''),
+                     record.get('Daily_Hours', ''), '進行中']
+            spans.append([first, last, fields, daily, final])
+    return {"format": SPAN_FORMAT, "start_date": start_date, "idle": [],
+            "fields": names, "daily": list(DAILY_FIELDS), "spans": spans}
+
+
+def schedule_rows(value: Any) -> List[Dict[str, Any]]:
+    """SystemData 中的 last_schedule_results (舊版的逐日資料列、區段格式或其 JSON 字串) -> 逐日資料列。"""
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return []
+    if is_compressed(value):
+        return expand_schedule(value)
+    return list(value) if isinstance(value, list) else []
@@ -3,55 +3,304 @@ import configparser
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import os
+import atexit
+import queue
+import threading
+import time
+from typing import List, Tuple, Optional
+
+DEFAULT_SMTP_HOST = 'smtp.gmail.com'
+DEFAULT_SMTP_PORT = 465
+
+# 第一封信進佇列後再等一下，把同時間的多則通知合併成一封摘要信
+DEFAULT_BATCH_WINDOW = 2.0
+DEFAULT_MAX_BATCH = 20
+DEFAULT_MAX_RETRIES = 3
+# SMTP 連線閒置超過這個秒數就關閉，下次寄信再重連
+DEFAULT_IDLE_TIMEOUT = 60.0
+
+# 上次讀取時 config.ini 的 (路徑, mtime, 大小) 與讀取結果；設定缺漏 (None) 也快取，檔案沒變就不再重讀、重複報錯
+_NOT_LOADED = object()
+_config_stamp = _NOT_LOADED
+_config_cache = None
+_outbox = None
+_outbox_lock = threading.Lock()
+
+# [EMAIL] 區段必填的欄位
+REQUIRED_EMAIL_FIELDS = ('SENDER', 'RECEIVER')
+
+
+def _config_file_stamp(paths: List[str]):
+    """第一個存在的 config.ini 的 (路徑, mtime, 大小)；都不存在時為 None。"""
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        return (path, stat.st_mtime_ns, stat.st_size)
+    return None
+
+
+def load_email_config() -> Optional[configparser.SectionProxy]:
+    """
+    讀取 config.ini 的 [EMAIL] 區段。
+    結果 (包含找不到檔案 / 缺少區段) 依檔案的 mtime 快取：檔案沒變就直接回傳，錯誤訊息只印一次；修改 config.ini 後自動重讀。
+    """
+    global _config_cache, _config_stamp
 
-def send_alert(subject, body):
     # --- 1. 智慧尋找 config.ini ---
     # 取得目前這個檔案 (send_email.py) 的資料夾路徑 -> agent/
     current_dir = os.path.dirname(os.path.abspath(__file__))
-    
+
     # 推算 config.ini 應該在上一層資料夾 -> MINLEE_AGENT/config.ini
     config_path = os.path.join(current_dir, '..', 'config.ini')
-    
+
     # 確保路徑是標準格式
     config_path = os.path.abspath(config_path)
 
-    config = configparser.ConfigParser()
-    # 嘗試讀取
-    read_files = config.read(config_path, encoding='utf-8')
-    
-    # 如果讀不到，嘗試直接讀當前目錄 (備案)
-    if not read_files:
-        read_files = config.read('config.ini', encoding='utf-8')
-
-    # 如果還是讀不到，報錯並結束
-    if not read_files:
+    # 讀不到時，嘗試直接讀當前目錄 (備案)
+    stamp = _config_file_stamp([config_path, os.path.abspath('config.ini')])
+    if stamp == _config_stamp:
+        return _config_cache
+    _config_stamp = stamp
+    _config_cache = _read_email_section(stamp[0] if stamp else None, config_path)
+    return _config_cache
+
+
+def _read_email_section(path: Optional[str], config_path: str) -> Optional[configparser.SectionProxy]:
+    # 如果讀不到，報錯
+    if path is None:
         print(f"❌ Email 模組錯誤：找不到 config.ini！")
         print(f"   嘗試過的路徑: {config_path} 或 ./config.ini")
-        return
+        return None
 
-    # --- 2. 讀取設定與發送 ---
+    config = configparser.ConfigParser()
     try:
-        sender = config['EMAIL']['SENDER']
-        password = config['EMAIL']['PASSWORD']
-        receiver = config['EMAIL']['RECEIVER']
-        
+        config.read(path, encoding='utf-8')
+    except configparser.Error as e:
+        print(f"❌ Email 模組錯誤: config.ini 格式錯誤 ({e})")
+        return None
+
+    if 'EMAIL' not in config:
+        print("❌ Email 模組錯誤: config.ini 缺少 [EMAIL] 區段")
+        return None
+
+    missing = [field for field in REQUIRED_EMAIL_FIELDS if not config['EMAIL'].get(field)]
+    if missing:
+        print(f"❌ Email 模組錯誤: config.ini [EMAIL] 缺少欄位 {', '.join(missing)}")
+        return None
+    return config['EMAIL']
+
+
+class EmailOutbox:
+    """
+    背景寄信佇列
+    - send() 只把郵件放進佇列就返回，不會拖慢排程流程
+    - 單一背景執行緒寄信，SMTP 連線 (含登入) 會重複使用，閒置太久才關閉
+    - 同一時間累積的多則通知會合併成一封摘要信
+    - 寄送失敗時重新連線並重試 (最多 max_retries 次，間隔逐次加倍)
+    """
+
+    def __init__(self, sender: str, receiver: str, password: str = '',
+                 host: str = DEFAULT_SMTP_HOST, port: int = DEFAULT_SMTP_PORT, use_ssl: bool = True,
+                 batch_window: float = DEFAULT_BATCH_WINDOW, max_batch: int = DEFAULT_MAX_BATCH,
+                 max_retries: int = DEFAULT_MAX_RETRIES, retry_delay: float = 1.0,
+                 idle_timeout: float = DEFAULT_IDLE_TIMEOUT):
+        self.sender = sender
+        self.receiver = receiver
+        self.password = password
+        self.host = host
+        self.port = port
+        self.use_ssl = use_ssl
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.idle_timeout = idle_timeout
+
+        # 統計 (排查用)
+        self.sent_messages = 0
+        self.sent_alerts = 0
+        self.failed_alerts = 0
+        self.connections = 0
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._server = None
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name='email-outbox', daemon=True)
+        self._worker.start()
+
+    @classmethod
+    def from_config(cls, config, **kwargs) -> 'EmailOutbox':
+        """由 config.ini 的 [EMAIL] 區段建立 (SMTP_HOST / SMTP_PORT / USE_SSL 可選，預設 Gmail SSL)。"""
+        return cls(
+            sender=config['SENDER'],
+            receiver=config['RECEIVER'],
+            password=config.get('PASSWORD', ''),
+            host=config.get('SMTP_HOST', DEFAULT_SMTP_HOST),
+            port=int(config.get('SMTP_PORT', DEFAULT_SMTP_PORT)),
+            use_ssl=config.get('USE_SSL', 'true').strip().lower() not in ('0', 'false', 'no'),
+            **kwargs
+        )
+
+    # --- 公開 API ---
+    def send(self, subject: str, body: str) -> bool:
+        """把通知放進寄信佇列 (立即返回)。"""
+        if self._closed:
+            print("❌ Email 佇列已關閉，通知未寄出。")
+            return False
+        self._queue.put((subject, body))
+        return True
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """等待佇列中的通知全部處理完 (寄出或放棄)；回傳是否在時限內完成。"""
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout: Optional[float] = 10.0):
+        """寄完剩下的通知並關閉 SMTP 連線。"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._worker.join(timeout)
+
+    # --- 背景執行緒 ---
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self.idle_timeout if self._server else None)
+            except queue.Empty:
+                self._disconnect()
+                continue
+
+            if item is None:
+                self._disconnect()
+                return
+            if isinstance(item, threading.Event):
+                item.set()
+                continue
+
+            batch, pending_marker = self._collect_batch(item)
+            self._deliver(batch)
+            if pending_marker is not None:
+                if pending_marker is True:
+                    self._disconnect()
+                    return
+                pending_marker.set()
+
+    def _collect_batch(self, first) -> Tuple[List[Tuple[str, str]], object]:
+        """從第一封信開始，在 batch_window 內持續收集，最多 max_batch 封。"""
+        batch = [first]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            # flush / close 不再等待視窗，寄出目前這批後處理
+            if item is None:
+                return batch, True
+            if isinstance(item, threading.Event):
+                return batch, item
+            batch.append(item)
+        return batch, None
+
+    def _build_message(self, batch: List[Tuple[str, str]]) -> MIMEMultipart:
+        if len(batch) == 1:
+            subject, body = batch[0]
+        else:
+            subject = f"通知摘要 ({len(batch)} 則)"
+            sections = [f"【{i}】{s}\n{b}" for i, (s, b) in enumerate(batch, start=1)]
+            body = ("\n\n" + "-" * 40 + "\n\n").join(sections)
+
         # 建立郵件物件
         msg = MIMEMultipart()
-        msg['From'] = sender
-        msg['To'] = receiver
+        msg['From'] = self.sender
+        msg['To'] = self.receiver
         msg['Subject'] = f"🏭 MINLEE_AGENT: {subject}"
-        
-        msg.attach(MIMEText(body, 'plain'))
-        
-        # 使用 Gmail SMTP (SSL)
-        with smtplib.SMTP_SSL('smtp.gmail.com', 465) as server:
-            server.login(sender, password)
-            server.send_message(msg)
-        print("📧 Email 發送成功！")
-
-    except KeyError as e:
-        print(f"❌ Email 發送失敗: config.ini 缺少欄位 {e}")
-    except smtplib.SMTPAuthenticationError:
-        print("❌ Email 登入失敗: 帳號或應用程式密碼錯誤。")
-    except Exception as e:
-        print(f"❌ Email 發送失敗 (未預期錯誤): {e}")
\ No newline at end of file
+        msg.attach(MIMEText(body, 'plain', 'utf-8'))
+        return msg
+
+    def _connect(self):
+        if self._server is not None:
+            return self._server
+        if self.use_ssl:
+            server = smtplib.SMTP_SSL(self.host, self.port, timeout=30)
+        else:
+            server = smtplib.SMTP(self.host, self.port, timeout=30)
+        if self.password:
+            server.login(self.sender, self.password)
+        self._server = server
+        self.connections += 1
+        return server
+
+    def _disconnect(self):
+        if self._server is None:
+            return
+        try:
+            self._server.quit()
+        except Exception:
+            pass
+        self._server = None
+
+    def _deliver(self, batch: List[Tuple[str, str]]):
+        msg = self._build_message(batch)
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                self._connect().send_message(msg)
+                self.sent_messages += 1
+                self.sent_alerts += len(batch)
+                print(f"📧 Email 發送成功！({len(batch)} 則通知)")
+                return
+            except smtplib.SMTPAuthenticationError:
+                # 帳密錯誤重試也沒用
+                print("❌ Email 登入失敗: 帳號或應用程式密碼錯誤。")
+                self._server = None
+                break
+            except Exception as e:
+                # 連線可能已失效，丟掉後重連
+                self._server = None
+                if attempt < self.max_retries:
+                    delay = self.retry_delay * (2 ** (attempt - 1))
+                    print(f"⚠️ Email 發送失敗 (第 {attempt} 次): {e}，{delay:g} 秒後重試。")
+                    time.sleep(delay)
+                else:
+                    print(f"❌ Email 發送失敗 (已重試 {self.max_retries} 次): {e}")
+        self.failed_alerts += len(batch)
+
+
+def get_outbox() -> Optional[EmailOutbox]:
+    """取得共用的寄信佇列 (第一次使用時依 config.ini 建立)。"""
+    global _outbox
+    with _outbox_lock:
+        if _outbox is None:
+            config = load_email_config()
+            if config is None:
+                return None
+            try:
+                _outbox = EmailOutbox.from_config(config)
+            except KeyError as e:
+                print(f"❌ Email 發送失敗: config.ini 缺少欄位 {e}")
+                return None
+            atexit.register(_outbox.close)
+        return _outbox
+
+
+def set_outbox(outbox: Optional[EmailOutbox]):
+    """替換共用的寄信佇列 (例如指向本機測試用的 SMTP 伺服器)。"""
+    global _outbox
+    with _outbox_lock:
+        _outbox = outbox
+
+
+def send_alert(subject, body) -> bool:
+    """把通知放進背景寄信佇列 (不會等待 SMTP)；回傳是否成功排入佇列。"""
+    outbox = get_outbox()
+    if outbox is None:
+        return False
+    return outbox.send(subject, body)
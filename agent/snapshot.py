@@ -0,0 +1,115 @@
+import pickle
+import threading
+from typing import Any, Dict, Iterable, List, Tuple
+
+
+class FrozenDict(dict):
+    """
+    唯讀 dict：可以在多次排程、快取、checkpoint 之間共用同一個物件，不需要防禦性複製。
+    需要修改時用 dict(frozen) 取得一份可寫的淺複製。
+    (繼承 dict，所以 json / pandas / LangGraph checkpoint 序列化都當成一般 dict 處理)
+    """
+    __slots__ = ()
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("FrozenDict 是唯讀快照，請先用 dict(...) 複製後再修改。")
+
+    __setitem__ = __delitem__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+    __ior__ = _readonly
+
+    def __reduce__(self):
+        return (FrozenDict, (dict(self),))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+def freeze(value: Any) -> Any:
+    """
+    遞迴轉成唯讀結構 (dict -> FrozenDict、list -> tuple)。
+    已經是 FrozenDict 的部分直接共用，不會重建。
+    """
+    if isinstance(value, FrozenDict):
+        return value
+    if isinstance(value, dict):
+        return FrozenDict((k, freeze(v)) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    if isinstance(value, set):
+        return frozenset(value)
+    return value
+
+
+def freeze_records(records: Iterable[Dict[str, Any]]) -> Tuple[Dict[str, Any], ...]:
+    """把 dict 列表轉成 tuple[FrozenDict] (每筆只做淺層凍結；已凍結的直接共用)。"""
+    if isinstance(records, tuple) and all(isinstance(r, FrozenDict) for r in records):
+        return records
+    return tuple(r if isinstance(r, FrozenDict) else FrozenDict(r) for r in records)
+
+
+def working_copy(records: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """排程器專用的可寫工作副本 (每筆淺複製，原本的快照不受影響)。"""
+    return [dict(r) for r in records]
+
+
+def payload_size(value: Any) -> int:
+    """序列化後的大小 (bytes)，用來估計 state / checkpoint 的體積。"""
+    try:
+        return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return 0
+
+
+def _format_bytes(size: int) -> str:
+    if size >= 1024 * 1024:
+        return f"{size / 1024 / 1024:.1f}MB"
+    if size >= 1024:
+        return f"{size / 1024:.1f}KB"
+    return f"{size}B"
+
+
+class StateSizeReport:
+    """記錄每個節點寫入 state 的資料量 (最近一次執行)。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.sizes: Dict[str, Dict[str, int]] = {}
+
+    def record(self, node: str, update: Dict[str, Any]):
+        sizes = {key: payload_size(value) for key, value in (update or {}).items()}
+        with self._lock:
+            self.sizes[node] = sizes
+
+    def total(self, node: str) -> int:
+        return sum(self.sizes.get(node, {}).values())
+
+    def report(self) -> str:
+        with self._lock:
+            if not self.sizes:
+                return "State 大小：尚無紀錄。"
+            parts = []
+            for node, sizes in self.sizes.items():
+                largest = max(sizes, key=sizes.get) if sizes else ''
+                detail = f" (最大 {largest} {_format_bytes(sizes[largest])})" if largest else ''
+                parts.append(f"{node} {_format_bytes(sum(sizes.values()))}{detail}")
+        return "State 大小 (各節點寫入)：" + "，".join(parts)
+
+
+# 行程內共用的 state 大小紀錄
+STATE_SIZES = StateSizeReport()
+
+
+def measure_node(name: str, fn, report: StateSizeReport = STATE_SIZES):
+    """包裝 LangGraph 節點，記錄節點回傳 (寫入 state) 的資料大小。"""
+    def wrapper(state):
+        update = fn(state)
+        report.record(name, update)
+        return update
+
+    wrapper.__name__ = getattr(fn, '__name__', name)
+    wrapper.__doc__ = fn.__doc__
+    return wrapper
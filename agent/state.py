@@ -10,10 +10,16 @@ class AgentState(TypedDict):
     # --- 基礎資訊 ---\n
     logs: Annotated[List[str], operator.add]
     image_path: str
+    # 【新增】多張 Packing Sheet 圖片 (合併成一次模型呼叫)
+    image_paths: List[str]
+    # 【新增】本次匯入的圖片內容 hash：訂單簿寫回後才標記為已匯入 (main.finish_run)
+    ingested_images: List[str]
     
     # --- 核心數據 ---\n
     # inventory_db: 產能資料庫 (UPH, 人力需求)\n
     inventory_db: Dict[str, Dict[str, int]]
+    # 【新增】產能資料檔的內容雜湊 (節點快取指紋用)
+    inventory_hash: str
     
     # orders: 目前的訂單佇列 (包含新單 + 未完成舊單)
     orders: List[Dict[str, Any]] 
@@ -27,6 +33,12 @@ class AgentState(TypedDict):
     # 【新增】產品到工序的映射表
     product_to_jobs: Dict[str, List[str]]
     
+    # 【新增】產品名稱 -> 匹配工序 (match_products 並行分支的結果)
+    product_matches: Dict[str, List[str]]
+    
+    # 【新增】訂單 (order_key = order_id|product) 到工序的映射表，用於判斷各訂單完工狀態
+    order_to_jobs: Dict[str, List[str]]
+    
     # --- 每日回饋 (Feedback Loop) ---\n
     # daily_feedback: 紀錄每天的實際產出，用於修正剩餘數量\n
     # 格式: {"Day 1": {"T302": 5000}}
@@ -44,9 +56,18 @@ class AgentState(TypedDict):
     
     # schedule_summary: 文字...
     schedule_summary: str
+
+    # 【新增】order_lateness: 各訂單預計完工日與延遲天數 (agent.due_date.LatenessTracker)
+    order_lateness: List[Dict[str, Any]]
     
+    # 【新增】schedule_diff: 與上次排程的差異 (agent.schedule_diff.diff_schedules)
+    schedule_diff: Dict[str, Any]
+
     # email_subject: 郵件標題
     email_subject: str
     
     # email_body: 郵件內文
-    email_body: str
\ No newline at end of file
+    email_body: str
+
+    # 【新增】email_queued: 通知是否已排入背景寄信佇列
+    email_queued: bool
\ No newline at end of file
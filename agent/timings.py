@@ -0,0 +1,68 @@
+import threading
+import time
+from typing import Dict, Tuple, List
+
+
+class NodeTimings:
+    """
+    記錄每個節點的開始 / 結束時間 (最近一次執行)，用來比較並行分支的關鍵路徑。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.spans: Dict[str, Tuple[float, float]] = {}
+
+    def reset(self):
+        with self._lock:
+            self.spans.clear()
+
+    def record(self, node: str, start: float, end: float):
+        with self._lock:
+            self.spans[node] = (start, end)
+
+    def rows(self) -> List[Tuple[str, float, float, float]]:
+        """[(節點, 開始偏移秒, 結束偏移秒, 耗時秒)]，依開始時間排序。"""
+        with self._lock:
+            spans = dict(self.spans)
+        if not spans:
+            return []
+        origin = min(start for start, _ in spans.values())
+        return sorted(
+            ((node, start - origin, end - origin, end - start) for node, (start, end) in spans.items()),
+            key=lambda row: row[1]
+        )
+
+    def wall_time(self) -> float:
+        rows = self.rows()
+        return max(row[2] for row in rows) if rows else 0.0
+
+    def serial_time(self) -> float:
+        """如果所有節點依序執行的總耗時。"""
+        return sum(row[3] for row in self.rows())
+
+    def report(self) -> str:
+        rows = self.rows()
+        if not rows:
+            return "節點耗時：尚無紀錄。"
+        parts = [f"{node} {start:.2f}~{end:.2f}s" for node, start, end, _ in rows]
+        wall, serial = self.wall_time(), self.serial_time()
+        return (f"節點耗時：{'，'.join(parts)}；"
+                f"實際 {wall:.2f}s / 依序執行 {serial:.2f}s (並行節省 {max(0.0, serial - wall):.2f}s)")
+
+
+# 行程內共用的節點耗時紀錄
+NODE_TIMINGS = NodeTimings()
+
+
+def timed_node(name: str, fn, timings: NodeTimings = NODE_TIMINGS):
+    """包裝 LangGraph 節點，記錄開始 / 結束時間。"""
+    def wrapper(state):
+        start = time.perf_counter()
+        try:
+            return fn(state)
+        finally:
+            timings.record(name, start, time.perf_counter())
+
+    wrapper.__name__ = getattr(fn, '__name__', name)
+    wrapper.__doc__ = fn.__doc__
+    return wrapper
@@ -0,0 +1,250 @@
+import contextvars
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from tabulate import tabulate
+
+# 追蹤紀錄 (每個 span 一行 JSON)，超過 MAX_BYTES 時輪替成 traces.jsonl.1 ~ .BACKUP_COUNT
+DEFAULT_TRACE_PATH = 'traces.jsonl'
+MAX_BYTES = 5 * 1024 * 1024
+BACKUP_COUNT = 3
+
+# 目前所在的 span (LangGraph 並行分支在不同執行緒，靠 contextvars 傳遞父 span)
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar('current_span', default=None)
+
+
+def payload_bytes(value: Any) -> int:
+    """估計資料大小 (JSON 編碼後的 bytes)，用來記錄 I/O 呼叫的傳輸量。"""
+    try:
+        return len(json.dumps(value, ensure_ascii=False, default=str).encode('utf-8'))
+    except (TypeError, ValueError):
+        return 0
+
+
+def row_count(value: Any) -> Optional[int]:
+    if isinstance(value, (list, tuple)):
+        return len(value)
+    return None
+
+
+class Span:
+    """一段計時區間：名稱、耗時、屬性 (資料量、列數...)，以及所屬的 trace / 父 span。"""
+
+    def __init__(self, name: str, parent: Optional["Span"] = None, **attrs):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex[:16]
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.attrs: Dict[str, Any] = dict(attrs)
+        self.status = 'ok'
+        self.error = None
+        self.start_ts = time.time()
+        self._start = time.perf_counter()
+        self.duration_ms = 0.0
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def finish(self):
+        self.duration_ms = (time.perf_counter() - self._start) * 1000
+
+    def to_record(self) -> Dict[str, Any]:
+        record = {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "ts": round(self.start_ts, 3),
+            "duration_ms": round(self.duration_ms, 3),
+            "status": self.status,
+            "attrs": self.attrs,
+        }
+        if self.error:
+            record["error"] = self.error
+        return record
+
+
+class RotatingJsonlExporter:
+    """把 span 寫到本機 JSONL 檔 (附加寫入，超過大小上限時輪替，最多保留 backup_count 份舊檔)。"""
+
+    def __init__(self, path: str = DEFAULT_TRACE_PATH, max_bytes: int = MAX_BYTES, backup_count: int = BACKUP_COUNT):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._lock = threading.Lock()
+
+    def paths(self) -> List[str]:
+        """目前的檔案與所有輪替檔 (由舊到新)。"""
+        rotated = [f"{self.path}.{i}" for i in range(self.backup_count, 0, -1)]
+        return [p for p in rotated + [self.path] if os.path.exists(p)]
+
+    def _rotate(self):
+        for i in range(self.backup_count - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def export(self, record: Dict[str, Any]):
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            try:
+                if os.path.exists(self.path) and os.path.getsize(self.path) + len(line) > self.max_bytes:
+                    self._rotate()
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(line)
+            except OSError as e:
+                print(f"⚠️ 追蹤紀錄寫入失敗: {e}")
+
+
+class Tracer:
+    def __init__(self, exporter: Optional[RotatingJsonlExporter] = None, enabled: bool = True):
+        self.exporter = exporter or RotatingJsonlExporter()
+        self.enabled = enabled
+
+    @contextmanager
+    def span(self, name: str, **attrs) -> Iterator[Span]:
+        current = Span(name, _current_span.get(), **attrs)
+        if not self.enabled:
+            yield current
+            return
+        token = _current_span.set(current)
+        try:
+            yield current
+        except BaseException as e:
+            current.status = 'error'
+            current.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current_span.reset(token)
+            current.finish()
+            self.exporter.export(current.to_record())
+
+
+# 行程內共用的 tracer
+TRACER = Tracer()
+
+
+def span(name: str, **attrs):
+    """with span("llm.invoke", products=3) as sp: ...; sp.set(response_chars=...)"""
+    return TRACER.span(name, **attrs)
+
+
+def traced_node(name: str, fn, sizes=None):
+    """
+    包裝 LangGraph 節點成 node.<name> span，記錄輸出欄位與寫入 state 的資料量。
+    sizes: agent.snapshot 的 StateSizeReport (fn 已經用 measure_node 包裝時直接沿用它量到的大小)。
+    """
+    def wrapper(state):
+        with span(f"node.{name}") as sp:
+            update = fn(state)
+            sp.set(keys=sorted(update or {}))
+            if sizes is not None:
+                sp.set(payload_bytes=sizes.total(name))
+            return update
+
+    wrapper.__name__ = getattr(fn, '__name__', name)
+    wrapper.__doc__ = fn.__doc__
+    return wrapper
+
+
+class TracedProxy:
+    """
+    包裝外部 I/O 物件 (例如 gspread Worksheet)：每個方法呼叫都記錄成 <prefix>.<方法> span，
+    含傳入 / 回傳的列數與資料量。一般屬性 (title、row_count...) 直接轉交，不記錄。
+    """
+
+    def __init__(self, target, prefix: str, **attrs):
+        self._target = target
+        self._prefix = prefix
+        self._attrs = attrs
+
+    def __getattr__(self, attr):
+        value = getattr(self._target, attr)
+        if not callable(value) or attr.startswith('_'):
+            return value
+
+        def call(*args, **kwargs):
+            with span(f"{self._prefix}.{attr}", **self._attrs) as sp:
+                if args and row_count(args[0]) is not None:
+                    sp.set(rows_in=row_count(args[0]), bytes_in=payload_bytes(args[0]))
+                result = value(*args, **kwargs)
+                if row_count(result) is not None:
+                    sp.set(rows_out=row_count(result), bytes_out=payload_bytes(result))
+                return result
+
+        return call
+
+
+# --- 彙總 (python main.py --trace-summary) ---
+
+def percentile(values: List[float], q: float) -> float:
+    """nearest-rank 百分位數 (values 需已排序)。"""
+    if not values:
+        return 0.0
+    rank = max(1, math.ceil(q * len(values)))
+    return values[rank - 1]
+
+
+def load_spans(paths: List[str]) -> List[Dict[str, Any]]:
+    records = []
+    for path in paths:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        records.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        continue  # 寫到一半的最後一行
+        except OSError as e:
+            print(f"⚠️ 無法讀取追蹤紀錄 {path}: {e}")
+    return records
+
+
+def summarize_spans(records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """依 span 名稱彙總：次數、錯誤數、p50 / p95 / 最大耗時、平均列數。"""
+    grouped: Dict[str, List[Dict[str, Any]]] = {}
+    for record in records:
+        grouped.setdefault(record.get('name', '?'), []).append(record)
+
+    rows = []
+    for name, items in grouped.items():
+        durations = sorted(float(r.get('duration_ms', 0)) for r in items)
+        row_values = [r['attrs'].get('rows_out', r['attrs'].get('rows_in')) for r in items if isinstance(r.get('attrs'), dict)]
+        row_values = [v for v in row_values if isinstance(v, (int, float))]
+        rows.append({
+            "span": name,
+            "count": len(items),
+            "errors": sum(1 for r in items if r.get('status') == 'error'),
+            "p50_ms": round(percentile(durations, 0.50), 1),
+            "p95_ms": round(percentile(durations, 0.95), 1),
+            "max_ms": round(durations[-1], 1),
+            "total_ms": round(sum(durations), 1),
+            "avg_rows": round(sum(row_values) / len(row_values), 1) if row_values else '',
+        })
+    rows.sort(key=lambda r: r['total_ms'], reverse=True)
+    return rows
+
+
+def print_trace_summary(exporter: Optional[RotatingJsonlExporter] = None):
+    exporter = exporter or TRACER.exporter
+    paths = exporter.paths()
+    records = load_spans(paths)
+    if not records:
+        print(f"ℹ️ 尚無追蹤紀錄 ({exporter.path})。")
+        return
+    runs = len({r.get('trace_id') for r in records if r.get('name') == 'graph.run'})
+    print(f"\n📈 追蹤彙總：{len(records)} 個 span，{runs} 次排程 ({', '.join(paths)})")
+    print(tabulate(summarize_spans(records), headers="keys", tablefmt="grid"))
@@ -0,0 +1,256 @@
+"""
+排程器效能基準測試 (micro-benchmark)
+
+以固定亂數種子從產能資料庫產生合成訂單簿 (預設 10 / 1k / 10k 個工序，100k 需另外指定)，量測：
+- create_jobs:        _create_jobs_list (LLM 以 stub 取代，直接回傳產生器已知的匹配結果)
+- simulation:         _run_global_simulation
+- calculate_schedule: calculate_schedule 節點 (模擬 + 輸出整理)
+每項記錄耗時、峰值記憶體 (tracemalloc)、排程天數與吞吐量 (工序/秒)。
+
+用法:
+    python benchmark.py                              # 執行並與基準檔比較，吞吐量退步超過門檻時 exit code 1
+    python benchmark.py --save-baseline              # 把本次結果存成基準
+    python benchmark.py --sizes 10,1k --threshold 15 --rush-ratio 0.3 --qty lognormal
+    python benchmark.py --sizes 10,1k,10k,100k --no-memory # 完整規模 (100k 需要數分鐘)
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Tuple, Callable
+
+from tabulate import tabulate
+
+import agent.nodes as nodes
+from agent.inventory import INVENTORY_STORE, Inventory
+from agent.tracing import TRACER
+
+DEFAULT_SIZES = "10,1k,10k"
+DEFAULT_BASELINE_PATH = 'benchmark_baseline.json'
+DEFAULT_THRESHOLD = 20.0  # 吞吐量退步超過幾 % 視為失敗
+DEFAULT_SEED = 42
+# 基準耗時太短 (計時誤差比變化大) 的項目不做退步比較
+MIN_COMPARABLE_SECONDS = 0.005
+
+# 產品名稱的常見寫法變化 (同一型號的不同訂單)
+PRODUCT_VARIANTS = ['', ' BLACK', ' SS', ' (90)', ' 右', ' 左']
+
+QTY_DISTRIBUTIONS: Dict[str, Callable[[random.Random], int]] = {
+    'uniform': lambda rng: rng.randint(100, 5000),
+    'lognormal': lambda rng: max(1, int(rng.lognormvariate(7.5, 0.8))),
+    # 大部分是小單，少數超大單
+    'bulk': lambda rng: rng.randint(20000, 50000) if rng.random() < 0.1 else rng.randint(200, 800),
+}
+
+
+def parse_size(text: str) -> int:
+    text = text.strip().lower()
+    if text.endswith('k'):
+        return int(float(text[:-1]) * 1000)
+    return int(text)
+
+
+def size_label(size: int) -> str:
+    return f"{size // 1000}k" if size >= 1000 and size % 1000 == 0 else str(size)
+
+
+def generate_order_book(target_jobs: int, inventory: Inventory, seed: int = DEFAULT_SEED,
+                        rush_ratio: float = 0.1, qty: str = 'uniform') -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], Dict[str, List[str]]]:
+    """
+    產生約 target_jobs 個工序的訂單簿 (同一個 seed 結果固定)。
+    產品名稱由型號代碼加上常見寫法變化組成，匹配結果直接取自 inventory.by_model (給 stub LLM 使用)。
+    Returns:
+        (一般訂單, 急單, 產品名稱 -> 工序 keys)
+    """
+    rng = random.Random(seed)
+    draw_qty = QTY_DISTRIBUTIONS[qty]
+    codes = sorted(inventory.by_model)
+    if not codes:
+        raise ValueError("產能資料庫沒有可用的型號代碼，無法產生訂單。")
+
+    today = datetime(2026, 1, 1)
+    orders, rush_orders = [], []
+    matches: Dict[str, List[str]] = {}
+    jobs = 0
+    n = 0
+    while jobs < target_jobs:
+        code = rng.choice(codes)
+        product = f"{code}{rng.choice(PRODUCT_VARIANTS)}"
+        matches[product] = list(inventory.by_model[code])
+        is_rush = rng.random() < rush_ratio
+        quantity = draw_qty(rng)
+        n += 1
+        order = {
+            "order_id": f"BM{n:06d}",
+            "product": product,
+            "qty": quantity,
+            "qty_total": quantity,
+            "qty_remaining": quantity,
+            "is_rush": is_rush,
+            "due_date": (today + timedelta(days=rng.randint(1, 60))).strftime('%Y-%m-%d'),
+        }
+        (rush_orders if is_rush else orders).append(order)
+        jobs += len(matches[product])
+    return orders, rush_orders, matches
+
+
+@contextlib.contextmanager
+def stub_llm(matches: Dict[str, List[str]]):
+    """以已知匹配結果取代 LLM 呼叫，並清空行程內的匹配快取 (每次都走完整匹配流程)。"""
+    original = nodes._match_products_with_llm
+    nodes._match_products_with_llm = lambda names, inventory_products: {name: matches.get(name, []) for name in names}
+    nodes._match_cache.clear()
+    try:
+        yield
+    finally:
+        nodes._match_products_with_llm = original
+        nodes._match_cache.clear()
+
+
+def measure(fn: Callable[[], Any], repeat: int, memory: bool = True) -> Tuple[float, int, Any]:
+    """取 repeat 次中最快的耗時；memory 時另外跑一次 tracemalloc 量峰值記憶體 (不計入耗時)。"""
+    best = float('inf')
+    result = None
+    peak = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = fn()
+            best = min(best, time.perf_counter() - start)
+        if not memory:
+            return best, peak, result
+        tracemalloc.start()
+        try:
+            fn()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return best, peak, result
+
+
+def run_suite(sizes: List[int], seed: int, rush_ratio: float, qty: str, repeat: int, memory: bool = True) -> Dict[str, Dict[str, Any]]:
+    inventory = INVENTORY_STORE.current()
+    settings = nodes.scheduler_settings()
+    results: Dict[str, Dict[str, Any]] = {}
+
+    for size in sizes:
+        orders, rush_orders, matches = generate_order_book(size, inventory, seed, rush_ratio, qty)
+        all_orders = orders + rush_orders
+        runs = repeat if size < 10000 else 1
+        print(f"⏱️ {size_label(size)}: {len(all_orders)} 筆訂單 ...")
+
+        with stub_llm(matches):
+            elapsed, peak, created = measure(lambda: nodes._create_jobs_list(all_orders, inventory.processes), runs, memory)
+        all_jobs, _, order_to_jobs, _ = created
+        job_count = len(all_jobs)
+        results[f"create_jobs@{size_label(size)}"] = _row(elapsed, peak, job_count, None)
+
+        elapsed, peak, (schedule_data, _) = measure(lambda: nodes._run_global_simulation(all_jobs, settings), runs, memory)
+        results[f"simulation@{size_label(size)}"] = _row(elapsed, peak, job_count, len(schedule_data))
+
+        state = {"all_jobs": all_jobs, "order_to_jobs": order_to_jobs, "orders": orders, "rush_orders": rush_orders}
+        elapsed, peak, update = measure(lambda: nodes.calculate_schedule(state), runs, memory)
+        days = len({row['Day'] for row in update.get('schedule_result', ())})
+        results[f"calculate_schedule@{size_label(size)}"] = _row(elapsed, peak, job_count, days)
+    return results
+
+
+def _row(elapsed: float, peak: int, jobs: int, days) -> Dict[str, Any]:
+    return {
+        "seconds": round(elapsed, 4),
+        "peak_mb": round(peak / 1024 / 1024, 2),
+        "jobs": jobs,
+        "schedule_days": days,
+        "jobs_per_sec": round(jobs / elapsed, 1) if elapsed > 0 else 0.0,
+    }
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]], threshold: float) -> List[str]:
+    """吞吐量 (jobs_per_sec) 比基準退步超過 threshold % 的項目。"""
+    regressions = []
+    for name, row in results.items():
+        base = baseline.get(name)
+        if not base or not base.get('jobs_per_sec'):
+            row['vs_baseline'] = ''
+            continue
+        if base.get('seconds', 0) < MIN_COMPARABLE_SECONDS:
+            row['vs_baseline'] = '(太短)'
+            continue
+        change = (row['jobs_per_sec'] - base['jobs_per_sec']) / base['jobs_per_sec'] * 100
+        row['vs_baseline'] = f"{change:+.1f}%"
+        if change < -threshold:
+            regressions.append(f"{name}: {base['jobs_per_sec']} -> {row['jobs_per_sec']} 工序/秒 ({change:+.1f}%)")
+    return regressions
+
+
+def load_baseline(path: str) -> Dict[str, Dict[str, Any]]:
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f).get('results', {})
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"⚠️ 基準檔讀取失敗: {e}")
+        return {}
+
+
+def save_baseline(path: str, results: Dict[str, Dict[str, Any]], params: Dict[str, Any]):
+    payload = {
+        "created": datetime.now().isoformat(timespec='seconds'),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "params": params,
+        "results": {name: {k: v for k, v in row.items() if k != 'vs_baseline'} for name, row in results.items()},
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+    print(f"💾 基準已儲存到 {path}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="排程器效能基準測試")
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='工序數量 (逗號分隔，可用 k，例如 10,1k,10k,100k)')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--rush-ratio', type=float, default=0.1, help='急單比例 (0 ~ 1)')
+    parser.add_argument('--qty', choices=sorted(QTY_DISTRIBUTIONS), default='uniform', help='訂單數量分布')
+    parser.add_argument('--repeat', type=int, default=5, help='每項重複次數 (取最快；10k 以上固定 1 次)')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE_PATH, help='基準檔路徑')
+    parser.add_argument('--save-baseline', action='store_true', help='把本次結果存成基準')
+    parser.add_argument('--no-memory', action='store_true', help='不量峰值記憶體 (tracemalloc 會讓大規模測試慢很多)')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='吞吐量退步超過幾 %% 視為失敗')
+    args = parser.parse_args(argv)
+
+    # 基準測試不寫入追蹤紀錄
+    TRACER.enabled = False
+    sizes = [parse_size(s) for s in args.sizes.split(',') if s.strip()]
+    params = {"sizes": args.sizes, "seed": args.seed, "rush_ratio": args.rush_ratio, "qty": args.qty}
+    results = run_suite(sizes, args.seed, args.rush_ratio, args.qty, args.repeat, not args.no_memory)
+
+    baseline = load_baseline(args.baseline)
+    regressions = compare(results, baseline, args.threshold)
+    print(tabulate([{"benchmark": name, **row} for name, row in results.items()], headers="keys", tablefmt="grid"))
+
+    if args.save_baseline:
+        save_baseline(args.baseline, results, params)
+        return 0
+    if not baseline:
+        print(f"ℹ️ 尚無基準檔 ({args.baseline})，可加上 --save-baseline 建立。")
+        return 0
+    if regressions:
+        print(f"❌ 吞吐量退步超過 {args.threshold:.0f}%:")
+        for line in regressions:
+            print(f"   - {line}")
+        return 1
+    print(f"✅ 沒有超過 {args.threshold:.0f}% 的效能退步。")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,33 @@
 import pandas as pd
 from tabulate import tabulate
 from agent.graph import build_app
+from agent.memo import NODE_CACHE
+from agent.snapshot import STATE_SIZES
+from agent.timings import NODE_TIMINGS
+from agent.tracing import print_trace_summary
+from agent.profiling import PipelineProfiler, DEFAULT_PROFILE_DIR
+from agent.checkpoint import open_checkpointer, new_thread_id, run_graph, resume_run, inspect_run, list_runs, pending_nodes, describe_value
+from agent.order_book import OrderBook
+from agent.progress import compute_progress, status_labels, parse_day_numbers
+from agent.promise import CapacityProfile, quote_order, schedule_date_of
+from agent.calibration import CALIBRATION_STORE, record_actuals, schedule_id_of
+from agent.schedule_spans import schedule_rows
+from agent.risk import simulate_risk, UphModel, DEFAULT_RUNS, DEFAULT_ABSENCE_RATE, DEFAULT_SEED
+from agent.inventory import INVENTORY_STORE
+from agent.capacity import CALENDAR_STORE
+from agent import nodes, packing_image
+from agent.report import print_day_summary, page_schedule_detail, write_txt_report, write_csv_report, write_xlsx_report
 import os
+import sys
 from datetime import datetime
 from typing import List, Dict, Any
 from collections import defaultdict 
 import json
+import argparse
 import configparser
+from scheduler_service import serve, watch, DEFAULT_HOST, DEFAULT_PORT
+from sheet_watcher import DEFAULT_POLL_INTERVAL
+from memory_db import InMemoryDB
 
 # 匯入 Google Sheets 模組 (sheets_db.py 必須與 main.py 同層或在 agent/ 下)
 try:
@@ -26,6 +47,7 @@ except ImportError:
             def save_orders(self, *args): print("⚠️ DB 模組失敗，無法儲存。")
             def save_system_data(self, *args): print("⚠️ DB 模組失敗，無法儲存狀態。")
             def save_schedule_results(self, *args): print("⚠️ DB 模組失敗，無法儲存排程報告。")
+            def save_run_result(self, *args): print("⚠️ DB 模組失敗，無法儲存排程結果。")
         print("❌ 致命錯誤: 無法導入 GoogleSheetsDB 模組。請確認 sheets_db.py 存在且命名正確。")
         
 
@@ -34,32 +56,22 @@ except ImportError:
 def clear_screen():
     os.system('cls' if os.name == 'nt' else 'clear')
 
-def save_schedule_to_file(df):
-    """將排程結果的 DataFrame 存成可讀的文字報告檔案 (.txt)"""
-    try:
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"schedule_report_{timestamp}.txt"
-        
-        # 定義新的 11 個欄位順序 (與 Google Sheets 寫入順序一致)
-        cols = ["Day", "Product", "Headcount", "Actual_Hours", "plan_to", "Output", "Complete_Percent", "Idle_People", "Status", "Note", "priority"]
-        
-        df_display = df[[c for c in cols if c in df.columns]]
-        table_text = tabulate(df_display, headers='keys', tablefmt='psql', showindex=False)
-        
-        report_content = (
-            f"=== 🏭 MINLEE 工廠智慧排程報告 ({timestamp}) ===\n\n"
-            f"{table_text}\n\n"
-            f"--------------------------------------------------\n"
-            f"備註: Headcount = 該工序所需人力; Actual_Hours = 該工序耗用工時; Complete_Percent = 該訂單總進度; plan_to = 計劃執行工序/機台。\n"
-        )
-        
-        with open(filename, 'w', encoding='utf-8') as f:
-            f.write(report_content)
-        
-        print(f"\n📄 排程報告已儲存至檔案: {filename}")
-        
-    except Exception as e:
-        print(f"❌ 儲存排程報告錯誤: {e}")
+def save_schedule_to_file(schedule: List[Dict[str, Any]]):
+    """將排程結果串流存成報告檔案 (.txt 文字表格 + .csv + .xlsx)"""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    basename = f"schedule_report_{timestamp}"
+    
+    exporters = [
+        (f"{basename}.txt", lambda path: write_txt_report(path, schedule, f"=== 🏭 MINLEE 工廠智慧排程報告 ({timestamp}) ===")),
+        (f"{basename}.csv", lambda path: write_csv_report(path, schedule)),
+        (f"{basename}.xlsx", lambda path: write_xlsx_report(path, schedule)),
+    ]
+    for filename, export in exporters:
+        try:
+            export(filename)
+            print(f"📄 排程報告已儲存至檔案: {filename}")
+        except Exception as e:
+            print(f"❌ 儲存排程報告錯誤 ({filename}): {e}")
 
 def get_progress_bar(percent: float, length: int = 20) -> str:
     """生成進度條字串，例如 [####----]"""
@@ -68,141 +80,80 @@ def get_progress_bar(percent: float, length: int = 20) -> str:
     bar = "█" * num_hashes + "-" * (length - num_hashes)
     return f"[{bar}] {percent:.1f}%"
 
-def show_progress_report(last_schedule: List[Dict[str, Any]], current_orders: List[Dict[str, Any]], days_to_check: int):
+def show_progress_report(last_schedule: List[Dict[str, Any]], order_book: OrderBook, days_to_check: int):
     """
     生成並顯示應做/實作進度條表格，並返回進度數據 (用於功能 3)。
-    (程式碼與前次提交的完整版 show_progress_report 一致)
+    對帳計算由 agent.progress.compute_progress (pandas/NumPy) 完成，這裡只負責顯示與轉換格式。
     """
     if not last_schedule:
         print("❌ 無上次排程結果，無法生成進度報告。")
         return None
-        
-    # 找出總訂單量，用於計算總進度百分比 (Product-level)
-    product_totals = {order['product']: order['qty'] for order in current_orders if 'qty' in order}
-    
-    planned_jobs = [
-        job for job in last_schedule 
-        if job.get('Day', 'Day 0').split(' ')[-1].isdigit() and 
-           int(job['Day'].split(' ')[-1].replace('Day ', '')) <= days_to_check
-    ]
     
-    planned_output_by_product = defaultdict(int)
-    planned_jobs_by_display_name = {}
+    result = compute_progress(last_schedule, order_book.orders, days_to_check)
+    progress_df = result['progress']
+    tasks_df = result['tasks']
     
-    for job in planned_jobs:
-        raw_product = job.get('Raw_Product_Name') 
-        display_name = job.get('Product') 
-        
-        if raw_product and display_name:
-            planned_output_by_product[raw_product] += job['Output']
-            
-            raw_display_name = display_name.replace("✅ ", "").replace("☑️ ", "").replace("💡 ", "")
-            
-            if raw_display_name not in planned_jobs_by_display_name:
-                planned_jobs_by_display_name[raw_display_name] = {
-                    'raw_product': raw_product,
-                    'planned_output': 0,
-                    'line': job.get('Line', 'N/A')
-                }
-            
-            planned_jobs_by_display_name[raw_display_name]['planned_output'] += job['Output']
-        
-    progress_data = []
-    products_to_report = set(planned_output_by_product.keys())
+    # (order_key, 工序) -> 計畫資訊，供逐工序回報使用
+    planned_jobs_by_task = {
+        (row['order_key'], row['display_name']): row
+        for row in tasks_df.to_dict('records')
+    }
     
-    for raw_product in sorted(list(products_to_report)):
-        
-        total_qty = product_totals.get(raw_product)
-        if total_qty is None or total_qty <= 0:
-             continue
-
-        planned_output = planned_output_by_product[raw_product]
-        current_order = next((o for o in current_orders if o['product'] == raw_product), None)
-        
-        if not current_order:
-            actual_remaining = 0
-        else:
-            original_qty = current_order.get('qty', total_qty)
-            actual_remaining = current_order.get('qty_remaining', original_qty)
-            
-        actual_output = total_qty - actual_remaining
-            
-        planned_progress_percent = round((planned_output / total_qty) * 100, 1) if total_qty > 0 else 0
-        actual_progress_percent = round((actual_output / total_qty) * 100, 1) if total_qty > 0 else 0
-        gap_qty = planned_output - actual_output
-
-        planned_bar = get_progress_bar(planned_progress_percent)
-        actual_bar = get_progress_bar(actual_progress_percent)
-        
-        status = "✅ 達標"
-        if gap_qty > 0:
-            status = f"❌ 落後 {gap_qty} pcs"
-        elif gap_qty < 0:
-             status = f"🔥 超前 {abs(gap_qty)} pcs"
-
-        progress_data.append({
-            "產品型號": raw_product,
-            "總訂單量": total_qty,
-            "應做數量": planned_output,
-            "實作數量": actual_output,
-            "應做進度": planned_bar,
-            "實作進度": actual_bar,
-            "狀態/落後量": status,
-            "落後數量": max(0, gap_qty),
-            "original_order": current_order
-        })
-
-    df = pd.DataFrame(progress_data)
-    cols_display = ["產品型號", "總訂單量", "應做數量", "實作數量", "應做進度", "實作進度", "狀態/落後量"]
-    df_display = df[[c for c in cols_display if c in df.columns]]
+    display_df = pd.DataFrame({
+        "訂單編號": progress_df['order_id'],
+        "產品型號": progress_df['product'],
+        "截止日期": progress_df['due_date'],
+        "總訂單量": progress_df['total_qty'],
+        "應做數量": progress_df['planned_output'],
+        "實作數量": progress_df['actual_output'],
+        "應做進度": progress_df['planned_percent'].map(get_progress_bar),
+        "實作進度": progress_df['actual_percent'].map(get_progress_bar),
+        "狀態/落後量": status_labels(progress_df['gap_qty']),
+    })
     
-    print(f"\n--- 📈 產品生產進度追蹤報告 (Day 1 - Day {days_to_check} 累積) ---")
-    print(tabulate(df_display, headers='keys', tablefmt='fancy_grid', showindex=False))
+    print(f"\n--- 📈 訂單生產進度追蹤報告 (Day 1 - Day {days_to_check} 累積) ---")
+    print(tabulate(display_df, headers='keys', tablefmt='fancy_grid', showindex=False))
     print("\n備註：應做進度條是根據上次排程 Day 1 到 Day {} 的計畫產量計算。".format(days_to_check))
     
     return {
-        "progress_data": progress_data,
-        "planned_jobs_by_display_name": planned_jobs_by_display_name
+        "progress_data": progress_df.to_dict('records'),
+        "planned_jobs_by_task": planned_jobs_by_task
     }
 
-def show_result(result, db_instance: GoogleSheetsDB):
-    """顯示排程結果並將最新的訂單、急單和排程結果存回資料庫"""
+def show_result(result, db_instance: GoogleSheetsDB, interactive: bool = True, diagnostics: bool = False):
+    """
+    顯示排程結果並將最新的訂單、急單和排程結果存回資料庫 (interactive=False 時不詢問是否顯示明細)
+    diagnostics: 顯示節點快取與 state 大小 (--debug / --profile)
+    """
+    
+    if diagnostics:
+        print(f"♻️ {NODE_CACHE.report()}")
+        print(f"📦 {STATE_SIZES.report()}")
+    print(f"⏱️ {NODE_TIMINGS.report()}")
     
     if result.get('schedule_result'):
         # schedule_result 是一個列表，每個元素已經包含 Day 和 Idle_People
         flat_schedule = result['schedule_result']
 
-        # 1. 顯示排程表到終端機
-        print("\n--- 📅 最新排程表 (含閒置人力計算) ---")
-        df = pd.DataFrame(flat_schedule)
-        # 嚴格遵循 11 欄位順序
-        cols = ["Day", "Product", "Headcount", "Actual_Hours", "plan_to", "Output", "Complete_Percent", "Idle_People", "Status", "Note", "priority"]
-        df = df[[c for c in cols if c in df.columns]]
-        
-        print(tabulate(df, headers='keys', tablefmt='psql', showindex=False))
+        # 1. 顯示排程表到終端機 (預設只顯示每日摘要，完整明細需要時再分頁顯示)
+        print("\n--- 📅 最新排程表：每日摘要 (含閒置人力計算) ---")
+        print_day_summary(flat_schedule, sys.stdout)
         print(f"\n✅ {result['schedule_summary']}")
         
-        # 2. 儲存到 Google Sheets
-        db_instance.save_schedule_results(flat_schedule)
-        
-        # 3. 將最新的訂單佇列（未完成的）存回 Google Sheets
-        updated_orders = [
-            order for order in result.get('orders', [])
-            if order.get('qty_remaining', order.get('qty', 0)) > 0
-        ]
-        updated_rush_orders = result.get('rush_orders', []) 
+        if interactive and input(f"是否顯示完整排程明細 ({len(flat_schedule)} 筆)? (y/N): ").strip().lower() == 'y':
+            page_schedule_detail(flat_schedule, sys.stdout)
         
-        db_instance.save_orders(updated_orders, updated_rush_orders)
-        
-        # 4. 儲存 SystemData 
-        db_instance.save_system_data('last_schedule_results', flat_schedule)
-        db_instance.save_system_data('last_schedule_date', datetime.now().strftime("%Y-%m-%d"))
+        # 2~4. 儲存排程結果、未完成訂單、SystemData 到 Google Sheets
+        db_instance.save_run_result(result)
         
         # 5. 儲存到本地檔案
-        save_schedule_to_file(df)
+        save_schedule_to_file(flat_schedule)
 
-        # 6. 發送郵件通知
-        print("📧 Email 通知已發送。")
+        # 6. 郵件通知 (notify 節點已排入背景寄信佇列，這裡不等待寄送)
+        if result.get('email_queued'):
+            print("📧 Email 通知已排入寄送佇列 (背景寄送)。")
+        else:
+            print("⚠️ Email 通知未寄出。")
 
     else:
         print("\n❌ 排程失敗，請檢查日誌。")
@@ -210,7 +161,128 @@ def show_result(result, db_instance: GoogleSheetsDB):
             print(f"[{log}]")
 
 # --- 主執行函式 ---
-def main():
+def run_schedule(app, state, reason: str, db_instance, diagnostics: bool = False):
+    """
+    以新的 thread id 執行排程並顯示/寫回結果。
+    流程中斷時回傳 None (可用選項 5 從最後完成的節點恢復)；寫回失敗時仍回傳排程結果。
+    """
+    thread_id = new_thread_id(reason)
+    print(f"🧵 執行編號 (thread id): {thread_id}")
+    # 節點耗時只保留這次執行 (上一次執行、或這次沒跑到的節點不混進報表)
+    NODE_TIMINGS.reset()
+    try:
+        result = run_graph(app, state, thread_id)
+    except Exception as e:
+        print(f"❌ 排程執行中斷: {e}")
+        print(f"   已完成的節點都有保存，可用選項 5 從中斷處繼續 (thread id: {thread_id})。")
+        return None
+    finish_run(result, db_instance, thread_id, diagnostics=diagnostics)
+    return result
+
+def finish_run(result, db_instance, thread_id: str, interactive: bool = True, diagnostics: bool = False):
+    """顯示結果並寫回資料庫；寫回失敗不影響已算好的排程。"""
+    try:
+        show_result(result, db_instance, interactive, diagnostics)
+    except Exception as e:
+        print(f"❌ 排程結果寫回失敗: {e}")
+        print(f"   排程結果已保存，可用選項 5 重新寫回 (thread id: {thread_id})，不需重新排程。")
+        return
+    # 【新增】訂單已寫回資料庫，這次匯入的 Packing Sheet 圖片才標記為已匯入
+    if result.get('schedule_result') and result.get('ingested_images'):
+        packing_image.IMAGE_CACHE.mark_ingested(result['ingested_images'])
+
+def quote_delivery(initial_state):
+    """選項 7：交期試算。用目前排程的剩餘產能試算新訂單的預計完工日，不改變訂單與排程。"""
+    product = input("請輸入產品型號: ").strip()
+    qty_str = input("請輸入數量: ").strip()
+    try:
+        qty = int(qty_str.replace(',', ''))
+    except ValueError:
+        print("❌ 數量格式錯誤。")
+        return
+    due_date = input("客戶要求交期 (可留空): ").strip()
+
+    profile = CapacityProfile(initial_state.get('last_schedule_results') or [], INVENTORY_STORE.current(),
+                              CALENDAR_STORE.current(), nodes.scheduler_settings(),
+                              schedule_date_of(initial_state.get('last_schedule_date')))
+    try:
+        quote = quote_order(product, qty, profile, INVENTORY_STORE.current(), due_date=due_date, known=nodes.known_matches())
+    except ValueError as e:
+        print(f"❌ {e}")
+        return
+
+    print(tabulate(quote['processes'], headers="keys", tablefmt="grid"))
+    if not quote['completion_date']:
+        print(f"⚠️ {quote['message']}")
+        return
+    print(f"📅 {product} {qty} pcs 預計 {quote['completion_date']} ({quote['completion_day']}) 完工 (試算 {quote['elapsed_ms']} ms)")
+    if quote['on_time'] is not None:
+        print("✅ 可以在要求交期前完成。" if quote['on_time'] else f"⚠️ 趕不上要求交期 {quote['due_date']}。")
+
+
+def choose_checkpoint_run(app, checkpointer):
+    """選項 5：列出最近的執行紀錄、檢視中間狀態，並從最後完成的節點恢復。回傳恢復後的結果 (或 None)。"""
+    runs = list_runs(checkpointer)
+    if not runs:
+        print("ℹ️ 沒有任何執行紀錄。")
+        return None, None
+
+    print("\n--- 🧵 最近的排程執行紀錄 ---")
+    for i, thread_id in enumerate(runs, start=1):
+        waiting = pending_nodes(app, thread_id)
+        status = f"⏸️ 停在 {', '.join(waiting)}" if waiting else "✅ 已完成"
+        print(f"  {i}. {thread_id}  {status}")
+
+    choice = input("請選擇要檢視的紀錄編號 (Enter 取消): ").strip()
+    if not choice:
+        return None, None
+    try:
+        thread_id = runs[int(choice) - 1]
+    except (ValueError, IndexError):
+        print("❌ 無效的選擇。")
+        return None, None
+
+    info = inspect_run(app, thread_id)
+    print(f"\n--- 執行步驟 ({thread_id}) ---")
+    print(tabulate(info['steps'], headers=["Step", "完成節點", "下一個節點"], tablefmt='simple'))
+    print("\n--- 最後保存的 State ---")
+    print(tabulate([(k, describe_value(v)) for k, v in info['values'].items()], headers=["欄位", "內容"], tablefmt='simple'))
+
+    if info['next']:
+        prompt = f"是否從節點 {', '.join(info['next'])} 繼續執行? (y/N): "
+    else:
+        prompt = "此次排程已完成，是否重新顯示並寫回結果? (y/N): "
+    if input(prompt).strip().lower() != 'y':
+        return None, None
+
+    NODE_TIMINGS.reset()
+    try:
+        return resume_run(app, thread_id), thread_id
+    except Exception as e:
+        print(f"❌ 恢復執行失敗: {e}")
+        return None, None
+
+def build_initial_state(order_book: OrderBook, system_data: Dict[str, Any]) -> Dict[str, Any]:
+    """由訂單簿與 SystemData 建立 Agent State。"""
+    last_schedule_date = system_data.get('last_schedule_date')
+    if not last_schedule_date or not isinstance(last_schedule_date, str):
+        last_schedule_date = datetime.now().strftime("%Y-%m-%d")
+
+    # 訂單以唯讀快照放進 state (order_book.snapshot)，多次執行之間共用、不會被流程改到
+    orders_snapshot, rush_snapshot = order_book.snapshot()
+    return {
+        "logs": ["系統啟動"],
+        "image_path": "",
+        "inventory_db": {}, 
+        "orders": orders_snapshot,
+        "rush_orders": rush_snapshot,
+        "daily_feedback": {}, 
+        "last_schedule_date": last_schedule_date,
+        "last_schedule_results": schedule_rows(system_data.get('last_schedule_results', []))
+    }
+
+def main(debug: bool = False):
+    """互動選單；debug=True (--debug) 時記錄並顯示節點快取與 state 大小。"""
     clear_screen()
     
     # 1. 初始化 Google Sheets DB
@@ -221,33 +293,23 @@ def main():
         db = None
         db_ready = False
     
-    # 2. 載入持久化數據 (如果 DB 失敗則載入空列表)
-    current_orders = db.load_orders() if db_ready and db else []
-    rush_orders = db.load_rush_orders() if db_ready and db else []
+    # 2. 載入持久化數據 (如果 DB 失敗則載入空列表)，並建立訂單簿索引
+    order_book = OrderBook(
+        db.load_orders() if db_ready and db else [],
+        db.load_rush_orders() if db_ready and db else []
+    )
     system_data = db.load_system_data() if db_ready and db else {}
     
     # 初始化 LangGraph
     try:
-        app = build_app()
+        checkpointer = open_checkpointer()
+        app = build_app(checkpointer=checkpointer, measure_sizes=debug)
     except Exception as e:
         print(f"❌ 警告: 無法初始化 Agent 流程圖 (LangGraph)。請確認 graph.py 或 nodes.py 文件完整性: {e}")
         return
 
     # 3. 初始化 Agent State (使用載入的持久化數據)
-    last_schedule_date = system_data.get('last_schedule_date')
-    if not last_schedule_date or not isinstance(last_schedule_date, str):
-        last_schedule_date = datetime.now().strftime("%Y-%m-%d")
-
-    initial_state = {
-        "logs": ["系統啟動"],
-        "image_path": "",
-        "inventory_db": {}, 
-        "orders": current_orders,
-        "rush_orders": rush_orders,
-        "daily_feedback": {}, 
-        "last_schedule_date": last_schedule_date,
-        "last_schedule_results": system_data.get('last_schedule_results', [])
-    }
+    initial_state = build_initial_state(order_book, system_data)
     
     print("\n=========================================")
     print("🏭 MINLEE 工廠智慧排程系統 v1.0 啟動")
@@ -257,21 +319,24 @@ def main():
          print("🚨 Google Sheets 連線失敗！將使用本地記憶體運行 🚨")
     print("=========================================")
     
-    if not current_orders:
+    if not order_book.count():
         print("ℹ️ 未載入到未完成訂單。")
         
-    if rush_orders:
-        print(f"⚠️ 載入 {len(rush_orders)} 筆未處理急單。")
+    if order_book.count(rush=True):
+        print(f"⚠️ 載入 {order_book.count(rush=True)} 筆未處理急單。")
 
     while True:
         print("\n--- 請選擇操作 ---")
-        print(f"訂單數量: {len(current_orders)} | 急單數量: {len(rush_orders)}")
+        print(f"訂單數量: {order_book.count()} | 急單數量: {order_book.count(rush=True)}")
         print("1. 🆕 匯入新訂單 & 重新排程 (從 'read_packing_sheet' 工作表)")
         print("2. ⚡ **急單** (新增/舊單轉急單 & 重排)")
         print("3. ✅ **每日生產進度回報** & 重排")
         print("4. 🚪 系統關閉 (並儲存資料)")
+        print("5. 🧵 檢視/恢復排程執行紀錄 (checkpoint)")
+        print("6. 🖼️ 從 Packing Sheet 圖片匯入訂單 & 重新排程")
+        print("7. 📅 交期試算 (不重排)")
         
-        choice = input("輸入選項 (1-4): ")
+        choice = input("輸入選項 (1-7): ")
 
         # --- 選項 1: 匯入新訂單 & 重新排程 ---
         if choice == "1":
@@ -287,37 +352,22 @@ def main():
                 print("ℹ️ 未找到新的訂單數據。")
                 continue
 
-            for new_order in new_orders:
-                existing_order = next((o for o in current_orders if o['product'] == new_order['product']), None)
-                if existing_order:
-                    print(f"⚠️ 產品 {new_order['product']} 已存在，更新剩餘數量。")
-                    existing_order['qty_remaining'] += new_order['qty']
-                    existing_order['qty'] = existing_order['qty_remaining'] 
-                else:
-                    current_orders.append({
-                        "order_id": new_order.get('order_id', ''),  # 【新增】訂單編號
-                        "product": new_order['product'],
-                        "qty": new_order['qty'],
-                        "qty_remaining": new_order['qty'],
-                        "is_rush": False,
-                        "due_date": new_order['due_date'],
-                        "raw_packing_sheet": new_order.get('raw_data', ''),
-                        "date_created": datetime.now().strftime('%Y-%m-%d')
-                    })
+            # 【修改】只有同一筆訂單 (order_id + 產品) 才合併，不同訂單各自保留 due_date
+            for existing_order in order_book.merge_new_orders(new_orders, datetime.now().strftime('%Y-%m-%d')):
+                print(f"⚠️ 訂單 {existing_order.get('order_id', '')} 產品 {existing_order['product']} 已存在，更新剩餘數量。")
 
             print("🚀 正在根據新訂單重新排程...")
             initial_state["logs"] = [f"開始排程：處理 {len(new_orders)} 筆新訂單。"]
-            initial_state["orders"] = current_orders
-            initial_state["rush_orders"] = rush_orders
+            initial_state["orders"], initial_state["rush_orders"] = order_book.snapshot()
             initial_state["image_path"] = "" 
 
-            result = app.invoke(initial_state)
-            show_result(result, db)
+            result = run_schedule(app, initial_state, 'orders', db, diagnostics=debug)
+            if result is None:
+                continue
             
             # 【重要】更新 initial_state 的 last_schedule_results
             initial_state['last_schedule_results'] = result.get('schedule_result', [])
-            current_orders = result.get('orders', current_orders)
-            rush_orders = result.get('rush_orders', rush_orders)
+            order_book.reset(result.get('orders', order_book.orders), result.get('rush_orders', order_book.rush_orders))
             
         # --- 選項 2: 急單 (新增/舊單轉急單 & 重排) ---
         elif choice == "2":
@@ -350,60 +400,30 @@ def main():
             if rush_type == 'A':
                 # 【新增】生成臨時訂單編號
                 temp_order_id = f"RUSH-{datetime.now().strftime('%Y%m%d%H%M%S')}"
-                initial_rush_order = {
-                    "order_id": temp_order_id,  # 【新增】臨時訂單編號
-                    "product": p_name, 
-                    "qty": qty, 
-                    "is_rush": True,
-                    "qty_remaining": qty,
-                    "qty_total": qty,
-                    "date_created": datetime.now().strftime("%Y-%m-%d")
-                }
-                rush_orders.append(initial_rush_order)
+                order_book.add_new_rush(p_name, qty, temp_order_id, datetime.now().strftime("%Y-%m-%d"))
                 print(f"✅ 新急單【{p_name}】({qty} pcs) 已加入急單佇列。")
                 
             elif rush_type == 'B':
-                found_orders = [o for o in current_orders if o['product'] == p_name]
+                # 從常規訂單中移除 (確保互斥，避免重複計算)，每筆原訂單各自轉成急單
+                converted = order_book.convert_to_rush(p_name, qty)
                 
-                if found_orders:
-                    # 1. 從 current_orders 中移除 (確保互斥，避免重複計算)
-                    current_orders
-                    current_orders = [o for o in current_orders if o['product'] != p_name]
-
-                    # 2. 創建新的 rush_order 項目（保留原訂單的 order_id）
-                    original_order_id = found_orders[0].get('order_id', '')  # 【新增】取得原訂單的 order_id
-                    new_rush_order_item = {
-                         "order_id": original_order_id,  # 【新增】保留原訂單編號
-                         "product": p_name, 
-                         "qty": qty, 
-                         "is_rush": True,
-                         "qty_remaining": qty,
-                         "qty_total": max([o.get('qty', qty) for o in found_orders]) 
-                    }
-                    
-                    # 3. 更新 rush_orders
-                    existing_rush = next((r for r in rush_orders if r['product'] == p_name), None)
-                    if existing_rush:
-                        existing_rush.update(new_rush_order_item)
-                    else:
-                        rush_orders.append(new_rush_order_item)
-                        
-                    print(f"✅ 舊單【{p_name}】已標記為急單，剩餘數量設為 {qty} pcs，並從常規訂單中移除。")
-                    
+                if converted:
+                    print(f"✅ 舊單【{p_name}】共 {len(converted)} 筆訂單已標記為急單，加速數量 {qty} pcs，並從常規訂單中移除。")
                 else:
                     print(f"❌ 找不到型號【{p_name}】在當前未完成訂單中。請確認型號或改選 'A' 新增急單。")
                     
             # 執行重排
+            initial_state["orders"], initial_state["rush_orders"] = order_book.snapshot()
             initial_state["image_path"] = ""
             print("🚀 正在根據最新的訂單資訊重新排程...\n")
 
-            result = app.invoke(initial_state)
-            show_result(result, db)
+            result = run_schedule(app, initial_state, 'rush', db, diagnostics=debug)
+            if result is None:
+                continue
             
             # 【重要】更新 initial_state 的 last_schedule_results
             initial_state['last_schedule_results'] = result.get('schedule_result', [])
-            current_orders = result.get('orders', current_orders)
-            rush_orders = result.get('rush_orders', rush_orders)
+            order_book.reset(result.get('orders', order_book.orders), result.get('rush_orders', order_book.rush_orders))
             
         # --- 選項 3: 回報昨日產能 & 調整排程 ---
         elif choice == "3":
@@ -421,10 +441,8 @@ def main():
                 continue
 
             # 1. 手動輸入要回報的天數
-            max_day_in_schedule = max(
-                (int(job['Day'].split(' ')[-1]) for job in last_schedule_results if job.get('Day')), 
-                default=0
-            )
+            day_numbers = parse_day_numbers(pd.Series([job.get('Day', '') for job in last_schedule_results])).dropna()
+            max_day_in_schedule = int(day_numbers.max()) if not day_numbers.empty else 0
 
             days_to_check_input = input(f"請輸入要檢查【累積到 Day 幾】的進度 (上次排程排到 Day {max_day_in_schedule}): ")
             try:
@@ -440,132 +458,261 @@ def main():
             print(f"⏰ 正在檢查 Day 1 到 Day {days_to_check} 的【累積】進度...")
 
             # 2. 顯示應做進度報告 (基於上次排程結果)
-            progress_data_combined = show_progress_report(last_schedule_results, current_orders, days_to_check)
+            progress_data_combined = show_progress_report(last_schedule_results, order_book, days_to_check)
             
             if not progress_data_combined:
                 continue
 
             progress_data = progress_data_combined['progress_data']
-            planned_jobs_by_display_name = progress_data_combined['planned_jobs_by_display_name']
+            planned_jobs_by_task = progress_data_combined['planned_jobs_by_task']
             
-            # 3. 讓使用者【按工序】回報當日產量
-            print("\n--- 實際產量回報 (按工序) ---")
+            # 3. 讓使用者【按訂單工序】回報當日產量
+            print("\n--- 實際產量回報 (按訂單工序) ---")
             
-            scheduled_jobs_for_report = sorted(planned_jobs_by_display_name.keys())
-            real_output_by_product_name = defaultdict(int)
-            actual_output_by_task = {}  # 【新增】記錄每個工序的實際產量
+            # 依產品、截止日期排序，同產品的不同訂單會排在一起
+            scheduled_jobs_for_report = sorted(
+                planned_jobs_by_task.keys(),
+                key=lambda k: (planned_jobs_by_task[k]['raw_product'], k[1], k[0])
+            )
+            real_output_by_order = defaultdict(int)
+            actual_output_by_task = {}  # 【新增】記錄每個訂單工序的實際產量
 
-            for display_name in scheduled_jobs_for_report:
-                job_info = planned_jobs_by_display_name[display_name]
+            for task_key in scheduled_jobs_for_report:
+                job_info = planned_jobs_by_task[task_key]
+                o_key, display_name = task_key
                 raw_product = job_info['raw_product']
                 planned_output = job_info['planned_output']
                 
-                current_order_for_check = next((o for o in current_orders if o['product'] == raw_product), None)
-                if not current_order_for_check:
+                if not order_book.get(o_key):
                     continue
                 
-                qty_input = input(f"請輸入工序【{display_name}】累積到 Day {days_to_check} 的實際產出數量 (pcs) (排程應做 {planned_output} pcs): ")
+                order_label = f"{job_info['order_id']} " if job_info['order_id'] else ""
+                qty_input = input(f"請輸入訂單 {order_label}工序【{display_name}】累積到 Day {days_to_check} 的實際產出數量 (pcs) (排程應做 {planned_output} pcs): ")
                 try:
                     job_actual_output = int(qty_input)
-                    
-                    real_output_by_product_name[raw_product] = max(real_output_by_product_name[raw_product], job_actual_output)
-                    
-                    # 【新增】記錄工序的實際產量
-                    actual_output_by_task[display_name] = {
-                        'actual': job_actual_output,
-                        'product': raw_product
-                    }
-                    
                 except ValueError:
                     print(f"❌ 工序【{display_name}】輸入無效，設為 0。")
                     # 【新增】輸入無效時也記錄為 0
-                    actual_output_by_task[display_name] = {
-                        'actual': 0,
-                        'product': raw_product
-                    }
+                    job_actual_output = 0
+                
+                real_output_by_order[o_key] = max(real_output_by_order[o_key], job_actual_output)
+                
+                # 【新增】記錄工序的實際產量
+                actual_output_by_task[task_key] = {
+                    'actual': job_actual_output,
+                    'product': raw_product,
+                    'order_id': job_info['order_id'],
+                    'display_name': display_name
+                }
             
             # 【新增】將實際產量寫入 percent 工作表
             if actual_output_by_task:
                 print("\n--- 💾 將實際產量寫入 percent 工作表 ---")
-                db.save_percent_data(actual_output_by_task, days_to_check, last_schedule_results, current_orders, rush_orders)
-            
-            
-            # 4. 根據回報更新訂單狀態 (current_orders) 並檢查是否落後
-            lagging_jobs_count = 0
-            new_rush_orders = []
-            lagging_products = set()  # 【新增】記錄落後的產品
+                percent_rows = db.save_percent_data(actual_output_by_task, days_to_check, last_schedule_results, order_book.orders, order_book.rush_orders)
+                # 【新增】實際 / 計劃產量回饋到 UPH 校正 (只處理這次寫入的資料列)
+                record_actuals(percent_rows or [], schedule_id_of(last_schedule_results, initial_state['last_schedule_date']), last_schedule_results)
             
-            for product_data in progress_data:
-                product_name = product_data['產品型號']
-                total_qty = product_data['總訂單量']
-                
-                current_order = next((o for o in current_orders if o['product'] == product_name), None)
-                if not current_order:
-                    continue 
-
-                total_actual_output = real_output_by_product_name.get(product_name, 0)
-                new_qty_remaining = max(0, total_qty - total_actual_output)
-                planned_output = product_data['應做數量']
-                
-                if total_actual_output < planned_output:
-                    lagging_qty = planned_output - total_actual_output
-                    print(f"🚨 {product_name} 落後了 {lagging_qty} pcs！將剩餘訂單加入急單隊列。")
-                    
-                    if new_qty_remaining > 0:
-                         new_rush_orders.append({
-                            "order_id": current_order.get('order_id', ''),
-                            "product": product_name, 
-                            "qty": new_qty_remaining,
-                            "qty_remaining": new_qty_remaining,
-                            "is_rush": True,
-                            "qty_total": current_order.get('qty', total_qty) 
-                        })
-                    lagging_jobs_count += 1
-                    lagging_products.add(product_name)  # 【新增】標記為落後
-                
-                # 【修改】更新訂單的剩餘數量
-                current_order['qty_remaining'] = new_qty_remaining
             
-            # 【修改】過濾 current_orders：移除落後的產品（它們已經在 rush_orders 裡）
-            current_orders = [
-                o for o in current_orders 
-                if o['qty_remaining'] > 0 and o['product'] not in lagging_products
-            ]
+            # 4. 根據回報更新訂單狀態 (order_book) 並檢查是否落後；落後訂單轉入急單佇列
+            lagging = order_book.apply_progress(progress_data, real_output_by_order)
+            for item in lagging:
+                print(f"🚨 {item['order_id']} {item['product']} 落後了 {item['lagging_qty']} pcs！將剩餘訂單加入急單隊列。")
+            lagging_jobs_count = len(lagging)
             
             # 5. 重排邏輯
             if lagging_jobs_count > 0:
-                rush_orders = new_rush_orders
-                
-                print(f"\n🚀 發現 {lagging_jobs_count} 個產品落後，正在觸發緊急重排...")
+                print(f"\n🚀 發現 {lagging_jobs_count} 筆訂單落後，正在觸發緊急重排...")
                 
                 initial_state["image_path"] = ""
-                initial_state["orders"] = current_orders 
-                initial_state["rush_orders"] = rush_orders 
+                initial_state["orders"], initial_state["rush_orders"] = order_book.snapshot()
                 
-                result = app.invoke(initial_state)
-                show_result(result, db)
+                result = run_schedule(app, initial_state, 'progress', db, diagnostics=debug)
+                if result is None:
+                    continue
                 
                 # 【重要】更新 initial_state 的 last_schedule_results
                 initial_state['last_schedule_results'] = result.get('schedule_result', [])
-                current_orders = result.get('orders', current_orders)
-                rush_orders = result.get('rush_orders', rush_orders)
+                order_book.reset(result.get('orders', order_book.orders), result.get('rush_orders', order_book.rush_orders))
             else:
                 print("🎉 所有產品都已達標或超前！無需重排。")
-                db.save_orders(current_orders, rush_orders)
+                db.save_orders(*order_book.as_lists())
                 db.save_system_data('last_schedule_date', datetime.now().strftime("%Y-%m-%d"))
 
 
         elif choice == "4":
             print("👋 系統關閉。")
             if db_ready:
-                db.save_orders(current_orders, rush_orders)
+                db.save_orders(*order_book.as_lists())
                 db.save_system_data('last_schedule_date', datetime.now().strftime("%Y-%m-%d"))
                 print("✅ 訂單與狀態資料已儲存到 Google Sheets。")
             
             break
         
+        # --- 選項 5: 檢視/恢復排程執行紀錄 ---
+        elif choice == "5":
+            result, thread_id = choose_checkpoint_run(app, checkpointer)
+            if result is None:
+                continue
+            
+            finish_run(result, db, thread_id, diagnostics=debug)
+            initial_state['last_schedule_results'] = result.get('schedule_result', [])
+            order_book.reset(result.get('orders', order_book.orders), result.get('rush_orders', order_book.rush_orders))
+        
+        # --- 選項 6: 從 Packing Sheet 圖片匯入訂單 & 重新排程 ---
+        elif choice == "6":
+            if not db_ready:
+                 print("❌ 錯誤: Google Sheets 連線失敗，無法執行此操作。")
+                 continue
+
+            paths_input = input("請輸入 Packing Sheet 圖片路徑 (多張以逗號分隔): ")
+            image_paths = [p.strip().strip('"') for p in paths_input.split(',') if p.strip()]
+            missing = [p for p in image_paths if not os.path.isfile(p)]
+            if not image_paths or missing:
+                print(f"❌ 找不到圖片: {', '.join(missing) or '(未輸入)'}")
+                continue
+
+            print(f"🚀 正在辨識 {len(image_paths)} 張 Packing Sheet 並重新排程...")
+            initial_state["logs"] = [f"開始排程：匯入 {len(image_paths)} 張 Packing Sheet 圖片。"]
+            initial_state["orders"], initial_state["rush_orders"] = order_book.snapshot()
+            initial_state["image_paths"] = image_paths
+            
+            result = run_schedule(app, initial_state, 'image', db, diagnostics=debug)
+            initial_state["image_paths"] = []
+            if result is None:
+                continue
+            
+            initial_state['last_schedule_results'] = result.get('schedule_result', [])
+            order_book.reset(result.get('orders', order_book.orders), result.get('rush_orders', order_book.rush_orders))
+        
+        # --- 選項 7: 交期試算 ---
+        elif choice == "7":
+            quote_delivery(initial_state)
+        
         else:
             print("❌ 無效的選擇，請重新輸入。")
 
+def run_profile(args):
+    """
+    --profile：在 profiler 下執行一次完整重排 (載入訂單 -> 排程流程 -> 顯示/寫回)，
+    輸出 pstats、collapsed stacks (flamegraph) 與每個節點 / 階段的 wall vs CPU 時間。
+    不使用節點快取，checkpoint 只存在記憶體中。
+    """
+    profiler = PipelineProfiler()
+    with profiler.profile():
+        with profiler.phase('connect'):
+            if args.memory:
+                db = InMemoryDB()
+                print("ℹ️ Profile 模式使用記憶體資料庫 (不連線 Google Sheets)。")
+            else:
+                try:
+                    db = GoogleSheetsDB()
+                except Exception as e:
+                    print(f"❌ 無法執行 profile: Google Sheets 連線失敗 ({e})。可加上 --memory 改用記憶體資料庫。")
+                    return
+        with profiler.phase('load'):
+            order_book = OrderBook(db.load_orders(), db.load_rush_orders())
+            initial_state = build_initial_state(order_book, db.load_system_data())
+        app = build_app(node_cache=None, checkpointer=open_checkpointer(':memory:'), profiler=profiler)
+
+        thread_id = new_thread_id('profile')
+        print(f"🔬 Profile 排程 ({order_book.count()} 筆訂單，{order_book.count(rush=True)} 筆急單)，thread id: {thread_id}")
+        with profiler.phase('graph'):
+            NODE_TIMINGS.reset()
+            result = run_graph(app, initial_state, thread_id)
+        with profiler.phase('show_and_save'):
+            finish_run(result, db, thread_id, interactive=False, diagnostics=True)
+
+    paths = profiler.write(args.profile_dir)
+    print(f"\n{profiler.report()}")
+    print(f"📄 pstats: {paths['pstats']} (python -m pstats / snakeviz)")
+    print(f"🔥 collapsed stacks: {paths['collapsed']} (flamegraph.pl / speedscope)")
+    print(f"📝 摘要: {paths['summary']}")
+
+def run_risk(args):
+    """
+    --risk：Monte Carlo 排程風險模擬 (不重排、不寫回)。
+    以目前訂單建立工單 (產品匹配沿用 LLM)，依 percent 工作表估計各工序 UPH 變異，執行 --risk-runs 次擾動模擬，
+    列出各訂單的準時機率與 P50 / P90 完工天數。
+    """
+    if args.memory:
+        db = InMemoryDB()
+        print("ℹ️ 風險模擬使用記憶體資料庫 (不連線 Google Sheets)。")
+    else:
+        try:
+            db = GoogleSheetsDB()
+        except Exception as e:
+            print(f"❌ 無法執行風險模擬: Google Sheets 連線失敗 ({e})。可加上 --memory 改用記憶體資料庫。")
+            return
+    order_book = OrderBook(db.load_orders(), db.load_rush_orders())
+    if not order_book.count() and not order_book.count(rush=True):
+        print("ℹ️ 沒有未完成訂單，無需風險模擬。")
+        return
+
+    inventory = INVENTORY_STORE.current()
+    all_jobs, unknown = nodes.build_jobs(order_book.orders, order_book.rush_orders, inventory)
+    if unknown:
+        print(f"⚠️ 以下產品找不到工序，不納入模擬: {', '.join(unknown)}")
+    # 【修改】UPH 實績取自 UPH 校正檔累計的歷史 (percent 工作表每次回報都會清空)
+    uph_model = UphModel.from_log_stats(CALIBRATION_STORE.current().log_ratio_stats())
+
+    print(f"🎲 風險模擬：{len(all_jobs)} 個工序，{args.risk_runs} 次 (UPH 實績資料 {len(uph_model.params)} 個工序，缺勤率 {args.absence_rate:.0%})...")
+    risk = simulate_risk(all_jobs, nodes.scheduler_settings(), CALENDAR_STORE.current(), runs=args.risk_runs,
+                         seed=args.seed, uph_model=uph_model, absence_rate=args.absence_rate, workers=args.workers)
+
+    rows = [{
+        "訂單": r['order_id'], "產品": r['product'], "截止日期": r['due_date'] or '-',
+        "準時機率": f"{r['on_time_probability']:.0%}" if r['on_time_probability'] is not None else '-',
+        "P50 完工": f"Day {r['p50_day']}" if r['p50_day'] else '未完工',
+        "P90 完工": f"Day {r['p90_day']}" if r['p90_day'] else '未完工',
+    } for r in risk['orders']]
+    print(tabulate(rows, headers="keys", tablefmt="grid"))
+    print(f"📊 全部完工：P50 Day {risk['makespan']['p50']} / P90 Day {risk['makespan']['p90']} "
+          f"({risk['runs']} 次模擬，{risk['workers']} 個行程，{risk['seconds']} 秒)")
+
+def run_service(args):
+    """服務模式：常駐 HTTP 服務，保持 LangGraph / DB 連線 / 匹配快取熱啟動；--watch 時監看 read_packing_sheet 新訂單。"""
+    if args.memory:
+        db = InMemoryDB()
+        print("ℹ️ 服務模式使用記憶體資料庫 (不連線 Google Sheets)。")
+    else:
+        try:
+            db = GoogleSheetsDB()
+        except Exception as e:
+            print(f"❌ 無法啟動服務: Google Sheets 連線失敗 ({e})。可加上 --memory 改用記憶體資料庫。")
+            return
+    # --debug：記錄各節點寫入 state 的資料量 (GET /schedule 的 state_sizes)
+    app = build_app(checkpointer=open_checkpointer(), measure_sizes=True) if args.debug else None
+    if args.serve:
+        serve(db, args.host, args.port, app=app, watch=args.watch, watch_interval=args.interval)
+    else:
+        watch(db, app=app, interval=args.interval)
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="MINLEE 工廠智慧排程系統")
+    parser.add_argument('--serve', action='store_true', help='以本機 HTTP 服務模式執行 (預設為互動選單)')
+    parser.add_argument('--host', default=DEFAULT_HOST, help='服務模式監聽位址')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='服務模式監聽埠號')
+    parser.add_argument('--memory', action='store_true', help='服務模式改用記憶體資料庫 (本機測試用)')
+    parser.add_argument('--watch', action='store_true', help='監看模式：輪詢 read_packing_sheet，新訂單自動排程 (可與 --serve 併用)')
+    parser.add_argument('--interval', type=float, default=DEFAULT_POLL_INTERVAL, help='監看模式輪詢間隔 (秒)')
+    parser.add_argument('--profile', action='store_true', help='在 profiler 下執行一次重排，輸出 pstats 與 collapsed stacks (可搭配 --memory)')
+    parser.add_argument('--profile-dir', default=DEFAULT_PROFILE_DIR, help='--profile 的輸出資料夾')
+    parser.add_argument('--risk', action='store_true', help='Monte Carlo 排程風險模擬：各訂單準時機率與 P50 / P90 完工天數 (可搭配 --memory)')
+    parser.add_argument('--risk-runs', type=int, default=DEFAULT_RUNS, help='--risk 的模擬次數')
+    parser.add_argument('--absence-rate', type=float, default=DEFAULT_ABSENCE_RATE, help='--risk 每人每天的缺勤機率')
+    parser.add_argument('--workers', type=int, default=None, help='--risk 的平行行程數 (預設為 CPU 核心數)')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help='--risk 的亂數種子')
+    parser.add_argument('--debug', action='store_true', help='記錄並顯示節點快取與 state 大小診斷 (互動選單 / 服務模式)')
+    parser.add_argument('--trace-summary', action='store_true', help='彙總追蹤紀錄 (traces.jsonl)：各 span 的 p50 / p95 耗時')
+    args = parser.parse_args()
+    
+    if args.trace_summary:
+        print_trace_summary()
+    elif args.profile:
+        run_profile(args)
+    elif args.risk:
+        run_risk(args)
+    elif args.serve or args.watch:
+        run_service(args)
+    else:
+        main(debug=args.debug)
\ No newline at end of file
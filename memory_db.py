@@ -0,0 +1,116 @@
+import copy
+import threading
+from collections import defaultdict
+from datetime import datetime
+from typing import List, Dict, Any, Optional
+
+from agent.order_book import row_key_of
+from agent.schedule_spans import compress_schedule, expand_schedule
+
+
+class InMemoryDB:
+    """
+    記憶體版的資料庫，介面與 GoogleSheetsDB 相同 (load_* / save_*)。
+    用於服務模式的本機測試，或 Google Sheets 無法連線時在本地記憶體運行。
+    """
+    def __init__(self, orders: Optional[List[Dict[str, Any]]] = None,
+                 rush_orders: Optional[List[Dict[str, Any]]] = None,
+                 new_orders: Optional[List[Dict[str, Any]]] = None):
+        self._lock = threading.Lock()
+        self.orders = copy.deepcopy(orders or [])
+        self.rush_orders = copy.deepcopy(rush_orders or [])
+        self.system_data: Dict[str, Any] = {}
+        # 排程結果以區段格式保存 (與 GoogleSheetsDB 的 SystemData 相同，見 agent.schedule_spans)
+        self.schedule_results: Dict[str, Any] = compress_schedule([])
+        self.percent_rows: List[List[Any]] = []
+        # read_packing_sheet 中尚未排程的新訂單 (格式同 load_new_orders_from_sheet 的回傳)
+        self.pending_new_orders = copy.deepcopy(new_orders or [])
+        # read_packing_sheet 的資料列 (第 2 列起)，供 load_new_orders_since 增量讀取
+        self.sheet_rows: List[Dict[str, Any]] = []
+        self.scheduled_rows = set()
+
+    def load_orders(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return copy.deepcopy(self.orders)
+
+    def load_rush_orders(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return copy.deepcopy(self.rush_orders)
+
+    def load_system_data(self) -> Dict[str, Any]:
+        with self._lock:
+            return copy.deepcopy(self.system_data)
+
+    def save_system_data(self, key: str, value: Any):
+        with self._lock:
+            self.system_data[key] = copy.deepcopy(value)
+
+    def load_new_orders_from_sheet(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            new_orders, self.pending_new_orders = self.pending_new_orders, []
+            return new_orders
+
+    def append_sheet_rows(self, new_orders: List[Dict[str, Any]]):
+        """模擬有人在 read_packing_sheet 新增資料列 (監看模式的本機測試用)。"""
+        with self._lock:
+            self.sheet_rows.extend(copy.deepcopy(new_orders))
+
+    def load_new_orders_since(self, high_water_mark: int):
+        """與 GoogleSheetsDB.load_new_orders_since 相同：只回傳 high_water_mark 之後的列。"""
+        with self._lock:
+            start = max(high_water_mark, 1) - 1
+            tail = self.sheet_rows[start:]
+            row_indices = list(range(start + 2, start + 2 + len(tail)))
+            return copy.deepcopy(tail), row_indices, len(self.sheet_rows) + 1
+
+    def mark_rows_scheduled(self, row_indices: List[int]):
+        with self._lock:
+            self.scheduled_rows.update(row_indices)
+
+    def save_orders(self, orders: List[Dict[str, Any]], rush_orders: List[Dict[str, Any]]):
+        with self._lock:
+            self.orders = copy.deepcopy(orders)
+            self.rush_orders = copy.deepcopy(rush_orders)
+
+    def save_schedule_results(self, schedule_result: List[Dict[str, Any]], layout: str = None):
+        compressed = compress_schedule(schedule_result)
+        with self._lock:
+            self.schedule_results = compressed
+
+    def load_schedule_results(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            compressed = self.schedule_results
+        return expand_schedule(compressed)
+
+    def save_run_result(self, result: Dict[str, Any]):
+        flat_schedule = result.get('schedule_result', [])
+        self.save_schedule_results(flat_schedule)
+        self.save_orders(
+            [o for o in result.get('orders', []) if o.get('qty_remaining', o.get('qty', 0)) > 0],
+            result.get('rush_orders', [])
+        )
+        self.save_system_data('last_schedule_results', compress_schedule(flat_schedule))
+        self.save_system_data('last_schedule_date', datetime.now().strftime("%Y-%m-%d"))
+
+    def save_percent_data(self, actual_output_by_task: dict, days_to_report: int, schedule_data: list, current_orders: list, rush_orders: list) -> List[Dict[str, Any]]:
+        # 計劃產量 = 排程中該訂單工序到 Day N 為止的產量合計 (與 GoogleSheetsDB 相同)
+        planned = defaultdict(int)
+        for task in schedule_data:
+            day = str(task.get('Day', '')).replace('Day ', '')
+            if day.isdigit() and int(day) <= days_to_report:
+                planned[(row_key_of(task), task.get('plan_to', ''))] += task.get('Output', 0)
+        with self._lock:
+            self.percent_rows = [
+                [f'Day {days_to_report}', data.get('order_id', ''), data.get('display_name', ''), data['product'], data['actual'],
+                 planned.get(task_key, 0)]
+                for task_key, data in actual_output_by_task.items()
+            ]
+        return self.load_percent_data()
+
+    def load_percent_data(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [
+                {"Day": day, "order_id": order_id, "Product": process, "Raw_Product_Name": product,
+                 "Actual_Output": actual, "Planned_Output": planned}
+                for day, order_id, process, product, actual, planned in self.percent_rows
+            ]
@@ -0,0 +1,549 @@
+"""
+端對端錄製 / 重播 (main.py 互動選單，選項 1 ~ 3)
+
+錄製：連線真的 Google Sheets 與 Gemini 執行 main.py，把以下流量存成本機 fixture (JSON)：
+- 每張工作表第一次使用時的內容 (sheet values in)
+- 所有寫入工作表的呼叫與參數 (sheet values out)
+- LLM 的 prompt 與回應 (含耗時)
+- 選單輸入 (input)
+重播：以行程內的 gspread 工作表模擬 (FakeSpreadsheet) 與聊天模型模擬 (FakeChatModel) 重跑同一段操作，
+不需要網路；報告每個操作的端對端耗時、API 呼叫次數，以及寫回工作表的內容是否與錄製時相同。
+
+用法:
+    python replay.py record fixtures/session.json   # 錄製 (照常操作選單，選 4 結束)
+    python replay.py replay fixtures/session.json   # 重播並比較
+    python replay.py replay fixtures/session.json --llm-latency   # 重播時加上錄製時的 LLM 延遲
+"""
+import argparse
+import builtins
+import contextlib
+import hashlib
+import io
+import json
+import os
+import re
+import sys
+import time
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+import gspread
+from gspread.cell import Cell
+from gspread.utils import a1_range_to_grid_range
+from langchain_core.messages import AIMessage
+from tabulate import tabulate
+
+FIXTURE_VERSION = 1
+
+# 會修改工作表內容的 gspread 方法 (錄製 / 比對的 sheet values out)
+WRITE_METHODS = {'append_row', 'append_rows', 'clear', 'update_cells', 'update', 'batch_update', 'add_worksheet'}
+
+# 主選單的輸入提示 (每次出現代表上一個操作結束、下一個操作開始)
+MENU_PROMPT = '輸入選項'
+
+# 比對輸出時忽略日期 / 時間 (錄製與重播不在同一天)，包含以時間產生的編號 (例如 RUSH-20250101093000)
+_DATE_RE = re.compile(r'\d{4}-\d{2}-\d{2}(?:[ T]\d{2}:\d{2}(?::\d{2})?)?|\d{8}-?\d{6}')
+
+
+def _jsonable(value: Any) -> Any:
+    """把 gspread 呼叫的參數 / 回傳值轉成可存進 JSON 的格式 (Cell -> {row, col, value})。"""
+    if isinstance(value, Cell):
+        return {"row": value.row, "col": value.col, "value": value.value}
+    if isinstance(value, dict):
+        return {str(k): _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, str):
+        return _DATE_RE.sub('<date>', value)
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def _cell_text(value: Any) -> str:
+    """寫入工作表後讀回來的字串 (與 gspread RAW 寫入相同：布林值為 TRUE / FALSE)。"""
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'TRUE' if value else 'FALSE'
+    return str(value)
+
+
+def _numericise(value: str) -> Any:
+    """get_all_records 的數值轉換 (與 gspread 相同：看起來像數字的字串轉成 int / float)。"""
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def prompt_text(prompt: Any) -> str:
+    """LLM 輸入的文字內容 (圖片只保留內容雜湊，避免 fixture 過大)。"""
+    if isinstance(prompt, str):
+        return prompt
+    parts = []
+    for message in prompt if isinstance(prompt, list) else [prompt]:
+        content = getattr(message, 'content', message)
+        if isinstance(content, str):
+            parts.append(content)
+            continue
+        for part in content:
+            if isinstance(part, dict) and part.get('type') == 'text':
+                parts.append(part.get('text', ''))
+            elif isinstance(part, dict) and part.get('type') == 'image_url':
+                url = part.get('image_url', {}).get('url', '')
+                parts.append(f"<image {hashlib.sha256(url.encode('utf-8')).hexdigest()[:16]}>")
+    return "\n".join(parts)
+
+
+def prompt_hash(prompt: Any) -> str:
+    return hashlib.sha256(prompt_text(prompt).encode('utf-8')).hexdigest()
+
+
+class Session:
+    """
+    一次錄製或重播的統計：每個選單操作 (action) 的耗時、gspread / LLM / Email 呼叫次數，以及所有寫入。
+    耗時不含等待使用者輸入的時間。
+    """
+
+    def __init__(self):
+        self.actions: List[Dict[str, Any]] = []
+        self.writes: List[Dict[str, Any]] = []
+        self.sheets: Dict[str, List[List[str]]] = {}
+        self.llm: List[Dict[str, Any]] = []
+        self.inputs: List[str] = []
+        self._action: Optional[Dict[str, Any]] = None
+        self._started = 0.0
+        self._waited = 0.0
+
+    def begin(self, name: str):
+        self.end()
+        self._action = {"action": name, "seconds": 0.0, "sheet_calls": {}, "llm_calls": 0, "emails": 0}
+        self._started = time.perf_counter()
+        self._waited = 0.0
+
+    def end(self):
+        if self._action is None:
+            return
+        self._action["seconds"] = round(time.perf_counter() - self._started - self._waited, 4)
+        self.actions.append(self._action)
+        self._action = None
+
+    def waited(self, seconds: float):
+        self._waited += seconds
+
+    def _current(self) -> Dict[str, Any]:
+        if self._action is None:
+            self.begin('shutdown' if self.actions else 'startup')
+        return self._action
+
+    def count_sheet(self, method: str):
+        calls = self._current()["sheet_calls"]
+        calls[method] = calls.get(method, 0) + 1
+
+    def count(self, field: str):
+        self._current()[field] += 1
+
+    def record_write(self, sheet: str, method: str, args, kwargs):
+        self.writes.append({"sheet": sheet, "method": method, "args": _jsonable(list(args)), "kwargs": _jsonable(kwargs)})
+
+    def to_fixture(self) -> Dict[str, Any]:
+        return {
+            "version": FIXTURE_VERSION,
+            "recorded_at": datetime.now().isoformat(timespec='seconds'),
+            "inputs": self.inputs,
+            "sheets": self.sheets,
+            "llm": self.llm,
+            "actions": self.actions,
+            "writes": self.writes,
+        }
+
+
+# --- 錄製：包裝真的 gspread / 聊天模型 ---
+
+class RecordingWorksheet:
+    def __init__(self, worksheet, name: str, session: Session):
+        self._ws = worksheet
+        self._name = name
+        self._session = session
+
+    def __getattr__(self, attr):
+        value = getattr(self._ws, attr)
+        if not callable(value) or attr.startswith('_'):
+            return value
+
+        def call(*args, **kwargs):
+            self._session.count_sheet(attr)
+            if attr in WRITE_METHODS:
+                self._session.record_write(self._name, attr, args, kwargs)
+            return value(*args, **kwargs)
+
+        return call
+
+
+class RecordingSpreadsheet:
+    def __init__(self, spreadsheet, session: Session):
+        self._spreadsheet = spreadsheet
+        self._session = session
+
+    def worksheet(self, name: str):
+        ws = self._spreadsheet.worksheet(name)
+        if name not in self._session.sheets:
+            self._session.sheets[name] = ws.get_all_values()
+        return RecordingWorksheet(ws, name, self._session)
+
+    def add_worksheet(self, title: str, rows, cols):
+        self._session.record_write(title, 'add_worksheet', (), {"rows": rows, "cols": cols})
+        ws = self._spreadsheet.add_worksheet(title=title, rows=rows, cols=cols)
+        return RecordingWorksheet(ws, title, self._session)
+
+    def __getattr__(self, attr):
+        return getattr(self._spreadsheet, attr)
+
+
+class RecordingChatModel:
+    def __init__(self, model, session: Session):
+        self._model = model
+        self._session = session
+
+    def invoke(self, prompt, *args, **kwargs):
+        self._session.count('llm_calls')
+        start = time.perf_counter()
+        response = self._model.invoke(prompt, *args, **kwargs)
+        self._session.llm.append({
+            "prompt_hash": prompt_hash(prompt),
+            "prompt": prompt_text(prompt),
+            "response": response.content,
+            "seconds": round(time.perf_counter() - start, 3),
+        })
+        return response
+
+    def __getattr__(self, attr):
+        return getattr(self._model, attr)
+
+
+# --- 重播：行程內模擬 ---
+
+class FakeWorksheet:
+    """gspread Worksheet 的行程內模擬 (只實作 sheets_db 用到的方法)，內容存成字串二維陣列。"""
+
+    def __init__(self, title: str, values: List[List[Any]], session: Session):
+        self.title = title
+        self._values = [[_cell_text(v) for v in row] for row in values]
+        self._session = session
+
+    @property
+    def row_count(self) -> int:
+        return len(self._values)
+
+    def _width(self) -> int:
+        return max((len(row) for row in self._values), default=0)
+
+    def _track(self, method: str, args=(), kwargs=None):
+        self._session.count_sheet(method)
+        if method in WRITE_METHODS:
+            self._session.record_write(self.title, method, args, kwargs or {})
+
+    def get_all_values(self) -> List[List[str]]:
+        self._track('get_all_values')
+        width = self._width()
+        return [row + [''] * (width - len(row)) for row in self._values]
+
+    def get_all_records(self) -> List[Dict[str, Any]]:
+        self._track('get_all_records')
+        if not self._values:
+            return []
+        headers = self._values[0]
+        return [
+            {h: _numericise(row[i]) if i < len(row) else '' for i, h in enumerate(headers)}
+            for row in self._values[1:]
+        ]
+
+    def row_values(self, row: int) -> List[str]:
+        self._track('row_values')
+        values = list(self._values[row - 1]) if row <= len(self._values) else []
+        while values and values[-1] == '':
+            values.pop()
+        return values
+
+    def get(self, range_name: str) -> List[List[str]]:
+        self._track('get')
+        grid = a1_range_to_grid_range(range_name)
+        start_row = grid.get('startRowIndex', 0)
+        end_row = grid.get('endRowIndex', len(self._values))
+        start_col = grid.get('startColumnIndex', 0)
+        end_col = grid.get('endColumnIndex', self._width())
+        rows = []
+        for row in self._values[start_row:end_row]:
+            cells = row[start_col:end_col]
+            while cells and cells[-1] == '':
+                cells.pop()
+            rows.append(cells)
+        while rows and not rows[-1]:
+            rows.pop()
+        return rows
+
+    def cell(self, row: int, col: int) -> Cell:
+        self._track('cell')
+        values = self._values[row - 1] if row <= len(self._values) else []
+        return Cell(row, col, values[col - 1] if col <= len(values) else '')
+
+    def append_row(self, values: List[Any], **kwargs):
+        self._track('append_row', (values,), kwargs)
+        self._values.append([_cell_text(v) for v in values])
+
+    def append_rows(self, values: List[List[Any]], **kwargs):
+        self._track('append_rows', (values,), kwargs)
+        self._values.extend([_cell_text(v) for v in row] for row in values)
+
+    def clear(self):
+        self._track('clear')
+        self._values = []
+
+    def update_cells(self, cells: List[Cell], **kwargs):
+        self._track('update_cells', (cells,), kwargs)
+        for cell in cells:
+            while len(self._values) < cell.row:
+                self._values.append([])
+            row = self._values[cell.row - 1]
+            row.extend([''] * (cell.col - len(row)))
+            row[cell.col - 1] = _cell_text(cell.value)
+
+
+class FakeSpreadsheet:
+    """gspread Spreadsheet 的行程內模擬：錄製時不存在的工作表會丟 WorksheetNotFound (走同樣的建立流程)。"""
+
+    def __init__(self, sheets: Dict[str, List[List[Any]]], session: Session):
+        self._sheets = {name: FakeWorksheet(name, values, session) for name, values in sheets.items()}
+        self._session = session
+
+    def worksheet(self, name: str) -> FakeWorksheet:
+        if name not in self._sheets:
+            raise gspread.WorksheetNotFound(name)
+        return self._sheets[name]
+
+    def add_worksheet(self, title: str, rows, cols) -> FakeWorksheet:
+        self._session.record_write(title, 'add_worksheet', (), {"rows": rows, "cols": cols})
+        self._sheets[title] = FakeWorksheet(title, [], self._session)
+        return self._sheets[title]
+
+
+class FakeChatModel:
+    """
+    回放錄製的 LLM 回應：先找 prompt 完全相同的錄製紀錄，找不到時依序取下一筆 (記為 prompt 不一致)。
+    latency=True 時等待錄製時的耗時，用來估計含 LLM 的端對端時間。
+    """
+
+    def __init__(self, records: List[Dict[str, Any]], session: Session, latency: bool = False):
+        self._records = list(records)
+        self._used = [False] * len(self._records)
+        self._session = session
+        self.latency = latency
+        self.mismatches = 0
+
+    def _take(self, digest: str) -> Dict[str, Any]:
+        for i, record in enumerate(self._records):
+            if not self._used[i] and record.get('prompt_hash') == digest:
+                self._used[i] = True
+                return record
+        for i, record in enumerate(self._records):
+            if not self._used[i]:
+                self._used[i] = True
+                self.mismatches += 1
+                return record
+        raise ValueError("重播失敗：LLM 呼叫次數超過錄製的回應數量。")
+
+    def invoke(self, prompt, *args, **kwargs):
+        self._session.count('llm_calls')
+        record = self._take(prompt_hash(prompt))
+        if self.latency:
+            time.sleep(record.get('seconds', 0))
+        return AIMessage(content=record['response'])
+
+
+class FakeOutbox:
+    """不寄信，只計數 (取代 agent.send_email 的寄信佇列)。"""
+
+    def __init__(self, session: Session):
+        self._session = session
+
+    def send(self, subject: str, body: str) -> bool:
+        self._session.count('emails')
+        return True
+
+    def flush(self, timeout: float = None) -> bool:
+        return True
+
+    def close(self, timeout: float = None):
+        pass
+
+
+class InputDriver:
+    """取代 input()：錄製時記下使用者輸入 (等待時間不計入耗時)，重播時依序回放；遇到主選單就切換操作。"""
+
+    def __init__(self, session: Session, answers: Optional[List[str]] = None):
+        self._session = session
+        self._answers = list(answers) if answers is not None else None
+        self._input = builtins.input
+
+    def __call__(self, prompt: str = '') -> str:
+        if self._answers is None:
+            start = time.perf_counter()
+            answer = self._input(prompt)
+            self._session.waited(time.perf_counter() - start)
+            self._session.inputs.append(answer)
+        else:
+            if not self._answers:
+                raise EOFError
+            answer = self._answers.pop(0)
+            print(f"{prompt}{answer}")
+        if prompt.startswith(MENU_PROMPT):
+            self._session.begin(f"選項 {answer.strip()}")
+        return answer
+
+
+@contextlib.contextmanager
+def _patched(obj, attr: str, value):
+    original = getattr(obj, attr)
+    setattr(obj, attr, value)
+    try:
+        yield
+    finally:
+        setattr(obj, attr, original)
+
+
+def run_main(session: Session, spreadsheet, model, driver: InputDriver, quiet: bool = False, replay: bool = False):
+    """以指定的試算表、聊天模型、輸入來源執行 main.main()。"""
+    import main as app
+    import agent.nodes as nodes
+    from sheets_db import GoogleSheetsDB
+    from agent.checkpoint import open_checkpointer
+
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(_patched(app, 'GoogleSheetsDB', lambda: GoogleSheetsDB(spreadsheet=spreadsheet)))
+        stack.enter_context(_patched(builtins, 'input', driver))
+        stack.enter_context(_patched(nodes, 'llm', model))
+        if replay:
+            # 重播不碰本機的 checkpoint 檔，也不清除畫面
+            stack.enter_context(_patched(app, 'open_checkpointer', lambda *a, **k: open_checkpointer(':memory:')))
+            stack.enter_context(_patched(app, 'clear_screen', lambda: None))
+        if quiet:
+            stack.enter_context(contextlib.redirect_stdout(io.StringIO()))
+        session.begin('startup')
+        try:
+            app.main()
+        except (EOFError, KeyboardInterrupt):
+            pass
+        finally:
+            session.end()
+
+
+def record(path: str):
+    import agent.nodes as nodes
+    from sheets_db import open_spreadsheet
+
+    session = Session()
+    spreadsheet = RecordingSpreadsheet(open_spreadsheet(), session)
+    print(f"⏺️ 錄製中，結束後存到 {path} (選 4 結束，或 Ctrl+C)。")
+    run_main(session, spreadsheet, RecordingChatModel(nodes.llm, session), InputDriver(session))
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(session.to_fixture(), f, ensure_ascii=False, indent=1)
+    print(f"💾 已錄製 {len(session.actions)} 個操作、{len(session.llm)} 次 LLM 呼叫、{len(session.writes)} 次寫入 -> {path}")
+
+
+def _total_calls(action: Dict[str, Any]) -> int:
+    return sum(action.get('sheet_calls', {}).values())
+
+
+def compare_writes(recorded: List[Dict[str, Any]], replayed: List[Dict[str, Any]]) -> Optional[str]:
+    """比較兩次執行寫回工作表的內容 (忽略日期時間)；相同時回傳 None，否則回傳第一個差異的說明。"""
+    for i, (a, b) in enumerate(zip(recorded, replayed)):
+        if _normalize(a) != _normalize(b):
+            return (f"第 {i + 1} 次寫入不同 ({a['sheet']}.{a['method']} / {b['sheet']}.{b['method']}):\n"
+                    f"   錄製: {json.dumps(a['args'], ensure_ascii=False)[:300]}\n"
+                    f"   重播: {json.dumps(b['args'], ensure_ascii=False)[:300]}")
+    if len(recorded) != len(replayed):
+        return f"寫入次數不同：錄製 {len(recorded)} 次，重播 {len(replayed)} 次。"
+    return None
+
+
+def replay(path: str, llm_latency: bool = False, quiet: bool = True) -> int:
+    from agent.send_email import set_outbox
+    from agent.tracing import TRACER
+
+    with open(path, 'r', encoding='utf-8') as f:
+        fixture = json.load(f)
+    if fixture.get('version') != FIXTURE_VERSION:
+        print(f"❌ 不支援的 fixture 版本: {fixture.get('version')}")
+        return 1
+
+    # 重播不寫入追蹤紀錄、不寄信
+    TRACER.enabled = False
+    session = Session()
+    set_outbox(FakeOutbox(session))
+    model = FakeChatModel(fixture.get('llm', []), session, latency=llm_latency)
+    run_main(session, FakeSpreadsheet(fixture.get('sheets', {}), session), model,
+             InputDriver(session, fixture.get('inputs', [])), quiet=quiet, replay=True)
+    wall = sum(action['seconds'] for action in session.actions)
+
+    rows = []
+    recorded_actions = fixture.get('actions', [])
+    for i, action in enumerate(session.actions):
+        before = recorded_actions[i] if i < len(recorded_actions) else {}
+        rows.append({
+            "操作": action['action'],
+            "錄製秒數": before.get('seconds', ''),
+            "重播秒數": action['seconds'],
+            "錄製 Sheets 呼叫": _total_calls(before) if before else '',
+            "重播 Sheets 呼叫": _total_calls(action),
+            "錄製 LLM": before.get('llm_calls', ''),
+            "重播 LLM": action['llm_calls'],
+            "Email": action['emails'],
+        })
+    print(f"\n🔁 重播 {path} (錄製於 {fixture.get('recorded_at', '?')})，總耗時 {wall:.2f}s"
+          f"{' (含錄製的 LLM 延遲)' if llm_latency else ''}")
+    print(tabulate(rows, headers="keys", tablefmt="grid"))
+    if model.mismatches:
+        print(f"⚠️ {model.mismatches} 次 LLM prompt 與錄製時不同 (依序回放錄製的回應)。")
+
+    difference = compare_writes(fixture.get('writes', []), session.writes)
+    if difference:
+        print(f"❌ 輸出與錄製時不同：{difference}")
+        return 1
+    print(f"✅ 輸出與錄製時相同 ({len(session.writes)} 次寫入，已忽略日期時間)。")
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="main.py 端對端錄製 / 重播")
+    sub = parser.add_subparsers(dest='command', required=True)
+    rec = sub.add_parser('record', help='連線 Google Sheets / Gemini 執行並錄製')
+    rec.add_argument('fixture')
+    rep = sub.add_parser('replay', help='以錄製的 fixture 離線重播並比較')
+    rep.add_argument('fixture')
+    rep.add_argument('--llm-latency', action='store_true', help='重播時加上錄製時的 LLM 延遲')
+    rep.add_argument('--verbose', action='store_true', help='顯示 main.py 的輸出')
+    args = parser.parse_args(argv)
+
+    if args.command == 'record':
+        record(args.fixture)
+        return 0
+    return replay(args.fixture, llm_latency=args.llm_latency, quiet=not args.verbose)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,377 @@
+import json
+import queue
+import threading
+from concurrent.futures import Future
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import List, Dict, Any, Optional
+from urllib.parse import urlparse, parse_qs
+
+from agent import nodes
+from agent.graph import build_app
+from agent.memo import NODE_CACHE
+from agent.snapshot import STATE_SIZES
+from agent.timings import NODE_TIMINGS
+from agent.checkpoint import open_checkpointer, new_thread_id, run_graph
+from agent.order_book import OrderBook, order_key
+from agent.progress import compute_progress
+from agent.report import summarize_by_day
+from agent.inventory import INVENTORY_STORE
+from agent.capacity import CALENDAR_STORE
+from agent.promise import CapacityProfile, quote_order, schedule_date_of
+from agent.calibration import CALIBRATION_STORE, record_actuals, schedule_id_of
+from agent.schedule_spans import compress_schedule, schedule_rows
+from agent.risk import simulate_risk, UphModel, DEFAULT_RUNS, DEFAULT_ABSENCE_RATE, DEFAULT_SEED
+from sheet_watcher import PackingSheetWatcher, DEFAULT_POLL_INTERVAL
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+REQUEST_TIMEOUT = 600
+
+
+class SchedulingService:
+    """
+    常駐排程服務 (服務模式)
+    - LangGraph (build_app)、資料庫連線、LLM 產品匹配快取 都在行程內保持熱啟動
+    - 所有會改變訂單 / 排程的操作都丟進同一個排程佇列，由單一 worker 執行緒依序處理，避免互相衝突
+    - 讀取目前排程 (schedule_snapshot) 與交期試算 (quote) 不經過佇列，直接使用最近一次結果
+    """
+
+    def __init__(self, db, app=None):
+        self.db = db
+        self.app = app if app is not None else build_app(checkpointer=open_checkpointer())
+        self.last_thread_id = ''
+        self.order_book = OrderBook(db.load_orders(), db.load_rush_orders())
+
+        system_data = db.load_system_data()
+        last_schedule_date = system_data.get('last_schedule_date')
+        if not last_schedule_date or not isinstance(last_schedule_date, str):
+            last_schedule_date = datetime.now().strftime("%Y-%m-%d")
+        self.last_schedule_date = last_schedule_date
+        self.last_schedule_results: List[Dict[str, Any]] = schedule_rows(system_data.get('last_schedule_results', []))
+        self.last_summary = ''
+        self.last_logs: List[str] = []
+        # 交期試算用的剩餘產能 (排程結果 / 產能資料 / 行事曆沒變時共用)
+        self._profile: Optional[CapacityProfile] = None
+        self._profile_key = None
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._worker = threading.Thread(target=self._run_queue, name='schedule-queue', daemon=True)
+        self._worker.start()
+
+    # --- 排程佇列 ---
+    def _run_queue(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            future, fn, args = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                future.set_exception(e)
+
+    def submit(self, fn, *args, timeout: Optional[float] = REQUEST_TIMEOUT):
+        """把寫入操作放進排程佇列並等待結果。"""
+        future = Future()
+        self._queue.put((future, fn, args))
+        return future.result(timeout=timeout)
+
+    def close(self):
+        self._queue.put(None)
+        self._worker.join(timeout=5)
+
+    # --- 排程執行 (只在 worker 執行緒中呼叫) ---
+    def _reschedule(self, reason: str) -> Dict[str, Any]:
+        orders, rush_orders = self.order_book.snapshot()
+        state = {
+            "logs": [reason],
+            "image_path": "",
+            "inventory_db": {},
+            "orders": orders,
+            "rush_orders": rush_orders,
+            "daily_feedback": {},
+            "last_schedule_date": self.last_schedule_date,
+            "last_schedule_results": self.last_schedule_results
+        }
+        self.last_thread_id = new_thread_id('service')
+        # 節點耗時只保留這次重排 (GET /schedule 的 node_timings)
+        NODE_TIMINGS.reset()
+        result = run_graph(self.app, state, self.last_thread_id)
+
+        self.last_logs = result.get('logs', [])
+        self.last_summary = result.get('schedule_summary', '')
+        if result.get('schedule_result'):
+            self.db.save_run_result(result)
+            self.last_schedule_results = result['schedule_result']
+            self.last_schedule_date = datetime.now().strftime("%Y-%m-%d")
+        self.order_book.reset(result.get('orders', orders), result.get('rush_orders', rush_orders))
+        return self.schedule_snapshot()
+
+    def _submit_orders(self, new_orders: Optional[List[Dict[str, Any]]]) -> Dict[str, Any]:
+        if new_orders is None:
+            new_orders = self.db.load_new_orders_from_sheet()
+        if not new_orders:
+            return {"rescheduled": False, "message": "未找到新的訂單數據。"}
+        for order in new_orders:
+            # 數量統一轉成整數再進訂單簿 (API 可能送來 "50" 這類字串)
+            for field in ('qty', 'qty_remaining'):
+                if field in order:
+                    try:
+                        order[field] = int(str(order[field]).replace(',', '').strip())
+                    except ValueError:
+                        raise ValueError(f"訂單數量必須是整數: {order}")
+            if not order.get('product') or order.get('qty', 0) <= 0:
+                raise ValueError(f"訂單格式錯誤: {order}")
+            order.setdefault('due_date', '')
+        before = self.order_book.snapshot()
+        merged = self.order_book.merge_new_orders(new_orders, datetime.now().strftime('%Y-%m-%d'))
+        snapshot = self._reschedule_or_rollback(f"開始排程：處理 {len(new_orders)} 筆新訂單。", before)
+        snapshot.update({"rescheduled": True, "new_orders": len(new_orders), "merged_orders": len(merged)})
+        return snapshot
+
+    def _reschedule_or_rollback(self, reason: str, before) -> Dict[str, Any]:
+        """重排；失敗時訂單簿回到修改前 (before = order_book.snapshot())，同一批訂單重送時不會重複加總。"""
+        try:
+            return self._reschedule(reason)
+        except Exception:
+            self.order_book.reset(*before)
+            raise
+
+    def _insert_rush(self, product: str, qty: int, mode: str, order_id: Optional[str]) -> Dict[str, Any]:
+        before = self.order_book.snapshot()
+        if mode == 'new':
+            order_id = order_id or f"RUSH-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+            self.order_book.add_new_rush(product, qty, order_id, datetime.now().strftime("%Y-%m-%d"))
+        elif mode == 'convert':
+            if not self.order_book.convert_to_rush(product, qty):
+                raise ValueError(f"找不到型號【{product}】在當前未完成訂單中。")
+        else:
+            raise ValueError("mode 必須是 'new' 或 'convert'。")
+        snapshot = self._reschedule_or_rollback(f"急單：{product} {qty} pcs ({mode})", before)
+        snapshot["rescheduled"] = True
+        return snapshot
+
+    def _post_actuals(self, days: int, actuals: List[Dict[str, Any]]) -> Dict[str, Any]:
+        last_schedule = self.last_schedule_results or self.db.load_schedule_results()
+        if not last_schedule:
+            raise ValueError("請先執行一次排程，才能追蹤進度。")
+
+        progress = compute_progress(last_schedule, self.order_book.orders, days)
+        planned = {
+            (row['order_key'], row['display_name']): row
+            for row in progress['tasks'].to_dict('records')
+        }
+
+        actual_output_by_task = {}
+        real_output_by_order: Dict[str, int] = {}
+        for item in actuals:
+            o_key = order_key(item.get('order_id'), item.get('product'))
+            task_key = (o_key, item.get('process'))
+            if task_key not in planned:
+                raise ValueError(f"排程中找不到訂單工序: {item}")
+            actual = int(item.get('actual', 0))
+            actual_output_by_task[task_key] = {
+                'actual': actual,
+                'product': planned[task_key]['raw_product'],
+                'order_id': planned[task_key]['order_id'],
+                'display_name': task_key[1]
+            }
+            real_output_by_order[o_key] = max(real_output_by_order.get(o_key, 0), actual)
+
+        if actual_output_by_task:
+            percent_rows = self.db.save_percent_data(actual_output_by_task, days, last_schedule, self.order_book.orders, self.order_book.rush_orders)
+            record_actuals(percent_rows or [], schedule_id_of(last_schedule, self.last_schedule_date), last_schedule)
+
+        before = self.order_book.snapshot()
+        lagging = self.order_book.apply_progress(progress['progress'].to_dict('records'), real_output_by_order)
+        if lagging:
+            snapshot = self._reschedule_or_rollback(f"進度回報：{len(lagging)} 筆訂單落後，緊急重排。", before)
+            snapshot.update({"rescheduled": True, "lagging": lagging})
+            return snapshot
+
+        self.db.save_orders(*self.order_book.as_lists())
+        self.db.save_system_data('last_schedule_date', datetime.now().strftime("%Y-%m-%d"))
+        snapshot = self.schedule_snapshot()
+        snapshot.update({"rescheduled": False, "lagging": []})
+        return snapshot
+
+    # --- 公開 API ---
+    def submit_orders(self, new_orders: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """匯入新訂單並重排 (等同選項 1)；new_orders 為 None 時從 read_packing_sheet 讀取。"""
+        return self.submit(self._submit_orders, new_orders)
+
+    def insert_rush(self, product: str, qty: int, mode: str = 'new', order_id: Optional[str] = None) -> Dict[str, Any]:
+        """新增急單 (mode='new') 或舊單轉急單 (mode='convert') 並重排 (等同選項 2)。"""
+        if qty <= 0:
+            raise ValueError("數量必須大於零。")
+        return self.submit(self._insert_rush, product.strip().upper(), qty, mode, order_id)
+
+    def post_actuals(self, days: int, actuals: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """回報累積到 Day N 的實際產量，落後時自動重排 (等同選項 3)。"""
+        if days <= 0:
+            raise ValueError("days 必須是正整數。")
+        return self.submit(self._post_actuals, days, actuals)
+
+    def capacity_profile(self) -> CapacityProfile:
+        """目前排程的每日剩餘產能；排程結果、產能資料或行事曆改變時才重新計算。"""
+        schedule = self.last_schedule_results
+        inventory = INVENTORY_STORE.current()
+        calendar = CALENDAR_STORE.current()
+        key = (id(schedule), self.last_schedule_date, inventory.content_hash, calendar.content_hash)
+        profile = self._profile
+        if profile is None or self._profile_key != key:
+            profile = CapacityProfile(schedule, inventory, calendar, nodes.scheduler_settings(),
+                                      schedule_date_of(self.last_schedule_date))
+            self._profile, self._profile_key = profile, key
+        return profile
+
+    def quote(self, product: str, qty: int, due_date: Optional[str] = None,
+              processes: Optional[List[str]] = None) -> Dict[str, Any]:
+        """交期試算：假設今天接單，在目前排程的剩餘產能中預計何時完工 (不經過佇列、不改變排程)。"""
+        return quote_order(product.strip(), qty, self.capacity_profile(), INVENTORY_STORE.current(),
+                           processes=processes, due_date=due_date, known=nodes.known_matches())
+
+    def risk(self, runs: int = DEFAULT_RUNS, seed: int = DEFAULT_SEED,
+             absence_rate: float = DEFAULT_ABSENCE_RATE) -> Dict[str, Any]:
+        """Monte Carlo 排程風險模擬 (不重排)；只有取訂單快照經過佇列，模擬本身不佔用排程佇列。"""
+        if runs <= 0:
+            raise ValueError("runs 必須是正整數。")
+        orders, rush_orders = self.submit(self.order_book.snapshot)
+        inventory = INVENTORY_STORE.current()
+        all_jobs, unknown = nodes.build_jobs(orders, rush_orders, inventory)
+        uph_model = UphModel.from_log_stats(CALIBRATION_STORE.current().log_ratio_stats())
+        result = simulate_risk(all_jobs, nodes.scheduler_settings(), CALENDAR_STORE.current(), runs=runs, seed=seed,
+                               uph_model=uph_model, absence_rate=absence_rate)
+        result["unknown_products"] = unknown
+        return result
+
+    def schedule_snapshot(self, detail: bool = False, spans: bool = False) -> Dict[str, Any]:
+        """目前的排程摘要 (不經過佇列)；spans=True 時明細以區段格式回傳 (agent.schedule_spans)。"""
+        schedule = self.last_schedule_results
+        snapshot = {
+            "summary": self.last_summary,
+            "last_schedule_date": self.last_schedule_date,
+            "orders": self.order_book.count(),
+            "rush_orders": self.order_book.count(rush=True),
+            "tasks": len(schedule),
+            "thread_id": self.last_thread_id,
+            "days": summarize_by_day(schedule),
+            "node_cache": NODE_CACHE.stats(),
+            "state_sizes": {node: STATE_SIZES.total(node) for node in STATE_SIZES.sizes},
+            "node_timings": [{"node": n, "start": round(s, 3), "end": round(e, 3)} for n, s, e, _ in NODE_TIMINGS.rows()],
+        }
+        if detail:
+            snapshot["schedule"] = compress_schedule(schedule) if spans else schedule
+        return snapshot
+
+
+def _make_handler(service: SchedulingService):
+    class ScheduleRequestHandler(BaseHTTPRequestHandler):
+        """
+        GET  /health                 健康檢查
+        GET  /schedule[?detail=1]    目前排程 (每日摘要，detail=1 附完整明細，再加 format=spans 以區段格式回傳)
+        POST /orders                 {"orders": [...]} 匯入新訂單 (省略 orders 則從 read_packing_sheet 讀取)
+        POST /rush                   {"product", "qty", "mode": "new"|"convert", "order_id"?}
+        POST /actuals                {"days", "actuals": [{"order_id", "product", "process", "actual"}]}
+        POST /quote                  {"product", "qty", "due_date"?, "processes"?} 交期試算 (不重排)
+        POST /risk                   {"runs"?, "seed"?, "absence_rate"?} Monte Carlo 排程風險 (不重排)
+        """
+
+        def _send_json(self, status: int, payload: Any):
+            body = json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _read_json(self) -> Dict[str, Any]:
+            length = int(self.headers.get('Content-Length') or 0)
+            if not length:
+                return {}
+            payload = json.loads(self.rfile.read(length).decode('utf-8'))
+            if not isinstance(payload, dict):
+                raise ValueError("請求內容必須是 JSON 物件。")
+            return payload
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == '/health':
+                self._send_json(200, {"status": "ok"})
+            elif url.path == '/schedule':
+                query = parse_qs(url.query)
+                detail = query.get('detail', ['0'])[0] in ('1', 'true')
+                spans = query.get('format', ['rows'])[0] == 'spans'
+                self._send_json(200, service.schedule_snapshot(detail=detail, spans=spans))
+            else:
+                self._send_json(404, {"error": f"未知路徑: {url.path}"})
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            try:
+                payload = self._read_json()
+                if url.path == '/orders':
+                    result = service.submit_orders(payload.get('orders'))
+                elif url.path == '/rush':
+                    result = service.insert_rush(str(payload['product']), int(payload['qty']),
+                                                 payload.get('mode', 'new'), payload.get('order_id'))
+                elif url.path == '/actuals':
+                    result = service.post_actuals(int(payload['days']), payload.get('actuals', []))
+                elif url.path == '/risk':
+                    result = service.risk(int(payload.get('runs', DEFAULT_RUNS)), int(payload.get('seed', DEFAULT_SEED)),
+                                          float(payload.get('absence_rate', DEFAULT_ABSENCE_RATE)))
+                elif url.path == '/quote':
+                    result = service.quote(str(payload['product']), int(payload['qty']),
+                                           payload.get('due_date'), payload.get('processes'))
+                else:
+                    self._send_json(404, {"error": f"未知路徑: {url.path}"})
+                    return
+            except (ValueError, KeyError, TypeError) as e:
+                self._send_json(400, {"error": str(e)})
+                return
+            except Exception as e:
+                self._send_json(500, {"error": f"排程失敗: {e}"})
+                return
+            self._send_json(200, result)
+
+        def log_message(self, format, *args):
+            print(f"🌐 {self.address_string()} {format % args}")
+
+    return ScheduleRequestHandler
+
+
+def make_server(service: SchedulingService, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> ThreadingHTTPServer:
+    """建立 HTTP 伺服器 (port=0 時由系統分配，方便本機測試)。"""
+    return ThreadingHTTPServer((host, port), _make_handler(service))
+
+
+def serve(db, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, app=None, watch: bool = False, watch_interval: float = DEFAULT_POLL_INTERVAL):
+    """啟動服務模式並持續執行直到 Ctrl+C；watch=True 時同時監看 read_packing_sheet 的新訂單。"""
+    service = SchedulingService(db, app=app)
+    server = make_server(service, host, port)
+    watcher = PackingSheetWatcher(service, db, interval=watch_interval).start() if watch else None
+    print(f"🌐 MINLEE 排程服務已啟動: http://{host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("👋 服務關閉。")
+    finally:
+        if watcher is not None:
+            watcher.stop()
+        server.server_close()
+        service.close()
+
+
+def watch(db, app=None, interval: float = DEFAULT_POLL_INTERVAL):
+    """只啟動監看模式 (不開 HTTP 服務)，持續執行直到 Ctrl+C。"""
+    service = SchedulingService(db, app=app)
+    watcher = PackingSheetWatcher(service, db, interval=interval)
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        print("👋 監看模式關閉。")
+    finally:
+        service.close()
@@ -0,0 +1,124 @@
+import threading
+import time
+from typing import List, Dict, Any, Optional
+
+# 預設值：每 15 秒輪詢一次；最後一筆新列進來後安靜 20 秒才重排，
+# 但從第一筆新列起最多等 40 秒 -> 新訂單在一分鐘內反映到排程
+DEFAULT_POLL_INTERVAL = 15
+DEFAULT_DEBOUNCE = 20
+DEFAULT_MAX_WAIT = 40
+
+HWM_KEY = 'packing_sheet_hwm'
+
+
+class PackingSheetWatcher:
+    """
+    監看模式：定期輪詢 read_packing_sheet，只讀取上次處理位置 (high-water mark) 之後新增的列。
+    - high-water mark 存在 SystemData (packing_sheet_hwm)，重新啟動後從上次位置繼續
+    - 短時間內連續貼上多筆訂單時會合併 (debounce)，只觸發一次重排
+    - 重排成功後才把這些列標記為「已排程」並推進 high-water mark；失敗時下次輪詢重試
+      (訂單送出成功就不再重送，只重試標記與保存 high-water mark，訂單數量不會重複加總)
+    """
+
+    def __init__(self, service, db, interval: float = DEFAULT_POLL_INTERVAL,
+                 debounce: float = DEFAULT_DEBOUNCE, max_wait: float = DEFAULT_MAX_WAIT):
+        self.service = service
+        self.db = db
+        self.interval = interval
+        self.debounce = debounce
+        self.max_wait = max_wait
+
+        hwm = db.load_system_data().get(HWM_KEY, 0)
+        try:
+            self.high_water_mark = int(hwm)
+        except (TypeError, ValueError):
+            self.high_water_mark = 0
+
+        # 已讀到但尚未排程的訂單
+        self._pending_orders: List[Dict[str, Any]] = []
+        self._pending_rows: List[int] = []
+        # 已排程、但還沒成功標記為「已排程」的列
+        self._unmarked_rows: List[int] = []
+        self._pending_hwm = self.high_water_mark
+        self._first_seen: Optional[float] = None
+        self._last_seen: Optional[float] = None
+
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def poll(self, now: Optional[float] = None) -> bool:
+        """輪詢一次；回傳本次是否讀到新訂單。"""
+        now = time.monotonic() if now is None else now
+        orders, rows, new_hwm = self.db.load_new_orders_since(self._pending_hwm)
+        self._pending_hwm = max(self._pending_hwm, new_hwm)
+        if not orders:
+            return False
+
+        self._pending_orders.extend(orders)
+        self._pending_rows.extend(rows)
+        if self._first_seen is None:
+            self._first_seen = now
+        self._last_seen = now
+        print(f"👀 偵測到 {len(orders)} 筆新訂單 (待排程 {len(self._pending_orders)} 筆)。")
+        return True
+
+    def due(self, now: Optional[float] = None) -> bool:
+        """待排程訂單是否已經安靜夠久 (或等待已達上限)。"""
+        if not self._pending_orders:
+            return False
+        now = time.monotonic() if now is None else now
+        return now - self._last_seen >= self.debounce or now - self._first_seen >= self.max_wait
+
+    def flush(self) -> Optional[Dict[str, Any]]:
+        """把累積的新訂單一次送進排程佇列；成功後標記已排程並保存 high-water mark。"""
+        result = None
+        if self._pending_orders:
+            orders = self._pending_orders
+            result = self.service.submit_orders(orders)
+            # 訂單已經合併進訂單簿：立刻移出待排程清單，之後標記失敗也不會再送一次
+            self._unmarked_rows.extend(self._pending_rows)
+            self._pending_orders, self._pending_rows = [], []
+            self._first_seen = self._last_seen = None
+            print(f"✅ 監看模式：{len(orders)} 筆新訂單已排入排程。")
+
+        if self._unmarked_rows:
+            self.db.mark_rows_scheduled(self._unmarked_rows)
+            self._unmarked_rows = []
+        if self._pending_hwm != self.high_water_mark:
+            self._commit_hwm()
+        return result
+
+    def _commit_hwm(self):
+        self.high_water_mark = self._pending_hwm
+        self.db.save_system_data(HWM_KEY, self.high_water_mark)
+
+    def tick(self, now: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """輪詢一次，必要時重排。"""
+        now = time.monotonic() if now is None else now
+        self.poll(now)
+        if self.due(now) or (not self._pending_orders and (self._unmarked_rows or self._pending_hwm != self.high_water_mark)):
+            return self.flush()
+        return None
+
+    def run(self):
+        print(f"👀 監看 read_packing_sheet (每 {self.interval} 秒，從第 {self.high_water_mark + 1} 列之後開始)...")
+        while not self._stop.is_set():
+            try:
+                self.tick()
+            except Exception as e:
+                print(f"❌ 監看模式輪詢失敗，下次重試: {e}")
+            # 有待排程訂單時縮短等待，讓 debounce 到期後盡快重排
+            wait = self.interval
+            if self._pending_orders:
+                wait = min(wait, max(0.5, self.debounce / 4))
+            self._stop.wait(wait)
+
+    def start(self) -> 'PackingSheetWatcher':
+        self._thread = threading.Thread(target=self.run, name='packing-sheet-watcher', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
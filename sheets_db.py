@@ -5,6 +5,9 @@ from datetime import datetime
 from typing import List, Dict, Any
 from oauth2client.service_account import ServiceAccountCredentials
 from collections import defaultdict
+from agent.order_book import key_of, row_key_of, order_from_packing_row
+from agent.tracing import TracedProxy
+from agent.schedule_spans import SPAN_SHEET_COLUMNS, compress_schedule, expand_schedule, iter_span_rows, spans_from_rows
 
 # 讀取設定檔
 config = configparser.ConfigParser()
@@ -24,18 +27,26 @@ RUSH_ORDERS_SHEET_NAME = 'RushOrders'
 SYSTEM_DATA_SHEET_NAME = 'SystemData'
 READ_ORDERS_SHEET_NAME = config['GOOGLE'].get('READ_ORDERS_SHEET_NAME', 'read_packing_sheet')
 SCHEDULE_WRITE_SHEET_NAME = config['GOOGLE'].get('SCHEDULE_WRITE_SHEET_NAME', 'percentage(daily_scheldue)')
+# 排程工作表版面：rows = 每天每個工序一列 (預設)；spans = 連續天數相同的工序合併成一列 (Start_Day ~ End_Day)
+SCHEDULE_SHEET_LAYOUT = config['GOOGLE'].get('SCHEDULE_SHEET_LAYOUT', 'rows').strip().lower()
+
+def open_spreadsheet():
+    """以 service account 連線並開啟 SHEET_NAME 試算表。"""
+    scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+    creds = ServiceAccountCredentials.from_json_keyfile_name(
+        config['GOOGLE']['CREDENTIALS_JSON'], scope
+    )
+    client = gspread.authorize(creds)
+    return client.open(SHEET_NAME)
 
 class GoogleSheetsDB:
     """處理 Google Sheets 資料庫的讀取和寫入操作。"""
-    def __init__(self):
+    def __init__(self, spreadsheet=None):
+        """spreadsheet: 已開啟的試算表 (例如 replay.py 的錄製 / 模擬版本)；None 時連線 Google Sheets。"""
         self.sheet = None
+        self._packing_cols = None  # read_packing_sheet 欄位索引快取
         try:
-            scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-            creds = ServiceAccountCredentials.from_json_keyfile_name(
-                config['GOOGLE']['CREDENTIALS_JSON'], scope
-            )
-            client = gspread.authorize(creds)
-            self.sheet = client.open(SHEET_NAME)
+            self.sheet = spreadsheet if spreadsheet is not None else open_spreadsheet()
             
             # 初始化所有工作表物件
             self.orders_ws = self._get_worksheet(ORDERS_SHEET_NAME)
@@ -52,10 +63,10 @@ class GoogleSheetsDB:
             raise
 
     def _get_worksheet(self, name):
-        """取得或建立工作表。"""
+        """取得或建立工作表 (每個 gspread 呼叫都記錄成 gspread.<方法> span，見 agent.tracing)。"""
         if not self.sheet: return None
         try:
-            return self.sheet.worksheet(name)
+            return TracedProxy(self.sheet.worksheet(name), 'gspread', sheet=name)
         except gspread.WorksheetNotFound:
             print(f"⚠️ 工作表 '{name}' 不存在，正在建立...")
             ws = self.sheet.add_worksheet(title=name, rows="100", cols="20")
@@ -69,12 +80,12 @@ class GoogleSheetsDB:
             elif name == ORDERS_SHEET_NAME:
                 ws.append_row(['order_id', 'product', 'qty', 'qty_remaining', 'is_rush', 'due_date', 'raw_packing_sheet', 'date_created'])
             elif name == RUSH_ORDERS_SHEET_NAME:
-                ws.append_row(['order_id', 'product', 'qty', 'is_rush', 'qty_total', 'qty_remaining'])
+                ws.append_row(['order_id', 'product', 'qty', 'is_rush', 'qty_total', 'qty_remaining', 'due_date'])
             elif name == SYSTEM_DATA_SHEET_NAME:
                 ws.append_row(['key', 'value'])
             elif name == 'percent':
                 ws.append_row(['Day', 'order_id', 'Product', 'Raw_Product_Name', 'Planned_Output', 'Actual_Output', 'Total_Order_Qty', 'Actual_Complete_Percent', 'Report_Date'])
-            return ws
+            return TracedProxy(ws, 'gspread', sheet=name)
 
     def _load_data(self, ws) -> List[Dict[str, Any]]:
         """通用數據載入函式。"""
@@ -142,6 +153,35 @@ class GoogleSheetsDB:
         except Exception as e:
             print(f"❌ 儲存系統資料失敗: {e}")
 
+    PACKING_SHEET_COLUMNS = ['order_id', 'priority', 'customer_name', 'product_name', 'quantity', 'pending', 'Order_Date', 'status']
+
+    def _packing_sheet_columns(self, headers: List[str]) -> Dict[str, int]:
+        """找到 read_packing_sheet 各欄位的索引 (缺欄位時拋出 ValueError)。"""
+        return {name: headers.index(name) for name in self.PACKING_SHEET_COLUMNS}
+
+    def _parse_packing_row(self, row: List[str], cols: Dict[str, int], row_idx: int):
+        """解析 read_packing_sheet 的一列，回傳訂單 dict；不需排程 (已排程/數量為 0/格式錯誤) 時回傳 None。"""
+        if len(row) < max(cols.values()) + 1:
+            return None
+        return order_from_packing_row({name: row[idx] for name, idx in cols.items()}, row_idx)
+
+    def mark_rows_scheduled(self, row_indices: List[int]):
+        """把 read_packing_sheet 指定列的 status 更新為「已排程」。"""
+        if not row_indices or not self.read_orders_ws:
+            return
+        if self._packing_cols is None:
+            self._packing_cols = self._packing_sheet_columns(self.read_orders_ws.row_values(1))
+        col_status = self._packing_cols['status']
+        
+        cells_to_update = []
+        for row_idx in row_indices:
+            cell = self.read_orders_ws.cell(row_idx, col_status + 1)
+            cell.value = '已排程'
+            cells_to_update.append(cell)
+        
+        self.read_orders_ws.update_cells(cells_to_update)
+        print(f"✅ 已更新 {len(cells_to_update)} 筆訂單狀態為「已排程」。")
+
     def load_new_orders_from_sheet(self) -> List[Dict[str, Any]]:
         """從 read_packing_sheet 工作表讀取新訂單"""
         if not self.read_orders_ws:
@@ -154,88 +194,26 @@ class GoogleSheetsDB:
                 print("⚠️ read_packing_sheet 工作表為空或只有標頭。")
                 return []
 
-            headers = all_data[0]
-            
             # 找到各欄位的索引
             try:
-                col_order_id = headers.index('order_id')
-                col_priority = headers.index('priority')
-                col_customer = headers.index('customer_name')
-                col_product = headers.index('product_name')
-                col_quantity = headers.index('quantity')
-                col_pending = headers.index('pending')
-                col_order_date = headers.index('Order_Date')
-                col_status = headers.index('status')
+                cols = self._packing_sheet_columns(all_data[0])
             except ValueError as e:
                 print(f"❌ 找不到必要欄位: {e}")
                 return []
+            self._packing_cols = cols
 
             parsed_orders = []
             rows_to_update = []
 
             for row_idx, row in enumerate(all_data[1:], start=2):
-                if len(row) < max(col_order_id, col_priority, col_customer, col_product, col_quantity, col_pending, col_order_date, col_status) + 1:
+                order = self._parse_packing_row(row, cols, row_idx)
+                if order is None:
                     continue
-
-                status = row[col_status].strip() if col_status < len(row) else ''
-                if status == '已排程':
-                    continue
-
-                order_id = row[col_order_id].strip()
-                priority = row[col_priority].strip().lower()
-                customer_name = row[col_customer].strip()
-                product_name = row[col_product].strip()
-                quantity_str = row[col_quantity].strip()
-                pending_str = row[col_pending].strip()
-                order_date = row[col_order_date].strip()
-
-                # 解析數量
-                quantity_str = quantity_str.upper().replace('PCS', '').replace(',', '').strip()
-                pending_str = pending_str.upper().replace('PCS', '').replace(',', '').strip()
-
-                try:
-                    qty_total = int(quantity_str) if quantity_str else 0
-                    qty_pending = int(pending_str) if pending_str else qty_total
-                except ValueError:
-                    print(f"⚠️ 第 {row_idx} 行數量格式錯誤，跳過。")
-                    continue
-
-                if qty_pending <= 0:
-                    continue
-
-                is_rush = (priority == 'rush')
-
-                raw_data_dict = {
-                    "order_id": order_id,
-                    "product_name": product_name,
-                    "quantity": f"{qty_total} PCS",
-                    "pending": f"{qty_pending} PCS",
-                    "Order_Date": order_date
-                }
-                raw_data_json = json.dumps(raw_data_dict, ensure_ascii=False)
-
-                parsed_orders.append({
-                    "order_id": order_id,
-                    "product": product_name,
-                    "qty": qty_pending,
-                    "qty_remaining": qty_pending,
-                    "is_rush": is_rush,
-                    "due_date": order_date,
-                    "raw_data": raw_data_json
-                })
-
-                rows_to_update.append((row_idx, col_status))
+                parsed_orders.append(order)
+                rows_to_update.append(row_idx)
 
             # 更新 status 欄位為 "已排程"
-            if rows_to_update:
-                cells_to_update = []
-                for row_idx, col_idx in rows_to_update:
-                    cell = self.read_orders_ws.cell(row_idx, col_idx + 1)
-                    cell.value = '已排程'
-                    cells_to_update.append(cell)
-                
-                self.read_orders_ws.update_cells(cells_to_update)
-                print(f"✅ 已更新 {len(cells_to_update)} 筆訂單狀態為「已排程」。")
+            self.mark_rows_scheduled(rows_to_update)
 
             print(f"✅ 成功讀取 {len(parsed_orders)} 筆新訂單。")
             return parsed_orders
@@ -244,6 +222,46 @@ class GoogleSheetsDB:
             print(f"❌ 讀取訂單失敗: {e}")
             return []
 
+    def load_new_orders_since(self, high_water_mark: int):
+        """
+        增量讀取 read_packing_sheet：只讀取第 high_water_mark 列之後的尾端資料 (不重讀整張表)。
+        high_water_mark 為已處理過的最後一列列號 (標頭為第 1 列)。
+        不會更新 status，排程成功後由呼叫端呼叫 mark_rows_scheduled。
+        
+        Returns:
+            (新訂單列表, 對應的列號列表, 新的 high_water_mark)
+        """
+        if not self.read_orders_ws:
+            return [], [], high_water_mark
+
+        if self._packing_cols is None:
+            self._packing_cols = self._packing_sheet_columns(self.read_orders_ws.row_values(1))
+        cols = self._packing_cols
+
+        start_row = max(high_water_mark, 1) + 1
+        width = max(cols.values()) + 1
+        last_col = gspread.utils.rowcol_to_a1(1, width).rstrip('0123456789')
+        tail = self.read_orders_ws.get(f"A{start_row}:{last_col}")
+        
+        parsed_orders = []
+        row_indices = []
+        new_hwm = high_water_mark
+        for offset, row in enumerate(tail):
+            row_idx = start_row + offset
+            # 範圍讀取會省略列尾的空白儲存格 (例如尚未填寫的 status)，補齊到固定欄數
+            row = list(row) + [''] * (width - len(row))
+            # 還在輸入中的列 (有內容但缺產品或數量)：停在這裡，下次輪詢再從這列開始讀
+            if any(cell.strip() for cell in row) and not (row[cols['product_name']].strip() and row[cols['quantity']].strip()):
+                break
+            new_hwm = row_idx
+            order = self._parse_packing_row(row, cols, row_idx)
+            if order is None:
+                continue
+            parsed_orders.append(order)
+            row_indices.append(row_idx)
+        
+        return parsed_orders, row_indices, new_hwm
+
     def save_orders(self, orders: List[Dict[str, Any]], rush_orders: List[Dict[str, Any]]):
         """儲存訂單到 Orders 和 RushOrders 工作表"""
         if not self.orders_ws or not self.rush_orders_ws:
@@ -274,7 +292,7 @@ class GoogleSheetsDB:
 
             # 清空並重新寫入 RushOrders
             self.rush_orders_ws.clear()
-            headers = ['order_id', 'product', 'qty', 'is_rush', 'qty_total', 'qty_remaining']
+            headers = ['order_id', 'product', 'qty', 'is_rush', 'qty_total', 'qty_remaining', 'due_date']
             self.rush_orders_ws.append_row(headers)
             
             if rush_orders:
@@ -286,7 +304,8 @@ class GoogleSheetsDB:
                         o['qty'],
                         o.get('is_rush', True),
                         o.get('qty_total', o['qty']),
-                        o.get('qty_remaining', o['qty'])
+                        o.get('qty_remaining', o['qty']),
+                        o.get('due_date', '')
                     ])
                 self.rush_orders_ws.append_rows(rows)
                 print(f"✅ 成功儲存 {len(rows)} 筆急單到 'RushOrders' 工作表。")
@@ -294,16 +313,29 @@ class GoogleSheetsDB:
         except Exception as e:
             print(f"❌ 儲存訂單失敗: {e}")
 
-    def save_schedule_results(self, schedule_result: List[Dict[str, Any]]):
-        """儲存排程結果到 percentage(daily_schedule) 工作表"""
+    def save_schedule_results(self, schedule_result: List[Dict[str, Any]], layout: str = None):
+        """儲存排程結果到 percentage(daily_schedule) 工作表 (layout: rows / spans，預設 SCHEDULE_SHEET_LAYOUT)"""
         if not self.schedule_write_ws:
             print("⚠️ 無法儲存排程結果，工作表不存在。")
             return
 
+        layout = layout or SCHEDULE_SHEET_LAYOUT
         try:
             # 清空並重新寫入
             self.schedule_write_ws.clear()
             
+            if layout == 'spans':
+                # 【新增】區段版面：一個工序連續做 N 天只寫一列 (見 agent.schedule_spans)
+                headers = SPAN_SHEET_COLUMNS
+                self.schedule_write_ws.append_row(headers)
+                records = [[row.get(column, '') for column in headers] for row in iter_span_rows(compress_schedule(schedule_result))]
+                if records:
+                    self.schedule_write_ws.append_rows(records)
+                    print(f"✅ 成功寫入 {len(records)} 個排程區段 ({len(schedule_result)} 筆排程記錄) 到 '{SCHEDULE_WRITE_SHEET_NAME}'。")
+                else:
+                    print("⚠️ 排程結果為空，未進行寫入。")
+                return
+
             # percentage(daily_schedule) 保持 13 個欄位
             headers = ['Day', 'order_id', 'Product', 'Raw_Product_Name', 'Headcount', 'Actual_Hours', 'plan_to', 'Output', 'Complete_Percent', 'Idle_People', 'Status', 'Note', 'priority']
             self.schedule_write_ws.append_row(headers)
@@ -335,6 +367,24 @@ class GoogleSheetsDB:
         except Exception as e:
             print(f"❌ 儲存排程結果失敗: {e}")
 
+    def save_run_result(self, result: Dict[str, Any]):
+        """儲存一次排程 (app.invoke) 的結果：排程表、未完成訂單、SystemData"""
+        flat_schedule = result.get('schedule_result', [])
+        
+        # 1. 儲存排程表
+        self.save_schedule_results(flat_schedule)
+        
+        # 2. 將最新的訂單佇列（未完成的）存回
+        updated_orders = [
+            order for order in result.get('orders', [])
+            if order.get('qty_remaining', order.get('qty', 0)) > 0
+        ]
+        self.save_orders(updated_orders, result.get('rush_orders', []))
+        
+        # 3. 儲存 SystemData (【修改】排程結果以區段格式儲存，見 agent.schedule_spans)
+        self.save_system_data('last_schedule_results', compress_schedule(flat_schedule))
+        self.save_system_data('last_schedule_date', datetime.now().strftime("%Y-%m-%d"))
+
     def load_schedule_results(self) -> List[Dict[str, Any]]:
         """從 percentage(daily_schedule) 工作表讀取排程結果"""
         if not self.schedule_write_ws:
@@ -343,6 +393,9 @@ class GoogleSheetsDB:
         
         try:
             data = self._load_data(self.schedule_write_ws)
+            # spans 版面的工作表：展開成每天一列
+            if data and 'Start_Day' in data[0]:
+                data = expand_schedule(spans_from_rows(data))
             
             # 如果沒有 Raw_Product_Name 欄位，則從 Product 欄位提取
             for record in data:
@@ -357,11 +410,17 @@ class GoogleSheetsDB:
             print(f"❌ 讀取排程結果失敗: {e}")
             return []
 
-    def save_percent_data(self, actual_output_by_task: dict, days_to_report: int, schedule_data: list, current_orders: list, rush_orders: list):
-        """將實際產量資料寫入 percent 工作表
+    def load_percent_data(self) -> List[Dict[str, Any]]:
+        """讀取 percent 工作表 (實際 / 計劃產量)，風險模擬用來估計各工序的 UPH 變異。"""
+        if not self.percent_ws:
+            return []
+        return self._load_data(self.percent_ws)
+
+    def save_percent_data(self, actual_output_by_task: dict, days_to_report: int, schedule_data: list, current_orders: list, rush_orders: list) -> List[Dict[str, Any]]:
+        """將實際產量資料寫入 percent 工作表，回傳寫入的資料列 (dict，供 UPH 校正使用)
         
         Args:
-            actual_output_by_task: {工序名稱: {'actual': 實際產量, 'product': 產品名稱}}
+            actual_output_by_task: {(order_key, 工序名稱): {'actual': 實際產量, 'product': 產品名稱, 'order_id': 訂單編號, 'display_name': 工序名稱}}
             days_to_report: 要回報的天數
             schedule_data: 排程資料列表
             current_orders: 當前訂單列表
@@ -369,7 +428,7 @@ class GoogleSheetsDB:
         """
         if not self.percent_ws:
             print("⚠️ 找不到 percent 工作表。")
-            return
+            return []
         
         try:
             from datetime import datetime
@@ -378,18 +437,29 @@ class GoogleSheetsDB:
             print(f"📊 待寫入的工序數量: {len(actual_output_by_task)}")
             
             # 【新增】清空工作表並重建標題（確保欄位位置正確）
+            headers = ['Day', 'order_id', 'Product', 'Raw_Product_Name', 'Planned_Output', 'Actual_Output', 'Total_Order_Qty', 'Actual_Complete_Percent', 'Report_Date']
             self.percent_ws.clear()
-            self.percent_ws.append_row(['Day', 'order_id', 'Product', 'Raw_Product_Name', 'Planned_Output', 'Actual_Output', 'Total_Order_Qty', 'Actual_Complete_Percent', 'Report_Date'])
+            self.percent_ws.append_row(headers)
+            
+            # 建立 order_key -> 訂單索引 (常規訂單優先，找不到再用急單)，避免每個工序都線性掃描
+            order_by_key = {}
+            for o in list(current_orders) + list(rush_orders):
+                order_by_key.setdefault(key_of(o), o)
+            
+            # 建立 (order_key, 工序名稱) -> 排程列 索引，只走訪排程一次
+            tasks_by_key = defaultdict(list)
+            for task in schedule_data:
+                if not task.get('Day'):  # 確保有 Day 欄位
+                    continue
+                task_name = str(task.get('Product', '')).replace("✅ ", "").replace("☑️ ", "").replace("💡 ", "").strip()
+                tasks_by_key[(row_key_of(task), task_name)].append(task)
             
             # 準備寫入的資料
             records = []
-            for task_name, data in actual_output_by_task.items():
-                # 【修改】找出所有匹配的工序（可能在多天出現）
-                matching_tasks = [
-                    task for task in schedule_data 
-                    if task.get('Product', '').replace("✅ ", "").replace("☑️ ", "").replace("💡 ", "").strip() == task_name
-                    and task.get('Day')  # 確保有 Day 欄位
-                ]
+            for task_key, data in actual_output_by_task.items():
+                task_name = data.get('display_name', task_key[1])
+                # 【修改】找出該訂單所有匹配的工序（可能在多天出現）
+                matching_tasks = tasks_by_key.get(task_key, [])
                 
                 if not matching_tasks:
                     print(f"⚠️ 找不到工序 {task_name} 的排程資料")
@@ -415,9 +485,7 @@ class GoogleSheetsDB:
                 product_name = data['product']
                 
                 # 從 current_orders 或 rush_orders 中取得總訂單量
-                order = next((o for o in current_orders if o.get('product') == product_name), None)
-                if not order:
-                    order = next((o for o in rush_orders if o.get('product') == product_name), None)
+                order = order_by_key.get(task_key[0])
                 
                 total_order_qty = order.get('qty', 0) if order else 0
                 
@@ -438,7 +506,7 @@ class GoogleSheetsDB:
                 
                 records.append([
                     f'Day {max_day_num}',  # 記錄到最後一天
-                    last_day_task.get('order_id', ''),
+                    data.get('order_id') or last_day_task.get('order_id', ''),
                     task_name,
                     product_name,
                     total_planned_output,  # 累計的計劃產量
@@ -454,8 +522,10 @@ class GoogleSheetsDB:
                 print(f"✅ 成功寫入 {len(records)} 筆實際產量記錄到 percent 工作表。")
             else:
                 print("⚠️ 沒有需要寫入的資料。")
+            return [dict(zip(headers, record)) for record in records]
                 
         except Exception as e:
             print(f"❌ 寫入實際產量失敗: {e}")
             import traceback
-            traceback.print_exc()
\ No newline at end of file
+            traceback.print_exc()
+            return []
\ No newline at end of file
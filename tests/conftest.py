@@ -0,0 +1,49 @@
+"""
+測試共用設定
+- 在暫存目錄執行：config.ini、checkpoints.sqlite、快取檔等相對路徑的檔案不會寫進專案目錄
+- agent.nodes 匯入時會讀 config.ini 並建立 Gemini 物件，這裡放一份只有假 API_KEY 的設定 (不會真的呼叫)
+"""
+import json
+import os
+import re
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+WORKDIR = tempfile.mkdtemp(prefix='minlee-tests-')
+with open(os.path.join(WORKDIR, 'config.ini'), 'w', encoding='utf-8') as f:
+    f.write("[GOOGLE]\nAPI_KEY = test\nSHEET_NAME = test\n\n[ZZ_Srttings]\nMAX_HEADCOUNT = 40\nWORK_HOURS_PER_DAY = 8\n")
+os.chdir(WORKDIR)
+
+
+class _Reply:
+    def __init__(self, content: str):
+        self.content = content
+
+
+class FakeMatchLLM:
+    """產品匹配用的假 LLM：訂單產品名稱匹配所有以它開頭的工序 (不連網)。"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, prompt, *args, **kwargs):
+        self.calls += 1
+        products = re.findall(r'^\d+\. (.+)$', prompt, re.M)
+        processes = re.findall(r'^- (.+)$', prompt, re.M)
+        return _Reply(json.dumps({p: [k for k in processes if k.startswith(p)] for p in products}, ensure_ascii=False))
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    from agent import nodes
+    llm = FakeMatchLLM()
+    monkeypatch.setattr(nodes, 'llm', llm)
+    # 匹配快取跨測試共用會影響 LLM 呼叫次數
+    monkeypatch.setattr(nodes, '_match_cache', {})
+    return llm
@@ -0,0 +1,37 @@
+import itertools
+import random
+
+import pytest
+
+from agent.allocation import AllocationItem, allocate_people, people_needed, produced_qty
+
+
+def _value(items, assigned):
+    return sum(item.weight * people for item, people in zip(items, assigned))
+
+
+def _brute_force(items, people):
+    options = [[0] + list(range(item.base, item.need + 1)) for item in items]
+    return max((a for a in itertools.product(*options) if sum(a) <= people), key=lambda a: _value(items, a))
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_allocation_matches_brute_force(seed):
+    rng = random.Random(seed)
+    for _ in range(400):
+        people = rng.randint(0, 9)
+        items = []
+        for _ in range(rng.randint(1, 5)):
+            base = rng.randint(1, 3)
+            items.append(AllocationItem(base, base + rng.randint(0, 5), rng.choice([1.0, 2.0]) + rng.random() * 0.1))
+        assigned = allocate_people(items, people)
+        assert sum(assigned) <= people
+        assert all(p == 0 or item.base <= p <= item.need for item, p in zip(items, assigned)), (items, people, assigned)
+        assert _value(items, assigned) == pytest.approx(_value(items, _brute_force(items, people)), abs=1e-9)
+
+
+def test_people_needed_finishes_the_remaining_qty():
+    for qty in (1, 99, 100, 101, 2500, 9999):
+        need = people_needed(qty, 8, 125.0, 2, limit=40)
+        assert produced_qty(8, 125.0, need, 2) >= qty
+        assert need == 2 or produced_qty(8, 125.0, need - 1, 2) < qty
@@ -0,0 +1,46 @@
+import math
+from datetime import date, timedelta
+
+import numpy as np
+
+from agent.calibration import UphCalibration, planning_factors
+from agent.risk import DEFAULT_UPH_SIGMA, UphModel
+
+
+def test_calibrated_plan_converges_to_true_ratio():
+    """以校正過的 UPH 排程、回報實際產量，倍率收斂到真正的 實際 / 標準 UPH (而不是它的平方根)。"""
+    calibration = UphCalibration()
+    nameplate, true_ratio = 1000, 0.6
+    for day in range(40):
+        factor = calibration.factor('T304-包裝', min_samples=1)
+        schedule = [{"Day": "Day 1", "order_id": "PO1", "Raw_Product_Name": "T304", "plan_to": "T304-包裝",
+                     "Output": nameplate * factor, "UPH_Factor": factor}]
+        percent_rows = [{"order_id": "PO1", "Raw_Product_Name": "T304", "Product": "T304-包裝",
+                         "Planned_Output": nameplate * factor, "Actual_Output": nameplate * true_ratio}]
+        calibration.observe(percent_rows, schedule_id=f"s{day}", today=date(2026, 10, 1) + timedelta(days=day),
+                            factors=planning_factors(schedule))
+    assert abs(calibration.factor('T304-包裝') - true_ratio) < 0.01
+
+
+def test_uncalibrated_schedule_keeps_plain_ratio():
+    calibration = UphCalibration()
+    calibration.observe([{"order_id": "PO1", "Raw_Product_Name": "T304", "Product": "T304-包裝",
+                          "Planned_Output": 1000, "Actual_Output": 500}], schedule_id='s1')
+    assert calibration.processes['T304-包裝']['factor'] == round(0.7 * 1.0 + 0.3 * 0.5, 4)
+
+
+def test_risk_model_uses_accumulated_history():
+    """percent 工作表每次回報都清空；風險模擬的 UPH 分布來自校正檔累計的所有回報。"""
+    calibration = UphCalibration()
+    ratios = [0.5, 0.9, 0.7, 0.4, 1.0, 0.6]
+    for i, ratio in enumerate(ratios):
+        # 每次回報只有一列 (工作表清空後重寫)，各自屬於不同的排程
+        calibration.observe([{"order_id": "PO1", "Raw_Product_Name": "T304", "Product": "T304-包裝",
+                              "Planned_Output": 1000, "Actual_Output": 1000 * ratio}], schedule_id=f"s{i}")
+    model = UphModel.from_log_stats(calibration.log_ratio_stats())
+    mu, sigma = model.params['T304-包裝']
+    logs = np.log(ratios)
+    assert math.isclose(mu, logs.mean()) and math.isclose(sigma, logs.std(ddof=1))
+    assert sigma > DEFAULT_UPH_SIGMA
+    # 與直接由樣本建立的模型相同
+    assert np.allclose(UphModel({'T304-包裝': ratios}).params['T304-包裝'], (mu, sigma))
@@ -0,0 +1,34 @@
+import pytest
+
+import main
+from agent import snapshot
+from agent.graph import build_app
+from agent.memo import NODE_CACHE
+from agent.snapshot import STATE_SIZES
+
+
+@pytest.fixture
+def counted_sizes(monkeypatch):
+    """計算 state 大小被量了幾次 (每次都要序列化整個節點更新)。"""
+    calls = []
+    original = snapshot.payload_size
+    monkeypatch.setattr(snapshot, 'payload_size', lambda value: calls.append(1) or original(value))
+    STATE_SIZES.sizes.clear()
+    return calls
+
+
+@pytest.mark.parametrize("measure_sizes", [False, True])
+def test_state_sizes_measured_only_when_enabled(fake_llm, counted_sizes, measure_sizes):
+    app = build_app(node_cache=None, measure_sizes=measure_sizes)
+    app.invoke({"orders": [{"order_id": "PO1", "product": "T304", "qty": 1000, "qty_remaining": 1000,
+                            "due_date": "", "is_rush": False}], "rush_orders": [], "logs": []})
+    assert bool(counted_sizes) is measure_sizes
+    assert bool(STATE_SIZES.sizes) is measure_sizes
+
+
+@pytest.mark.parametrize("diagnostics", [False, True])
+def test_diagnostics_printed_only_when_requested(capsys, diagnostics):
+    main.show_result({"logs": []}, None, interactive=False, diagnostics=diagnostics)
+    output = capsys.readouterr().out
+    assert (STATE_SIZES.report() in output) is diagnostics
+    assert (NODE_CACHE.report() in output) is diagnostics
@@ -0,0 +1,94 @@
+from agent.order_book import OrderBook
+from agent.progress import compute_progress
+
+
+def _total_remaining(book: OrderBook, product: str) -> int:
+    return book.product_totals(product)[1] + book.product_totals(product, rush=True)[1]
+
+
+def test_convert_to_rush_keeps_leftover_of_partial_order():
+    book = OrderBook([
+        {"order_id": "A2", "product": "T304", "qty": 3000, "qty_remaining": 3000, "due_date": "2026-01-05"},
+        {"order_id": "A1", "product": "T304", "qty": 5000, "qty_remaining": 5000, "due_date": "2026-01-10"},
+    ], [])
+
+    converted = book.convert_to_rush("T304", 1000)
+
+    assert [(r['order_id'], r['qty_remaining']) for r in converted] == [("A2", 1000)]
+    assert book.find("A2", "T304")['qty_remaining'] == 2000
+    assert book.find("A1", "T304")['qty_remaining'] == 5000
+    assert _total_remaining(book, "T304") == 8000
+
+
+def test_convert_to_rush_conserves_quantity():
+    for qty in (1, 2999, 3000, 3001, 7999, 8000):
+        book = OrderBook([
+            {"order_id": "A2", "product": "T304", "qty": 3000, "qty_remaining": 3000, "due_date": "2026-01-05"},
+            {"order_id": "A1", "product": "T304", "qty": 5000, "qty_remaining": 5000, "due_date": "2026-01-10"},
+            {"order_id": "B1", "product": "L502", "qty": 100, "qty_remaining": 100, "due_date": ""},
+        ], [])
+        book.convert_to_rush("T304", qty)
+        assert _total_remaining(book, "T304") == 8000, qty
+        assert book.product_totals("T304", rush=True)[1] == qty
+        assert _total_remaining(book, "L502") == 100
+
+
+def test_convert_to_rush_without_remaining_leaves_orders_once():
+    book = OrderBook([{"order_id": "A1", "product": "T304", "qty": 5000, "qty_remaining": 0, "due_date": ""}], [])
+
+    assert book.convert_to_rush("T304", 1000) == []
+    assert len(book.find_all_by_product("T304")) == 1
+
+
+def _single_order_book():
+    return OrderBook([{"order_id": "A1", "product": "T304", "qty": 1000, "qty_remaining": 1000, "due_date": "2026-01-10"}], [])
+
+
+def test_repeat_conversion_adds_to_existing_rush():
+    book = _single_order_book()
+    book.convert_to_rush("T304", 500)
+    book.convert_to_rush("T304", 300)
+
+    normal, rush = book.find("A1", "T304"), book.find("A1", "T304", rush=True)
+    assert (normal['qty'], normal['qty_remaining']) == (200, 200)
+    assert (rush['qty'], rush['qty_remaining']) == (800, 800)
+    assert _total_remaining(book, "T304") == 1000
+
+
+def test_new_sheet_row_for_rush_order_merges_into_rush():
+    book = _single_order_book()
+    book.convert_to_rush("T304", 1000)
+    book.merge_new_orders([{"order_id": "A1", "product": "T304", "qty": 200, "due_date": "2026-01-10"}], "2026-01-01")
+
+    assert book.count() == 0
+    assert book.find("A1", "T304", rush=True)['qty_remaining'] == 1200
+
+
+def _schedule(*outputs):
+    return [{"Day": f"Day {day}", "order_id": "A1", "Product": "T304-包裝", "Raw_Product_Name": "T304", "Output": output}
+            for day, output in enumerate(outputs, start=1)]
+
+
+def test_progress_after_partial_conversion_counts_only_normal_part():
+    book = _single_order_book()
+    book.convert_to_rush("T304", 500)
+
+    progress = compute_progress(_schedule(300), book.orders, 1)['progress']
+    # 轉急單不是生產：常規部分的實作量仍是 0
+    assert progress.loc[0, 'total_qty'] == 500 and progress.loc[0, 'actual_output'] == 0
+
+    # 什麼都沒做 (落後)：急單佇列換成落後訂單，數量仍是 1000
+    lagging = book.apply_progress(progress.to_dict('records'), {})
+    assert lagging and book.count() == 0
+    assert _total_remaining(book, "T304") == 1000
+
+
+def test_progress_output_is_applied_to_rush_part_first():
+    book = _single_order_book()
+    book.convert_to_rush("T304", 500)
+
+    progress = compute_progress(_schedule(600), book.orders, 1)['progress']
+    assert book.apply_progress(progress.to_dict('records'), {"A1|T304": 600}) == []
+    assert book.find("A1", "T304", rush=True) is None
+    assert book.find("A1", "T304")['qty_remaining'] == 400
+    assert _total_remaining(book, "T304") == 400
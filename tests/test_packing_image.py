@@ -0,0 +1,94 @@
+import json
+
+import pytest
+from PIL import Image
+
+import main
+from agent import packing_image
+from agent.packing_image import PackingImageCache, load_orders_from_images
+from memory_db import InMemoryDB
+
+
+class _Reply:
+    def __init__(self, content: str):
+        self.content = content
+
+
+class StubVisionModel:
+    """假的圖片辨識模型：每張圖片回傳一筆訂單，order_id 記錄是第幾次呼叫的第幾張圖。"""
+
+    def __init__(self):
+        self.batches = []
+
+    def invoke(self, messages):
+        images = [part for part in messages[0].content if part.get('type') == 'image_url']
+        self.batches.append(len(images))
+        call = len(self.batches)
+        sheets = [{"image": i, "rows": [{"order_id": f"C{call}-{i}", "priority": "normal", "product_name": "T304",
+                                         "quantity": "1,200 PCS", "pending": ""}]}
+                  for i in range(1, len(images) + 1)]
+        return _Reply("```json\n" + json.dumps({"sheets": sheets}) + "\n```")
+
+
+@pytest.fixture
+def images(tmp_path):
+    """內容各不相同的 Packing Sheet 圖片。"""
+    def make(count, start=0):
+        paths = []
+        for i in range(start, start + count):
+            path = tmp_path / f"sheet{i}.png"
+            Image.new('RGB', (40, 30), color=(i * 20 % 256, 100, 150)).save(path)
+            paths.append(str(path))
+        return paths
+    return make
+
+
+def test_images_are_batched_and_cached(images, tmp_path):
+    cache = PackingImageCache(str(tmp_path / 'cache.json'))
+    model = StubVisionModel()
+    paths = images(6)
+    orders, ingested = load_orders_from_images(model, paths, cache)
+    # BATCH_SIZE 張一次呼叫
+    assert model.batches == [packing_image.BATCH_SIZE, 6 - packing_image.BATCH_SIZE]
+    assert len(orders) == 6 and len(ingested) == 6
+    assert orders[0]['qty'] == 1200
+
+    # 重新載入快取檔 (新行程)：還沒標記匯入的圖片直接用快取結果，不再呼叫模型
+    cache = PackingImageCache(str(tmp_path / 'cache.json'))
+    again, _ = load_orders_from_images(model, paths[:2] + images(1, start=6), cache)
+    assert model.batches == [packing_image.BATCH_SIZE, 6 - packing_image.BATCH_SIZE, 1]
+    assert [o['order_id'] for o in again] == ['C1-1', 'C1-2', 'C3-1']
+
+
+def test_ingested_images_are_skipped(images, tmp_path):
+    cache = PackingImageCache(str(tmp_path / 'cache.json'))
+    model = StubVisionModel()
+    first, second = images(2)
+    # 同一張圖片在同一批出現兩次只匯入一次
+    orders, ingested = load_orders_from_images(model, [first, first, second], cache)
+    assert model.batches == [2]
+    assert len(orders) == 2 and len(ingested) == 2
+
+    cache.mark_ingested(ingested[:1])
+    orders, ingested = load_orders_from_images(model, [first, second], cache)
+    assert model.batches == [2]
+    assert [o['order_id'] for o in orders] == ['C1-2'] and len(ingested) == 1
+
+
+class _FailingDB:
+    def save_run_result(self, result):
+        raise OSError("sheet unavailable")
+
+
+@pytest.mark.parametrize("db_factory, marked", [(InMemoryDB, True), (_FailingDB, False)])
+def test_images_marked_ingested_only_after_orders_are_saved(monkeypatch, db_factory, marked):
+    cache = PackingImageCache(None)
+    cache.put('abc', [])
+    monkeypatch.setattr(packing_image, 'IMAGE_CACHE', cache)
+    result = {
+        "schedule_result": [{"Day": "Day 1", "order_id": "PO1", "Product": "T304-包裝", "Output": 100, "Status": "完工",
+                             "Headcount": 2, "Idle_People": 0, "Raw_Product_Name": "T304", "plan_to": "T304-包裝"}],
+        "schedule_summary": "排程完成。", "orders": [], "rush_orders": [], "ingested_images": ['abc'],
+    }
+    main.finish_run(result, db_factory(), 'test-thread', interactive=False)
+    assert cache.get('abc')['ingested'] is marked
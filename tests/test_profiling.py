@@ -0,0 +1,17 @@
+import threading
+
+from agent.profiling import PipelineProfiler
+
+
+def test_node_in_worker_thread_while_profiling():
+    """worker 執行緒的節點在主 profiler 執行中也能跑 (Python 3.12+ 不能同時啟用第二個 cProfile)。"""
+    profiler = PipelineProfiler(interval=0.001)
+    node = profiler.wrap_node('busy', lambda state: {"total": sum(range(state['n']))})
+    results = []
+    with profiler.profile():
+        worker = threading.Thread(target=lambda: results.append(node({"n": 10000})))
+        worker.start()
+        worker.join()
+    assert results == [{"total": sum(range(10000))}]
+    assert [name for kind, name, _, _ in profiler.timings] == ['busy']
+    assert profiler.stats().total_calls > 0
@@ -0,0 +1,91 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from agent.graph import build_app
+from memory_db import InMemoryDB
+from scheduler_service import SchedulingService, make_server
+
+
+@pytest.fixture
+def server(fake_llm):
+    db = InMemoryDB()
+    service = SchedulingService(db, app=build_app(node_cache=None))
+    httpd = make_server(service, '127.0.0.1', 0)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    port = httpd.server_address[1]
+
+    def call(method, path, body=None):
+        data = json.dumps(body).encode('utf-8') if body is not None else None
+        request = urllib.request.Request(f'http://127.0.0.1:{port}{path}', data=data, method=method,
+                                         headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, json.loads(e.read())
+
+    yield call, db, service
+    httpd.shutdown()
+    httpd.server_close()
+    service.close()
+
+
+def test_service_round_trip(server):
+    call, db, service = server
+    assert call('GET', '/health') == (200, {"status": "ok"})
+
+    status, body = call('POST', '/orders', {"orders": [
+        {"order_id": "PO1", "product": "T304", "qty": "20000", "due_date": "2026-11-01"},
+        {"order_id": "PO2", "product": "L502", "qty": 8000, "due_date": "2026/10/30"},
+    ]})
+    assert status == 200 and body['rescheduled']
+    assert body['orders'] == 2 and body['tasks'] > 0
+    order = service.order_book.find("PO1", "T304")
+    assert order['qty'] == 20000 and isinstance(order['qty'], int)
+    # 排程結果與訂單寫回 (記憶體) 資料庫
+    assert db.load_schedule_results() and len(db.load_orders()) == 2
+
+    status, body = call('POST', '/rush', {"product": "T304", "qty": 3000, "mode": "convert"})
+    assert status == 200 and body['rush_orders'] == 1
+
+    status, body = call('GET', '/schedule?detail=1&format=spans')
+    assert status == 200 and body['schedule']['format'] == 'spans-v1'
+
+    # 之後的重排不會因為先前的字串數量而失敗
+    status, body = call('POST', '/orders', {"orders": [{"order_id": "PO3", "product": "T304", "qty": 500}]})
+    assert status == 200 and body['orders'] == 3
+
+
+def test_invalid_quantity_is_rejected(server):
+    call, _, service = server
+    status, body = call('POST', '/orders', {"orders": [{"order_id": "X", "product": "T304", "qty": "fifty"}]})
+    assert status == 400 and 'error' in body
+    assert len(service.order_book) == 0
+
+    status, body = call('POST', '/rush', {"product": "NOPE", "qty": 10, "mode": "convert"})
+    assert status == 400
+
+
+def test_build_jobs_puts_rush_orders_first(fake_llm):
+    from agent import nodes
+    from agent.inventory import Inventory
+
+    inventory = Inventory({"T304-包裝": {"uph": 100, "headcount": 2}, "L502-包裝": {"uph": 50, "headcount": 1}})
+    jobs, unknown = nodes.build_jobs(
+        [{"order_id": "A1", "product": "L502", "qty": 100, "qty_remaining": 100, "due_date": "2026-01-01"}],
+        [{"order_id": "R1", "product": "T304", "qty": 50, "qty_remaining": 50, "due_date": "2026-02-01", "is_rush": True},
+         {"order_id": "R2", "product": "X999", "qty": 10, "qty_remaining": 10, "due_date": "", "is_rush": True}],
+        inventory)
+
+    assert [job['order_id'] for job in jobs] == ["R1", "A1"]
+    assert unknown == ["X999"]
+    # 匹配結果留在快取：交期試算沿用，不必再呼叫 LLM
+    known = nodes.known_matches()
+    assert known["T304"] == ["T304-包裝"] and fake_llm.calls == 1
+    known.clear()
+    assert nodes.known_matches()["L502"] == ["L502-包裝"]
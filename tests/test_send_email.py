@@ -0,0 +1,117 @@
+import email
+import email.policy
+import socketserver
+import threading
+
+import pytest
+
+from agent import send_email
+from agent.send_email import EmailOutbox
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """只實作 EmailOutbox 會用到的指令 (EHLO / MAIL / RCPT / DATA / QUIT)。"""
+
+    def reply(self, line: str):
+        self.wfile.write(f"{line}\r\n".encode('ascii'))
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply("220 localhost test SMTP")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('ascii', 'replace').strip().split(' ', 1)[0].upper()
+            if command in ('EHLO', 'HELO'):
+                self.reply("250 localhost")
+            elif command == 'DATA':
+                self.reply("354 end with .")
+                data = []
+                while True:
+                    chunk = self.rfile.readline()
+                    if chunk in (b".\r\n", b""):
+                        break
+                    data.append(chunk[1:] if chunk.startswith(b"..") else chunk)
+                self.server.messages.append(email.message_from_bytes(b"".join(data), policy=email.policy.default))
+                self.reply("250 queued")
+            elif command == 'QUIT':
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("250 OK")
+
+
+@pytest.fixture
+def smtp_server():
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), _SMTPHandler)
+    server.daemon_threads = True
+    server.connections = 0
+    server.messages = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _outbox(server, **kwargs) -> EmailOutbox:
+    host, port = server.server_address
+    return EmailOutbox('agent@example.com', 'ops@example.com', host=host, port=port, use_ssl=False, **kwargs)
+
+
+def test_alerts_within_window_are_batched(smtp_server):
+    outbox = _outbox(smtp_server, batch_window=1.0)
+    for i in range(3):
+        assert outbox.send(f"訂單 PO{i} 落後", f"落後 {i} 天")
+    assert outbox.flush(timeout=10)
+    assert len(smtp_server.messages) == 1
+    message = smtp_server.messages[0]
+    assert message['Subject'] == "🏭 MINLEE_AGENT: 通知摘要 (3 則)"
+    body = message.get_body().get_content()
+    assert all(f"訂單 PO{i} 落後" in body for i in range(3))
+
+    # 下一封沿用同一條 SMTP 連線
+    outbox.send("排程完成", "OK")
+    assert outbox.flush(timeout=10)
+    outbox.close()
+    assert smtp_server.messages[1]['Subject'] == "🏭 MINLEE_AGENT: 排程完成"
+    assert outbox.connections == smtp_server.connections == 1
+    assert (outbox.sent_messages, outbox.sent_alerts, outbox.failed_alerts) == (2, 4, 0)
+
+
+def test_batches_are_capped_by_max_batch(smtp_server):
+    outbox = _outbox(smtp_server, batch_window=1.0, max_batch=2)
+    for i in range(5):
+        outbox.send(f"通知 {i}", "")
+    outbox.close()
+    assert [m['Subject'] for m in smtp_server.messages] == [
+        "🏭 MINLEE_AGENT: 通知摘要 (2 則)", "🏭 MINLEE_AGENT: 通知摘要 (2 則)", "🏭 MINLEE_AGENT: 通知 4"]
+    assert outbox.sent_alerts == 5
+
+
+def test_closed_outbox_rejects_alerts(smtp_server):
+    outbox = _outbox(smtp_server, batch_window=0)
+    outbox.close()
+    assert not outbox.send("太晚了", "")
+    assert smtp_server.messages == []
+
+
+def test_missing_email_config_is_reported_once(monkeypatch, capsys):
+    # 測試的 config.ini 沒有 [EMAIL] 區段
+    monkeypatch.setattr(send_email, '_config_stamp', send_email._NOT_LOADED)
+    monkeypatch.setattr(send_email, '_outbox', None)
+
+    assert not send_email.send_alert("a", "") and not send_email.send_alert("b", "")
+    assert capsys.readouterr().out.count("缺少 [EMAIL] 區段") == 1
+
+    # 修改 config.ini 後重新讀取
+    with open('config.ini', 'r', encoding='utf-8') as f:
+        original = f.read()
+    try:
+        with open('config.ini', 'a', encoding='utf-8') as f:
+            f.write("\n[EMAIL]\nSENDER = agent@example.com\n")
+        assert send_email.load_email_config() is None
+        assert "缺少欄位 RECEIVER" in capsys.readouterr().out
+    finally:
+        with open('config.ini', 'w', encoding='utf-8') as f:
+            f.write(original)
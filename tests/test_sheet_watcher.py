@@ -0,0 +1,100 @@
+import pytest
+
+from agent.graph import build_app
+from memory_db import InMemoryDB
+from scheduler_service import SchedulingService
+from sheet_watcher import PackingSheetWatcher
+
+
+class FailingApp:
+    """每次執行流程圖都失敗 (例如 LLM / Sheets 暫時無法連線)。"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, state, config=None):
+        self.calls += 1
+        raise RuntimeError("graph failed")
+
+
+@pytest.fixture
+def failing_service():
+    db = InMemoryDB()
+    service = SchedulingService(db, app=FailingApp())
+    yield db, service
+    service.close()
+
+
+def test_failed_reschedule_does_not_merge_pending_orders_twice(failing_service):
+    db, service = failing_service
+    db.append_sheet_rows([{"order_id": "W1", "product": "T304", "qty": 100, "due_date": ""}])
+    watcher = PackingSheetWatcher(service, db, debounce=0, max_wait=0)
+
+    for tick in range(3):
+        with pytest.raises(RuntimeError):
+            watcher.tick(now=float(tick))
+        # 重排失敗：訂單簿不變，訂單仍在待排程清單中，high-water mark 不前進
+        assert service.order_book.find("W1", "T304") is None
+        assert len(watcher._pending_orders) == 1
+        assert watcher.high_water_mark == 0
+    assert service.app.calls == 3
+
+
+def test_failed_rush_insert_rolls_back(failing_service):
+    _, service = failing_service
+    service.order_book.add({"order_id": "A1", "product": "T304", "qty": 5000, "qty_remaining": 5000, "due_date": ""})
+
+    with pytest.raises(RuntimeError):
+        service.insert_rush("T304", 1000, "convert", None)
+
+    assert service.order_book.count(rush=True) == 0
+    assert service.order_book.find("A1", "T304")['qty_remaining'] == 5000
+
+
+class FlakyMarkDB(InMemoryDB):
+    """第一次標記「已排程」失敗 (例如 Sheets 寫入逾時)。"""
+
+    def __init__(self):
+        super().__init__()
+        self.mark_calls = 0
+
+    def mark_rows_scheduled(self, rows):
+        self.mark_calls += 1
+        if self.mark_calls == 1:
+            raise OSError("sheet write timed out")
+        return super().mark_rows_scheduled(rows)
+
+
+def test_failed_mark_retries_without_resubmitting_orders(fake_llm):
+    db = FlakyMarkDB()
+    service = SchedulingService(db, app=build_app(node_cache=None))
+    try:
+        db.append_sheet_rows([{"order_id": "W1", "product": "T304", "qty": 100, "due_date": ""}])
+        watcher = PackingSheetWatcher(service, db, debounce=0, max_wait=0)
+
+        with pytest.raises(OSError):
+            watcher.tick(now=0.0)
+        assert service.order_book.find("W1", "T304")['qty'] == 100
+        assert watcher._pending_orders == [] and watcher.high_water_mark == 0
+
+        # 下一次只重試標記與 high-water mark，訂單不會再合併一次
+        assert watcher.tick(now=1.0) is None
+        assert service.order_book.find("W1", "T304")['qty'] == 100
+        assert db.mark_calls == 2 and watcher.high_water_mark == 2 and db.scheduled_rows == {2}
+        assert db.load_system_data()["packing_sheet_hwm"] == 2
+    finally:
+        service.close()
+
+
+def test_failed_reschedule_after_progress_report_rolls_back(failing_service):
+    _, service = failing_service
+    service.order_book.add({"order_id": "A1", "product": "T304", "qty": 5000, "qty_remaining": 5000, "due_date": ""})
+    service.last_schedule_results = [{"Day": "Day 1", "order_id": "A1", "Product": "T304-包裝",
+                                      "Raw_Product_Name": "T304", "Output": 2000}]
+
+    # 只做了 500 (落後)：轉急單並重排，重排失敗時訂單簿回到回報前
+    with pytest.raises(RuntimeError):
+        service.post_actuals(1, [{"order_id": "A1", "product": "T304", "process": "T304-包裝", "actual": 500}])
+
+    assert service.order_book.count(rush=True) == 0
+    assert service.order_book.find("A1", "T304")['qty_remaining'] == 5000
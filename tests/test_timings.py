@@ -0,0 +1,48 @@
+from types import SimpleNamespace
+
+import main
+from agent.checkpoint import run_graph
+from agent.timings import NODE_TIMINGS, timed_node
+from memory_db import InMemoryDB
+from scheduler_service import SchedulingService
+
+
+class _OneNodeApp:
+    """只有一個節點的假流程圖 (get_state 回傳尚有待執行節點)。"""
+
+    def __init__(self, name):
+        self.node = timed_node(name, lambda state: {"done": True})
+
+    def invoke(self, state, config):
+        return self.node(state or {})
+
+    def get_state(self, config):
+        return SimpleNamespace(values={"orders": []}, next=('calculate_schedule',))
+
+
+def _timed_nodes():
+    return [row[0] for row in NODE_TIMINGS.rows()]
+
+
+def test_checkpoint_helpers_leave_timings_alone():
+    NODE_TIMINGS.reset()
+    run_graph(_OneNodeApp('first'), {}, 'run-1')
+    run_graph(_OneNodeApp('second'), {}, 'run-2')
+    assert _timed_nodes() == ['first', 'second']
+
+
+def test_menu_run_reports_only_its_own_nodes():
+    main.run_schedule(_OneNodeApp('first'), {}, 'orders', None)
+    assert _timed_nodes() == ['first']
+    main.run_schedule(_OneNodeApp('second'), {}, 'orders', None)
+    assert _timed_nodes() == ['second']
+
+
+def test_service_reschedule_reports_only_its_own_nodes():
+    NODE_TIMINGS.record('stale', 0.0, 1.0)
+    service = SchedulingService(InMemoryDB(), app=_OneNodeApp('service'))
+    try:
+        service.submit(service._reschedule, 'test')
+    finally:
+        service.close()
+    assert _timed_nodes() == ['service']